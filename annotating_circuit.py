@@ -1,19 +1,41 @@
 import simpy
+from collections import deque
+from heapq import heappush, heappop
+from itertools import count
 from autocomm_v1.autocomm import full_autocomm
 from autocomm_v1.final_circuit import auto_to_circ
+from utils.qubit_node_map import QubitNodeMap
+from utils.event_sink import NullSink, RingBufferSink
+from qubit_partition import interaction_csr, capacity_membership, remote_gate_count
 
 # Define delay times
 SINGLE_QUBIT_GATE_DELAY = 1
 TWO_QUBIT_GATE_DELAY = 10
 ENTANGLEMENT_DELAY = 100
 
+# Gate dependency DAG of a circuit: a gate depends on the previous gate on each of its logical qubits.
+# RETURNS: in-degree of each gate, successors of each gate (in gate order)
+def gate_dependencies(gates):
+    in_degree = [0] * len(gates)
+    successors = [[] for _ in gates]
+    last_gate = {}  # logical qubit -> index of the last gate on it
+    for index, gate in enumerate(gates):
+        predecessors = set(last_gate[q] for q in gate['qubits'] if q in last_gate)
+        for predecessor in predecessors:
+            successors[predecessor].append(index)
+        in_degree[index] = len(predecessors)
+        for q in gate['qubits']:
+            last_gate[q] = index
+    return in_degree, successors
+
 class QuantumGate:
-    def __init__(self, gate_type, qubits, qpus_involved, circuit, initiating_qpu):
+    def __init__(self, gate_type, qubits, qpus_involved, circuit, initiating_qpu, index):
         self.gate_type = gate_type
         self.qubits = qubits
         self.qpus_involved = qpus_involved  # List of involved QPUs
         self.circuit = circuit
         self.initiating_qpu = initiating_qpu  # QPU that initiates the execution of the gate
+        self.index = index  # Position of the gate in the circuit
 
     def is_remote(self):
         return len(self.qpus_involved) > 1
@@ -25,28 +47,23 @@ class Circuit:
         self.gates = gates
         self.qpus = qpus
         self.scheduler = scheduler
+        self.sink = scheduler.sink
         self.completion_event = env.event()
         self.remaining_gates = len(gates)
+        # Gates are dispatched once all their predecessors are done
+        self.pending_predecessors, self.successors = gate_dependencies(gates)
         self.logical_to_physical = {}  # Mapping from logical qubits to physical qubits
         self.action = env.process(self.run())
 
     def run(self):
-        # Output the logical-to-physical qubit mapping
-        print(f"Time {self.env.now}: Circuit {self.circuit_id}'s logical-to-physical qubit mapping:")
-        for logical_qubit, (qpu_id, physical_qubit) in self.logical_to_physical.items():
-            print(f"  Logical qubit {logical_qubit} -> QPU {qpu_id}, physical qubit {physical_qubit}")
-        # Map gates to the corresponding QPU
-        for gate in self.gates:
-            qpus_involved = set()
-            for logical_qubit in gate['qubits']:
-                qpu_id, _ = self.logical_to_physical[logical_qubit]
-                qpus_involved.add(qpu_id)
-            qpus_involved = list(qpus_involved)
-            initiating_qpu_id = qpus_involved[0]
-            initiating_qpu = self.qpus[initiating_qpu_id]
-            gate_obj = QuantumGate(gate['type'], gate['qubits'], qpus_involved, self, initiating_qpu)
-            # Only place the gate in the initiating QPU's queue
-            initiating_qpu.gate_queue.put(gate_obj)
+        # Record the logical-to-physical qubit mapping
+        if self.sink.enabled:
+            for logical_qubit, (qpu_id, physical_qubit) in self.logical_to_physical.items():
+                self.sink.record(self.env.now, "qubit_mapped", qpu_id, self.circuit_id, (logical_qubit, physical_qubit))
+        # Dispatch the gates without predecessors, the others follow in gate_done
+        for index, pending in enumerate(self.pending_predecessors):
+            if pending == 0:
+                self.dispatch(index)
         # Wait for the circuit to complete execution
         yield self.completion_event
         # Release physical qubit resources
@@ -54,16 +71,36 @@ class Circuit:
         self.scheduler.active_circuits.remove(self)
         # Activate scheduler to execute the next circuit
         yield self.env.process(self.scheduler.run())
-        print(f"Time {self.env.now}: Scheduler detected that circuit {self.circuit_id} has completed, activating the next circuit")
-
-    def gate_done(self):
+        if self.sink.enabled:
+            self.sink.record(self.env.now, "circuit_end", circuit=self.circuit_id)
+
+    def dispatch(self, index):
+        # Map the gate to the corresponding QPU
+        gate = self.gates[index]
+        qpus_involved = set()
+        for logical_qubit in gate['qubits']:
+            qpu_id, _ = self.logical_to_physical[logical_qubit]
+            qpus_involved.add(qpu_id)
+        qpus_involved = list(qpus_involved)
+        initiating_qpu_id = qpus_involved[0]
+        initiating_qpu = self.qpus[initiating_qpu_id]
+        gate_obj = QuantumGate(gate['type'], gate['qubits'], qpus_involved, self, initiating_qpu, index)
+        # Only place the gate in the initiating QPU's queue
+        initiating_qpu.gate_queue.put(gate_obj)
+
+    def gate_done(self, gate):
         self.remaining_gates -= 1
+        for successor in self.successors[gate.index]:
+            self.pending_predecessors[successor] -= 1
+            if self.pending_predecessors[successor] == 0:
+                self.dispatch(successor)
         if self.remaining_gates == 0:
             self.completion_event.succeed()
 
 class QPU:
-    def __init__(self, env, qpu_id, num_computing_qubits, num_communication_qubits):
+    def __init__(self, env, qpu_id, num_computing_qubits, num_communication_qubits, sink=None):
         self.env = env
+        self.sink = sink if sink is not None else NullSink()
         self.qpu_id = qpu_id
         self.num_computing_qubits = num_computing_qubits
         self.num_communication_qubits = num_communication_qubits
@@ -97,7 +134,7 @@ class QPU:
                 # Local two-qubit gate
                 yield self.env.process(self.execute_local_two_qubit_gate(gate))
         # Notify the circuit that the gate is done
-        gate.circuit.gate_done()
+        gate.circuit.gate_done(gate)
 
     def execute_single_qubit_gate(self, gate):
         logical_qubit = gate.qubits[0]
@@ -106,9 +143,11 @@ class QPU:
         assert qpu_id == self.qpu_id, "QPU for the single-qubit gate does not match the QPU where the logical qubit is located"
         with self.qubits[physical_qubit].request() as req:
             yield req
-            print(f"Time {self.env.now}: QPU {self.qpu_id} starts executing single-qubit gate {gate.gate_type} on logical qubit {logical_qubit} (physical qubit {physical_qubit}) in circuit {circuit.circuit_id}")
+            if self.sink.enabled:
+                self.sink.record(self.env.now, "single_qubit_gate_start", self.qpu_id, circuit.circuit_id, gate.qubits, gate.gate_type)
             yield self.env.timeout(SINGLE_QUBIT_GATE_DELAY)
-            print(f"Time {self.env.now}: QPU {self.qpu_id} completes single-qubit gate {gate.gate_type} (circuit {circuit.circuit_id}, logical qubit {logical_qubit})")
+            if self.sink.enabled:
+                self.sink.record(self.env.now, "single_qubit_gate_end", self.qpu_id, circuit.circuit_id, gate.qubits, gate.gate_type)
 
     def execute_local_two_qubit_gate(self, gate):
         circuit = gate.circuit
@@ -118,9 +157,11 @@ class QPU:
         assert qpu_id1 == self.qpu_id == qpu_id2, "QPU for the local two-qubit gate does not match the QPU where the logical qubits are located"
         with self.qubits[physical_qubit1].request() as req1, self.qubits[physical_qubit2].request() as req2:
             yield req1 & req2
-            print(f"Time {self.env.now}: QPU {self.qpu_id} starts executing local two-qubit gate {gate.gate_type} on logical qubits {logical_qubit1}, {logical_qubit2} in circuit {circuit.circuit_id}")
+            if self.sink.enabled:
+                self.sink.record(self.env.now, "local_gate_start", self.qpu_id, circuit.circuit_id, gate.qubits, gate.gate_type)
             yield self.env.timeout(TWO_QUBIT_GATE_DELAY)
-            print(f"Time {self.env.now}: QPU {self.qpu_id} completes local two-qubit gate {gate.gate_type} (circuit {circuit.circuit_id})")
+            if self.sink.enabled:
+                self.sink.record(self.env.now, "local_gate_end", self.qpu_id, circuit.circuit_id, gate.qubits, gate.gate_type)
 
     def execute_remote_gate(self, gate):
         circuit = gate.circuit
@@ -145,9 +186,11 @@ class QPU:
         # Wait for all QPUs to be ready
         yield simpy.events.AllOf(self.env, entanglement_events)
         # Execute the remote gate
-        print(f"Time {self.env.now}: QPU {self.qpu_id} executes remote gate {gate.gate_type} in circuit {circuit.circuit_id}, involving logical qubits {local_logical_qubits}")
+        if self.sink.enabled:
+            self.sink.record(self.env.now, "remote_gate_start", self.qpu_id, circuit.circuit_id, local_logical_qubits, gate.gate_type)
         yield self.env.timeout(TWO_QUBIT_GATE_DELAY)
-        print(f"Time {self.env.now}: QPU {self.qpu_id} completes remote gate {gate.gate_type}")
+        if self.sink.enabled:
+            self.sink.record(self.env.now, "remote_gate_end", self.qpu_id, circuit.circuit_id, local_logical_qubits, gate.gate_type)
         # Release resources
         for req in data_qubit_requests:
             req.resource.release(req)
@@ -165,12 +208,14 @@ class QPU:
         comm_qubit_id, comm_qubit_request = yield self.env.process(self.get_available_comm_qubit())
         # Wait for entanglement delay
         yield self.env.timeout(ENTANGLEMENT_DELAY)
-        print(f"Time {self.env.now}: QPU {self.qpu_id} is ready to execute remote gate {gate.gate_type} with QPU {initiating_qpu.qpu_id} (circuit {circuit.circuit_id})")
+        if self.sink.enabled:
+            self.sink.record(self.env.now, "remote_participant_start", self.qpu_id, circuit.circuit_id, local_logical_qubits, gate.gate_type)
         # Notify the initiating QPU that it is ready
         entanglement_event.succeed()
         # Wait for the remote gate to complete
         yield self.env.timeout(TWO_QUBIT_GATE_DELAY)
-        print(f"Time {self.env.now}: QPU {self.qpu_id} completes remote gate {gate.gate_type}")
+        if self.sink.enabled:
+            self.sink.record(self.env.now, "remote_participant_end", self.qpu_id, circuit.circuit_id, local_logical_qubits, gate.gate_type)
         # Release resources
         for req in data_qubit_requests:
             req.resource.release(req)
@@ -197,16 +242,100 @@ class QPU:
         # Release the communication qubit resource
         request.resource.release(request)
 
-class Scheduler:
-    def __init__(self, env, qpus, circuits):
+# Physical qubit bookkeeping shared by the simpy Scheduler and HeapSimulator. Subclasses provide self.qpus
+# (qpu_id -> QPU, in allocation order) and computing_qubit_ids(qpu_id).
+# Free physical qubits are kept in a stack per QPU with a running total, so allocating or releasing a qubit is O(1),
+# and the logical qubit count of a queued circuit is computed once, however many rounds it waits.
+# allocation: "first_fit" fills the QPUs in order; "partition" splits the circuit's interaction graph over the free
+# capacity of the QPUs (qubit_partition.capacity_membership), but first fit is kept unless the split cuts fewer
+# gates, as when the free qubits are fragmented over many QPUs. It records the remote two qubit gates of each circuit
+# in remote_gate_counts {circuit_id: count}.
+ALLOCATION_MODES = ("first_fit", "partition")
+
+class QubitAllocator:
+    def init_allocation(self, allocation="first_fit"):
+        if allocation not in ALLOCATION_MODES:
+            raise ValueError(f"unknown allocation mode {allocation!r}, expected one of {ALLOCATION_MODES}")
+        self.allocation = allocation
+        self.remote_gate_counts = {}
+        self.qubit_allocation = {}  # {QPU_ID: set(physical_qubit_ID)}
+        self.free_qubits = {}  # {QPU_ID: [free physical_qubit_ID]}, lowest ID on top
+        for qpu_id in self.qpus:
+            self.qubit_allocation[qpu_id] = set()
+            self.free_qubits[qpu_id] = sorted(self.computing_qubit_ids(qpu_id), reverse=True)
+        self.free_qubit_count = sum(len(free) for free in self.free_qubits.values())
+        self._logical_qubit_counts = {}  # id(circuit gates) -> (circuit gates, logical qubit count)
+
+    def computing_qubit_ids(self, qpu_id):
+        raise NotImplementedError
+
+    def logical_qubit_count(self, circuit_gates):
+        cached = self._logical_qubit_counts.get(id(circuit_gates))
+        if cached is None or cached[0] is not circuit_gates:
+            cached = (circuit_gates, max((qubit for gate in circuit_gates for qubit in gate['qubits']), default=-1) + 1)
+            self._logical_qubit_counts[id(circuit_gates)] = cached
+        return cached[1]
+
+    def has_enough_qubits(self, circuit_gates):
+        return self.logical_qubit_count(circuit_gates) <= self.free_qubit_count
+
+    def first_fit_qpus(self, num_logical_qubits):
+        # QPU of each logical qubit, filling the QPUs in order with as many as they have free physical qubits
+        qpus = []
+        for qpu_id, free in self.free_qubits.items():
+            qpus.extend([qpu_id] * min(len(free), num_logical_qubits - len(qpus)))
+        return qpus
+
+    def partition_qpus(self, circuit_gates, num_logical_qubits):
+        # QPU of each logical qubit from the circuit's interaction graph, and the remote gates of that placement
+        two_qubit_gates = [gate['qubits'] for gate in circuit_gates if len(gate['qubits']) == 2]
+        xadj, adjncy, eweights = interaction_csr([q[0] for q in two_qubit_gates], [q[1] for q in two_qubit_gates],
+                                                 num_logical_qubits)
+        qpu_ids = list(self.free_qubits)
+        first_fit = self.first_fit_qpus(num_logical_qubits)
+        qpu_index = {qpu_id: index for index, qpu_id in enumerate(qpu_ids)}
+        first_fit_remote = remote_gate_count(xadj, adjncy, eweights, [qpu_index[qpu_id] for qpu_id in first_fit])
+        if first_fit_remote == 0:
+            return first_fit, 0
+        membership = capacity_membership(xadj, adjncy, eweights, [len(self.free_qubits[qpu_id]) for qpu_id in qpu_ids])
+        remote = remote_gate_count(xadj, adjncy, eweights, membership)
+        if remote >= first_fit_remote:
+            return first_fit, first_fit_remote
+        return [qpu_ids[index] for index in membership.tolist()], remote
+
+    def allocate_qubits(self, circuit):
+        num_logical_qubits = self.logical_qubit_count(circuit.gates)
+        circuit.logical_to_physical = {}
+        if num_logical_qubits > self.free_qubit_count:
+            return False
+        self._logical_qubit_counts.pop(id(circuit.gates), None)
+        if self.allocation == "partition":
+            qpus, self.remote_gate_counts[circuit.circuit_id] = self.partition_qpus(circuit.gates, num_logical_qubits)
+        else:
+            qpus = self.first_fit_qpus(num_logical_qubits)
+        for logical_qubit, qpu_id in enumerate(qpus):
+            physical_qubit = self.free_qubits[qpu_id].pop()
+            circuit.logical_to_physical[logical_qubit] = (qpu_id, physical_qubit)
+            self.qubit_allocation[qpu_id].add(physical_qubit)
+        self.free_qubit_count -= num_logical_qubits
+        return True
+
+    def release_qubits(self, circuit):
+        # Release the physical qubits occupied by the circuit
+        for qpu_id, physical_qubit in circuit.logical_to_physical.values():
+            self.qubit_allocation[qpu_id].remove(physical_qubit)
+            self.free_qubits[qpu_id].append(physical_qubit)
+        self.free_qubit_count += len(circuit.logical_to_physical)
+
+class Scheduler(QubitAllocator):
+    def __init__(self, env, qpus, circuits, sink=None, allocation="first_fit"):
         self.env = env
+        self.sink = sink if sink is not None else NullSink()
         self.qpus = qpus
         self.circuits = circuits  # List of circuits to be scheduled
         self.action = env.process(self.run())
         self.active_circuits = []
-        self.qubit_allocation = {}  # {QPU_ID: set(physical_qubit_ID)}
-        for qpu_id in qpus:
-            self.qubit_allocation[qpu_id] = set()
+        self.init_allocation(allocation)
         self.max_executed_circuit_id = 0
 
     def run(self):
@@ -218,79 +347,402 @@ class Scheduler:
                 circuit_gates = self.circuits[0]
 
                 if not self.has_enough_qubits(circuit_gates):
-                    print(f"Time {self.env.now}: Scheduler waiting for physical qubit resources for circuit {self.max_executed_circuit_id}")
+                    if self.sink.enabled:
+                        self.sink.record(self.env.now, "circuit_waiting", circuit=self.max_executed_circuit_id)
                     break
 
                 circuit = Circuit(self.env, self.max_executed_circuit_id, circuit_gates, self.qpus, self)
                 allocation_successful = self.allocate_qubits(circuit)
-                print(f"Time {self.env.now}: Circuit {self.max_executed_circuit_id} allocated physical qubits {'successfully' if allocation_successful else 'unsuccessfully'}")
-
                 if allocation_successful:
                     self.circuits.pop(0)
                     circuits_to_run.append(circuit)
-                    print(f"Time {self.env.now}: Circuit {self.max_executed_circuit_id} starts execution")
+                    if self.sink.enabled:
+                        self.sink.record(self.env.now, "circuit_start", circuit=self.max_executed_circuit_id)
                     circuits_to_run.append(circuit)
                     self.max_executed_circuit_id += 1
                 else:
-                    print(f"Time {self.env.now}: Circuit {self.max_executed_circuit_id} waiting for physical qubit resources")
+                    if self.sink.enabled:
+                        self.sink.record(self.env.now, "circuit_waiting", circuit=self.max_executed_circuit_id)
                     break
             # Execute multiple circuits simultaneously
             for circuit in circuits_to_run:
                 self.active_circuits.append(circuit)
 
         yield self.env.timeout(0)
-        print(f"Time {self.env.now}: Scheduler completed a scheduling round")
+        if self.sink.enabled:
+            self.sink.record(self.env.now, "scheduling_round")
 
-    def has_enough_qubits(self, circuit_gates):
-        all_available_physical_qubits = {}
-        for qpu_id, qpu in self.qpus.items():
-            all_available_physical_qubits[qpu_id] = set(qpu.qubits.keys()) - self.qubit_allocation[qpu_id]
+    def computing_qubit_ids(self, qpu_id):
+        return self.qpus[qpu_id].qubits.keys()
 
-        total_available_qubits_num = sum(len(qubits) for qubits in all_available_physical_qubits.values())
-        return max(qubit for gate in circuit_gates for qubit in gate['qubits']) + 1 <= total_available_qubits_num
-
-    def allocate_qubits(self, circuit):
-        # Count the number of logical qubits involved in the circuit
-        num_logical_qubits = max(qubit for gate in circuit.gates for qubit in gate['qubits']) + 1
-        # Allocate physical qubits for the circuit
-        circuit.logical_to_physical = {}
-        
-        for logical_qubit in range(num_logical_qubits):
-            allocated = False
-            for qpu_id, qpu in self.qpus.items():
-                available_qubits = set(qpu.qubits.keys()) - self.qubit_allocation[qpu_id]
-                if available_qubits:
-                    physical_qubit = available_qubits.pop()
-                    circuit.logical_to_physical[logical_qubit] = (qpu_id, physical_qubit)
-                    self.qubit_allocation[qpu_id].add(physical_qubit)
-                    allocated = True
-                    break
+    def release_qubits(self, circuit):
+        if self.sink.enabled:
+            self.sink.record(self.env.now, "circuit_release", circuit=circuit.circuit_id)
+        super().release_qubits(circuit)
+
+# Heap based alternative to the simpy model above, for batch runs: the same processes written as callbacks on a plain
+# (time, priority, id) event queue, qubits kept in preallocated per-QPU lists. Events are ordered exactly as
+# simpy orders them (process starts are urgent, a qubit goes to the head of its FIFO queue one event after a release,
+# AllOf/AnyOf fire one event after their last/first member), so every gate starts and ends at the same time as in
+# simulate() and the makespan is identical, as is the stream recorded into sink. The first-found communication qubit policy is kept as is: the other
+# communication qubits requested along with it are never released.
+URGENT = 0
+NORMAL = 1
+
+class _Event:
+    __slots__ = ("callbacks", "value", "triggered")
+
+    def __init__(self):
+        self.callbacks = []  # None once processed
+        self.value = None
+        self.triggered = False
+
+class _Qubit:
+    __slots__ = ("user", "queue")
+
+    def __init__(self):
+        self.user = None  # granted request
+        self.queue = deque()  # pending requests, FIFO
+
+class _HeapCircuit:
+    __slots__ = ("circuit_id", "gates", "remaining_gates", "pending_predecessors", "successors", "completion_event",
+                 "logical_to_physical")
+
+    def __init__(self, circuit_id, gates):
+        self.circuit_id = circuit_id
+        self.gates = gates
+        self.remaining_gates = len(gates)
+        self.pending_predecessors, self.successors = gate_dependencies(gates)
+        self.completion_event = _Event()
+        self.logical_to_physical = {}
+
+class HeapSimulator(QubitAllocator):
+    def __init__(self, quantum_circuits, qpu_qubit_counts, sink=None, allocation="first_fit"):
+        self.sink = sink if sink is not None else NullSink()
+        self.now = 0
+        self._queue = []
+        self._eid = count()
+        self.qpus = {}
+        self.qubits = {}  # {QPU_ID: [_Qubit per computing qubit]}
+        self.communication_qubits = {}  # {QPU_ID: [_Qubit per communication qubit]}
+        self.gate_queue = {}  # {QPU_ID: (gates, waiting gets)}
+        for qpu_id, qubit_counts in qpu_qubit_counts.items():
+            self.qpus[qpu_id] = qubit_counts
+            self.qubits[qpu_id] = [_Qubit() for _ in range(qubit_counts['computing'])]
+            self.communication_qubits[qpu_id] = [_Qubit() for _ in range(qubit_counts['communication'])]
+            self.gate_queue[qpu_id] = (deque(), deque())
+            self._process(self._qpu_run, qpu_id)
+        self.circuits = quantum_circuits
+        self._call(self._scheduler_run)
+        self.init_allocation(allocation)
+        self.max_executed_circuit_id = 0
 
-        return True
+    def computing_qubit_ids(self, qpu_id):
+        return range(self.qpus[qpu_id]['computing'])
 
     def release_qubits(self, circuit):
-        # Release the physical qubits occupied by the circuit
-        print(f"Time {self.env.now}: Circuit {circuit.circuit_id} releasing physical qubit resources")
-        for qpu_id, physical_qubit in circuit.logical_to_physical.values():
-            self.qubit_allocation[qpu_id].remove(physical_qubit)
+        if self.sink.enabled:
+            self.sink.record(self.now, "circuit_release", circuit=circuit.circuit_id)
+        super().release_qubits(circuit)
+
+    def _record_gate(self, event, qpu_id, gate, local_only=False):
+        qubits, _, circuit, index = gate
+        if local_only:
+            qubits = [q for q in qubits if circuit.logical_to_physical[q][0] == qpu_id]
+        self.sink.record(self.now, event, qpu_id, circuit.circuit_id, qubits, circuit.gates[index]['type'])
 
-def simulate(quantum_circuits, qpu_qubit_counts):
+    def run(self):
+        queue = self._queue
+        while queue:
+            self.now, _, _, event = heappop(queue)
+            callbacks, event.callbacks = event.callbacks, None
+            for callback in callbacks:
+                callback(event)
+        return self.now
+
+    # Event primitives
+
+    def _succeed(self, event, value=None):
+        event.triggered = True
+        event.value = value
+        heappush(self._queue, (self.now, NORMAL, next(self._eid), event))
+
+    def _timeout(self, delay):
+        event = _Event()
+        event.triggered = True
+        heappush(self._queue, (self.now + delay, NORMAL, next(self._eid), event))
+        return event
+
+    def _wait(self, event, callback):
+        if event.callbacks is None:
+            callback(event)
+        else:
+            event.callbacks.append(callback)
+
+    def _process(self, func, *args):
+        # func(*args) runs after an urgent start event; nothing waits for it to finish
+        start = _Event()
+        start.callbacks.append(lambda _: func(*args))
+        heappush(self._queue, (self.now, URGENT, next(self._eid), start))
+
+    def _call(self, func, *args):
+        # func(done, *args) runs as a process that succeeds done when it finishes
+        done = _Event()
+        self._process(func, done, *args)
+        return done
+
+    def _condition(self, events, needed):
+        # succeeds once `needed` of events are processed (AllOf: all of them, AnyOf: 1)
+        cond = _Event()
+        if not events:
+            self._succeed(cond)
+            return cond
+        needed = min(needed, len(events))
+        processed = [0]
+        def check(_):
+            if cond.triggered:
+                return
+            processed[0] += 1
+            if processed[0] == needed:
+                self._succeed(cond)
+        for event in events:
+            self._wait(event, check)
+        return cond
+
+    def _request(self, qubit):
+        request = _Event()
+        qubit.queue.append(request)
+        self._grant(qubit)
+        return request
+
+    def _grant(self, qubit):
+        if qubit.user is None and qubit.queue:
+            qubit.user = qubit.queue.popleft()
+            self._succeed(qubit.user)
+
+    def _release(self, qubit, request):
+        if qubit.user is request:
+            qubit.user = None
+        release = _Event()
+        release.callbacks.append(lambda _: self._grant(qubit))
+        self._succeed(release)
+
+    def _store_put(self, qpu_id, gate):
+        gates, gets = self.gate_queue[qpu_id]
+        gates.append(gate)
+        put = _Event()
+        put.callbacks.append(lambda _: self._store_trigger_get(qpu_id))
+        self._succeed(put)
+
+    def _store_get(self, qpu_id):
+        get = _Event()
+        self.gate_queue[qpu_id][1].append(get)
+        self._store_trigger_get(qpu_id)
+        return get
+
+    def _store_trigger_get(self, qpu_id):
+        gates, gets = self.gate_queue[qpu_id]
+        if gets and gates:
+            self._succeed(gets.popleft(), gates.popleft())
+
+    # Processes, mirroring Scheduler.run, Circuit.run and the QPU methods
+
+    def _scheduler_run(self, done):
+        while self.circuits:
+            circuit_gates = self.circuits[0]
+            if not self.has_enough_qubits(circuit_gates):
+                if self.sink.enabled:
+                    self.sink.record(self.now, "circuit_waiting", circuit=self.max_executed_circuit_id)
+                break
+            circuit = _HeapCircuit(self.max_executed_circuit_id, circuit_gates)
+            self._process(self._circuit_run, circuit)
+            if not self.allocate_qubits(circuit):
+                if self.sink.enabled:
+                    self.sink.record(self.now, "circuit_waiting", circuit=self.max_executed_circuit_id)
+                break
+            self.circuits.pop(0)
+            if self.sink.enabled:
+                self.sink.record(self.now, "circuit_start", circuit=self.max_executed_circuit_id)
+            self.max_executed_circuit_id += 1
+        def round_done(_):
+            if self.sink.enabled:
+                self.sink.record(self.now, "scheduling_round")
+            self._succeed(done)
+        self._wait(self._timeout(0), round_done)
+
+    def _circuit_run(self, circuit):
+        if self.sink.enabled:
+            for logical_qubit, (qpu_id, physical_qubit) in circuit.logical_to_physical.items():
+                self.sink.record(self.now, "qubit_mapped", qpu_id, circuit.circuit_id, (logical_qubit, physical_qubit))
+        for index, pending in enumerate(circuit.pending_predecessors):
+            if pending == 0:
+                self._dispatch(circuit, index)
+        def completed(_):
+            self.release_qubits(circuit)
+            self._wait(self._call(self._scheduler_run), circuit_end)
+        def circuit_end(_):
+            if self.sink.enabled:
+                self.sink.record(self.now, "circuit_end", circuit=circuit.circuit_id)
+        self._wait(circuit.completion_event, completed)
+
+    def _dispatch(self, circuit, index):
+        gate = circuit.gates[index]
+        qpus_involved = set()
+        for logical_qubit in gate['qubits']:
+            qpu_id, _ = circuit.logical_to_physical[logical_qubit]
+            qpus_involved.add(qpu_id)
+        qpus_involved = list(qpus_involved)
+        self._store_put(qpus_involved[0], (gate['qubits'], qpus_involved, circuit, index))
+
+    def _qpu_run(self, qpu_id):
+        def next_gate(event):
+            self._process(self._execute_gate, qpu_id, event.value)
+            self._wait(self._store_get(qpu_id), next_gate)
+        self._wait(self._store_get(qpu_id), next_gate)
+
+    def _execute_gate(self, qpu_id, gate):
+        qubits, qpus_involved, circuit, index = gate
+        def gate_done(_):
+            circuit.remaining_gates -= 1
+            for successor in circuit.successors[index]:
+                circuit.pending_predecessors[successor] -= 1
+                if circuit.pending_predecessors[successor] == 0:
+                    self._dispatch(circuit, successor)
+            if circuit.remaining_gates == 0:
+                self._succeed(circuit.completion_event)
+        if len(qubits) == 1:
+            self._wait(self._call(self._execute_single_qubit_gate, qpu_id, gate), gate_done)
+        elif len(qubits) == 2:
+            if len(qpus_involved) > 1:
+                self._wait(self._call(self._execute_remote_gate, qpu_id, gate), gate_done)
+            else:
+                self._wait(self._call(self._execute_local_two_qubit_gate, qpu_id, gate), gate_done)
+        else:
+            gate_done(None)
+
+    def _execute_single_qubit_gate(self, done, qpu_id, gate):
+        qubits, _, circuit, _ = gate
+        _, physical_qubit = circuit.logical_to_physical[qubits[0]]
+        qubit = self.qubits[qpu_id][physical_qubit]
+        req = self._request(qubit)
+        def start(_):
+            if self.sink.enabled:
+                self._record_gate("single_qubit_gate_start", qpu_id, gate)
+            self._wait(self._timeout(SINGLE_QUBIT_GATE_DELAY), finish)
+        def finish(_):
+            if self.sink.enabled:
+                self._record_gate("single_qubit_gate_end", qpu_id, gate)
+            self._release(qubit, req)
+            self._succeed(done)
+        self._wait(req, start)
+
+    def _execute_local_two_qubit_gate(self, done, qpu_id, gate):
+        qubits, _, circuit, _ = gate
+        qubit1 = self.qubits[qpu_id][circuit.logical_to_physical[qubits[0]][1]]
+        qubit2 = self.qubits[qpu_id][circuit.logical_to_physical[qubits[1]][1]]
+        req1 = self._request(qubit1)
+        req2 = self._request(qubit2)
+        def start(_):
+            if self.sink.enabled:
+                self._record_gate("local_gate_start", qpu_id, gate)
+            self._wait(self._timeout(TWO_QUBIT_GATE_DELAY), finish)
+        def finish(_):
+            if self.sink.enabled:
+                self._record_gate("local_gate_end", qpu_id, gate)
+            self._release(qubit2, req2)
+            self._release(qubit1, req1)
+            self._succeed(done)
+        self._wait(self._condition([req1, req2], 2), start)
+
+    def _request_data_qubits(self, qpu_id, gate):
+        qubits, _, circuit, _ = gate
+        data_qubits = [self.qubits[qpu_id][circuit.logical_to_physical[q][1]] for q in qubits
+                       if circuit.logical_to_physical[q][0] == qpu_id]
+        return [(qubit, self._request(qubit)) for qubit in data_qubits]
+
+    def _release_all(self, requests):
+        for qubit, req in requests:
+            self._release(qubit, req)
+
+    def _execute_remote_gate(self, done, qpu_id, gate):
+        _, qpus_involved, _, _ = gate
+        data_requests = self._request_data_qubits(qpu_id, gate)
+        def got_comm_qubit(event):
+            comm_request = event.value
+            entanglement_events = []
+            for other_id in qpus_involved:
+                if other_id != qpu_id:
+                    entanglement_event = _Event()
+                    self._process(self._participate_in_remote_gate, other_id, gate, entanglement_event)
+                    entanglement_events.append(entanglement_event)
+            def start(_):
+                if self.sink.enabled:
+                    self._record_gate("remote_gate_start", qpu_id, gate, local_only=True)
+                self._wait(self._timeout(TWO_QUBIT_GATE_DELAY), finish)
+            def finish(_):
+                if self.sink.enabled:
+                    self._record_gate("remote_gate_end", qpu_id, gate, local_only=True)
+                self._release_all(data_requests)
+                self._release_all([comm_request])
+                self._succeed(done)
+            self._wait(self._timeout(ENTANGLEMENT_DELAY), lambda _: self._wait(
+                self._condition(entanglement_events, len(entanglement_events)), start))
+        self._wait(self._condition([req for _, req in data_requests], len(data_requests)),
+                   lambda _: self._wait(self._call(self._get_available_comm_qubit, qpu_id), got_comm_qubit))
+
+    def _participate_in_remote_gate(self, qpu_id, gate, entanglement_event):
+        data_requests = self._request_data_qubits(qpu_id, gate)
+        def entangled(_):
+            if self.sink.enabled:
+                self._record_gate("remote_participant_start", qpu_id, gate, local_only=True)
+            self._succeed(entanglement_event)
+            self._wait(self._timeout(TWO_QUBIT_GATE_DELAY), finish)
+        def finish(_):
+            if self.sink.enabled:
+                self._record_gate("remote_participant_end", qpu_id, gate, local_only=True)
+            self._release_all(data_requests)
+            self._release_all([comm_request[0]])
+        comm_request = []
+        def got_comm_qubit(event):
+            comm_request.append(event.value)
+            self._wait(self._timeout(ENTANGLEMENT_DELAY), entangled)
+        self._wait(self._condition([req for _, req in data_requests], len(data_requests)),
+                   lambda _: self._wait(self._call(self._get_available_comm_qubit, qpu_id), got_comm_qubit))
+
+    def _get_available_comm_qubit(self, done, qpu_id):
+        # succeeds done with (qubit, request) of the first granted communication qubit
+        requests = [(qubit, self._request(qubit)) for qubit in self.communication_qubits[qpu_id]]
+        if not requests:
+            raise RuntimeError(f"QPU {qpu_id} has no communication qubits")
+        def chosen(_):
+            self._succeed(done, next(pair for pair in requests if pair[1].callbacks is None))
+        self._wait(self._condition([req for _, req in requests], 1), chosen)
+
+# backend: "simpy" runs the annotated processes above, "heap" the HeapSimulator (same timing)
+# sink: utils.event_sink sink receiving the simulation events, nothing is recorded by default
+# allocation: physical qubit allocation mode, see QubitAllocator
+# RETURNS: makespan
+def simulate(quantum_circuits, qpu_qubit_counts, backend="simpy", sink=None, allocation="first_fit"):
+    if backend == "heap":
+        return HeapSimulator(quantum_circuits, qpu_qubit_counts, sink, allocation).run()
+    if backend != "simpy":
+        raise ValueError(f"unknown simulation backend {backend!r}")
     env = simpy.Environment()
     # Create QPUs
     qpus = {}
     for qpu_id, qubit_counts in qpu_qubit_counts.items():
         num_computing_qubits = qubit_counts['computing']
         num_communication_qubits = qubit_counts['communication']
-        qpus[qpu_id] = QPU(env, qpu_id, num_computing_qubits, num_communication_qubits)
+        qpus[qpu_id] = QPU(env, qpu_id, num_computing_qubits, num_communication_qubits, sink)
 
     # Create scheduler
-    scheduler = Scheduler(env, qpus, quantum_circuits)
+    scheduler = Scheduler(env, qpus, quantum_circuits, sink, allocation)
 
     env.run()
+    return env.now
 
 def get_circuit_input(gate_list, qubit_to_node, refine_iter_cnt=3):
-    if type(qubit_to_node) is list:
-        qubit_to_node = {i: node for i, node in enumerate(qubit_to_node)}
+    qubit_to_node = QubitNodeMap.from_mapping(qubit_to_node)
 
     auto_gates, _, _ = full_autocomm(gate_list=gate_list, \
                                qubit_node_mapping=qubit_to_node, refine_iter_cnt=refine_iter_cnt)
@@ -328,4 +780,8 @@ if __name__ == '__main__':
         'QPU2': {'computing': 2, 'communication': 1},  # QPU2 has 3 computing qubits, 1 communication qubit
     }
 
-    simulate(quantum_circuits, qpu_qubit_counts)
+    sink = RingBufferSink()
+    makespan = simulate(quantum_circuits, qpu_qubit_counts, sink=sink)
+    for time, event, qpu_id, circuit_id, qubits, gate_type in sink.rows():
+        print(f"Time {time}: {event} QPU {qpu_id} circuit {circuit_id} qubits {list(qubits)} {gate_type or ''}")
+    print(f"Makespan: {makespan}")
@@ -0,0 +1,93 @@
+'''Communication analytics of a gate list under a qubit -> node mapping, without running the autocomm passes:
+remote gate counts per node pair and per qubit, the comm blocks consecutive_merge would form, and a lower bound
+on the epr_cnt any aggregation can reach.
+'''
+import numpy as np
+from autocomm_v1.gate_array import GateArray, gate_qubit_columns
+from autocomm_v1.merge_func import consecutive_run_lengths
+from utils.qubit_node_map import QubitNodeMap
+
+# First gate of every block consecutive_merge forms: a remote gate starts a block of 1 + max(run lengths of its two
+# keys) gates, anything else is a block of its own. Block starts form a chain from gate 0, walked by pointer doubling.
+# RETURNS: indices of the block starts, size of each block
+def consecutive_blocks(q0, q1, node_of):
+    q0 = np.asarray(q0, dtype=np.int64)
+    q1 = np.asarray(q1, dtype=np.int64)
+    node_of = np.asarray(node_of, dtype=np.int64)
+    n_gate = len(q0)
+    if n_gate == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    run_len = consecutive_run_lengths(q0, q1, node_of).reshape(n_gate, 2)
+    remote = (q1 >= 0) & (node_of[q0] != node_of[np.where(q1 >= 0, q1, q0)])
+    size = np.where(remote, 1 + run_len.max(axis=1), 1)
+    jump = np.minimum(np.arange(n_gate) + size, n_gate)
+    jump = np.append(jump, n_gate) # n_gate: past the end, jumps to itself
+    starts = np.zeros(1, dtype=np.int64)
+    while True: # starts holds the first 2^k chain entries, jump the 2^k-th successor
+        more = jump[starts]
+        more = more[more < n_gate]
+        if len(more) == 0:
+            break
+        starts = np.concatenate([starts, more])
+        jump = jump[jump]
+    starts.sort()
+    return starts, size[starts]
+
+# Every remote gate (a, b) lies in a comm block keyed (a, node of b) or (b, node of a), and a block needs at least one
+# EPR pair per target node, so epr_cnt >= the fewest keys covering all remote gates >= any matching of the key graph.
+# The matching is greedy over the distinct key pairs, lowest degree first.
+def epr_lower_bound(key0, key1):
+    if len(key0) == 0:
+        return 0
+    edges = np.unique(np.stack([np.minimum(key0, key1), np.maximum(key0, key1)], axis=1), axis=0)
+    _, inverse, degree = np.unique(edges, return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(edges.shape)
+    order = np.argsort(degree[inverse].sum(axis=1), kind="stable")
+    matched = np.zeros(len(degree), dtype=bool)
+    size = 0
+    for u, v in inverse[order].tolist():
+        if not matched[u] and not matched[v]:
+            matched[u] = matched[v] = True
+            size += 1
+    return size
+
+# RETURNS: dict with
+#   "remote_gates": number of two qubit gates across nodes
+#   "node_pairs": {(node, node): remote gates} for the node pairs that carry any (smaller node first)
+#   "remote_degree": remote gates of each qubit (numpy array), "remote_partners": distinct remote partners of each qubit
+#   "block_histogram": {block size: count} of the comm blocks consecutive_merge forms, "consecutive_blocks": their count
+#   "epr_lower_bound": see epr_lower_bound
+def interaction_report(gate_list, qubit_node_mapping):
+    qubit_node_mapping = QubitNodeMap.from_mapping(qubit_node_mapping)
+    node_of = qubit_node_mapping.node_of
+    num_q = qubit_node_mapping.num_qubits
+    num_nodes = max(qubit_node_mapping.num_nodes, 1)
+    if isinstance(gate_list, GateArray):
+        q0, q1 = gate_list.q0.astype(np.int64), gate_list.q1.astype(np.int64)
+    else:
+        q0, q1 = (np.asarray(col, dtype=np.int64) for col in gate_qubit_columns(gate_list))
+
+    two_q = q1 >= 0
+    a, b = q0[two_q], q1[two_q]
+    remote = node_of[a] != node_of[b]
+    a, b = a[remote], b[remote]
+    na, nb = node_of[a], node_of[b]
+
+    pair_keys, pair_cnt = np.unique(np.minimum(na, nb) * num_nodes + np.maximum(na, nb), return_counts=True)
+    node_pairs = {(int(key // num_nodes), int(key % num_nodes)): int(cnt) for key, cnt in zip(pair_keys, pair_cnt)}
+    remote_degree = np.bincount(a, minlength=num_q) + np.bincount(b, minlength=num_q)
+    qubit_pairs = np.unique(np.minimum(a, b) * num_q + np.maximum(a, b))
+    remote_partners = np.bincount(qubit_pairs // num_q, minlength=num_q) + np.bincount(qubit_pairs % num_q, minlength=num_q)
+
+    starts, size = consecutive_blocks(q0, q1, node_of)
+    start_q1 = q1[starts]
+    block_remote = (start_q1 >= 0) & (node_of[q0[starts]] != node_of[np.where(start_q1 >= 0, start_q1, q0[starts])])
+    sizes, size_cnt = np.unique(size[block_remote], return_counts=True)
+
+    return {"remote_gates": int(len(a)),
+            "node_pairs": node_pairs,
+            "remote_degree": remote_degree,
+            "remote_partners": remote_partners,
+            "block_histogram": dict(zip(sizes.tolist(), size_cnt.tolist())),
+            "consecutive_blocks": int(block_remote.sum()),
+            "epr_lower_bound": epr_lower_bound(a * num_nodes + nb, b * num_nodes + na)}
@@ -1,7 +1,10 @@
 from autocomm_v1.gate_util import *
 from autocomm_v1.commute_func import *
 from autocomm_v1.merge_func import *
-from utils.util import reverse_map
+from autocomm_v1.schedule_func import *
+from utils.qubit_node_map import QubitNodeMap
+
+DEFAULT_LATENCY_METRIC = {"1Q":0.1,"CX":1,"CZ":1,"CRZ":2.2,"MS":5,"EP":12,"CB":1}
 
 # assume gates are formed of CX and single-qubit gates. It is okay to have other gates if related rules are defined
 def comm_aggregate(gate_list, qubit_node_mapping, allow_gate_pattern=True, refine_iter_cnt=3, check_commute_func=commute_func_right):
@@ -103,271 +106,39 @@ def comm_assign(gate_block_list, qubit_node_mapping):
             assigned_gate_block_list.append(gb)
     return assigned_gate_block_list
 
-def comm_schedule(assigned_gate_block_list, qubit_node_mapping, latency_metric=None, fidelity_metric=None, refine_iter_cnt=3, check_commute_func=commute_func_right):
+# comm_qubit_cnt: comm qubits per node, an int for all nodes or a list indexed by node
+# timeline: optional Timeline that records the schedule of the returned block list
+# list_schedule: issue blocks by list scheduling instead of program order, the returned block list is in issue order
+# epr_prefetch: {"buffer_depth": .., "lifetime": ..} to take EPR pairs from per link prefetch buffers
+# epr_rate: EPR pairs per time unit per link, a number or a dict {(node, node): rate}; EP requests queue on their link
+# schedule_stats: optional dict that gets the schedule statistics, with epr_prefetch "ep_wait_saved" and
+# "latency_saved" (all_latency of the same issue order without prefetching minus all_latency, negative when the comm
+# qubits held by buffered pairs cost more than they saved), with epr_rate "ep_stall" and per link "links"
+# topology: optional utils.topology.Topology giving the EP latency of each node pair (EP scaled by its level cost)
+def comm_schedule(assigned_gate_block_list, qubit_node_mapping, latency_metric=None, fidelity_metric=None, refine_iter_cnt=3, check_commute_func=commute_func_right, comm_qubit_cnt=2, timeline=None, list_schedule=False, \
+                  epr_prefetch=None, schedule_stats=None, epr_rate=None, topology=None):
     if latency_metric == None:
-        latency_metric = {"1Q":0.1,"CX":1,"CZ":1,"CRZ":2.2,"MS":5,"EP":12,"CB":1}
+        latency_metric = DEFAULT_LATENCY_METRIC
     assigned_gate_block_list = tp_comm_merge_iter(assigned_gate_block_list, qubit_node_mapping, refine_iter_cnt, check_commute_func)
     # start scheduling
-    # [dq0, ..., dq(n-1)] where n is num qubits
-    dqb_list = [f"dq{i}" for i in range(len(qubit_node_mapping))]
-    node_count = max(qubit_node_mapping) + 1
-
-    # [cq0-0, cq0-1, ..., cqN-0, cqN-1] where N is num nodes
-    cqb_list = [f"cq{i}-{j}" for j in [0,1] for i in range(node_count)]
-    qb_slot = {}
-    for qb in dqb_list+cqb_list:
-        qb_slot[qb] = 0
-    epr_cnt = 0
-    for gb in assigned_gate_block_list:
-        if is_comm_block(gb):
-            if gb[0][1] == 0: # cat-comm
-                source, target_node = gb[0][0]
-                source_node = qubit_node_mapping[source]
-                scqb_idx = 0
-                if qb_slot[f"cq{source_node}-{0}"] > qb_slot[f"cq{source_node}-{1}"]:
-                    scqb_idx = 1
-                tcqb_idx = 0
-                if qb_slot[f"cq{target_node}-{0}"] > qb_slot[f"cq{target_node}-{1}"]:
-                    tcqb_idx = 1
-                # do cat-comm
-                # EP
-                scqb = f"cq{source_node}-{scqb_idx}"
-                tcqb = f"cq{target_node}-{tcqb_idx}"
-                source_qb = f"dq{source}"
-                qb_slot[scqb] = max(qb_slot[scqb],qb_slot[tcqb]) + latency_metric["EP"]
-                qb_slot[tcqb] = qb_slot[scqb]
-                # CX
-                # TODO why is qb_slot[dq{target}] not checked here?
-                qb_slot[source_qb] = max(qb_slot[source_qb],qb_slot[scqb]) + latency_metric["CX"]
-                qb_slot[scqb] = qb_slot[source_qb]
-                # Measure and correction
-                qb_slot[scqb] += latency_metric["MS"]
-                qb_slot[tcqb] = max(qb_slot[tcqb],qb_slot[scqb]+latency_metric["CB"])+latency_metric["1Q"]
-                # main body
-                source_qb = tcqb # NOTE after the CAT-Comm, the source qb is transferred to the target node comm qubit
-                H_offset = 0
-                for glocal in gb[1]:
-                    glqb = gate_qubits(glocal)
-                    if len(glqb) == 1:
-                        if glqb[0] == source:
-                            qb_slot[source_qb] += latency_metric["1Q"]
-                        else:
-                            qb_slot[f"dq{glqb[0]}"] += latency_metric["1Q"]
-                    elif len(glqb) == 2:
-                        ctrl, tgt = glqb
-                        ctrl_qb = f"dq{ctrl}"
-                        tgt_qb = f"dq{tgt}"
-                        if gate_type(glocal) in ["CX", "CZ"]:
-                            twoq_latency = latency_metric["CX"]
-                        elif gate_type(glocal) in ["CRZ"]:
-                            twoq_latency = latency_metric["CRZ"]
-                        else:
-                            pass
-                        if ctrl == source:
-                            qb_slot[source_qb] = max(qb_slot[source_qb], qb_slot[tgt_qb]) + twoq_latency
-                            qb_slot[tgt_qb] = qb_slot[source_qb]
-                        elif tgt == source:
-                            qb_slot[source_qb] = max(qb_slot[source_qb], qb_slot[ctrl_qb]) + twoq_latency
-                            qb_slot[ctrl_qb] = qb_slot[source_qb]
-                            H_offset = 1
-                        else:
-                            qb_slot[ctrl_qb] = max(qb_slot[ctrl_qb], qb_slot[tgt_qb]) + twoq_latency
-                            qb_slot[tgt_qb] = qb_slot[ctrl_qb]
-                # finish up
-                source_qb = f"dq{source}"
-                qb_slot[tcqb] += latency_metric["1Q"]+latency_metric["MS"]
-                qb_slot[source_qb] = max(qb_slot[source_qb],qb_slot[tcqb]+latency_metric["CB"])+latency_metric["1Q"]
-                epr_cnt += 1
-            else: # Tp-comm
-                # serial
-                # do parallel
-                if len(gb[0][0]) == 2:
-                    source, target_node = gb[0][0]
-                    source_node = qubit_node_mapping[source]
-                    scqb_idx = 0
-                    if qb_slot[f"cq{source_node}-{0}"] > qb_slot[f"cq{source_node}-{1}"]:
-                        scqb_idx = 1
-                    tcqb_idx = 0
-                    if qb_slot[f"cq{target_node}-{0}"] > qb_slot[f"cq{target_node}-{1}"]:
-                        tcqb_idx = 1
-                    source_qb = f"dq{source}"
-                    scqb = f"cq{source_node}-{scqb_idx}"
-                    tcqb = f"cq{target_node}-{tcqb_idx}"
-                    # do tp-comm
-                    # EP
-                    qb_slot[scqb] = max(qb_slot[scqb],qb_slot[tcqb]) + latency_metric["EP"]
-                    qb_slot[tcqb] = qb_slot[scqb]
-                    # CX
-                    qb_slot[source_qb] = max(qb_slot[source_qb],qb_slot[scqb]) + latency_metric["CX"]
-                    qb_slot[scqb] = qb_slot[source_qb]
-                    # H
-                    qb_slot[source_qb] = qb_slot[source_qb] + latency_metric["1Q"]
-                    # M
-                    qb_slot[source_qb] = qb_slot[source_qb] + latency_metric["MS"]
-                    qb_slot[scqb] = qb_slot[scqb] + latency_metric["MS"]
-                    qb_slot[tcqb] = max(qb_slot[tcqb],qb_slot[scqb]+latency_metric["CB"]) + latency_metric["1Q"]
-                    qb_slot[tcqb] = max(qb_slot[tcqb],qb_slot[source_qb]+latency_metric["CB"]) + latency_metric["1Q"]
-                    qb_slot[source_qb] += latency_metric["1Q"] # reset
-                    # main body
-                    source_qb = tcqb
-                    for glocal in gb[1]:
-                        glqb = gate_qubits(glocal)
-                        if len(glqb) == 1:
-                            if glqb[0] == source:
-                                qb_slot[source_qb] += latency_metric["1Q"]
-                            else:
-                                qb_slot[f"dq{glqb[0]}"] += latency_metric["1Q"]
-                        elif len(glqb) == 2:
-                            ctrl, tgt = glqb
-                            ctrl_qb = f"dq{ctrl}"
-                            tgt_qb = f"dq{tgt}"
-                            if gate_type(glocal) in ["CX", "CZ"]:
-                                twoq_latency = latency_metric["CX"]
-                            elif gate_type(glocal) in ["CRZ"]:
-                                twoq_latency = latency_metric["CRZ"]
-                            else:
-                                pass
-                            if ctrl == source:
-                                qb_slot[source_qb] = max(qb_slot[source_qb], qb_slot[tgt_qb]) + twoq_latency
-                                qb_slot[tgt_qb] = qb_slot[source_qb]
-                            elif tgt == source:
-                                qb_slot[source_qb] = max(qb_slot[source_qb], qb_slot[ctrl_qb]) + twoq_latency
-                                qb_slot[ctrl_qb] = qb_slot[source_qb]
-                            else:
-                                qb_slot[ctrl_qb] = max(qb_slot[ctrl_qb], qb_slot[tgt_qb]) + twoq_latency
-                                qb_slot[tgt_qb] = qb_slot[ctrl_qb]
-                    # finish up
-                    source_qb = f"dq{source}"
-                    tcqb_new = f"cq{target_node}-{1-tcqb_idx}"
-                    qb_slot[scqb] = max(qb_slot[scqb],qb_slot[tcqb_new]) + latency_metric["EP"]
-                    qb_slot[tcqb_new] = qb_slot[scqb]
-                    qb_slot[source_qb] = max(qb_slot[source_qb],qb_slot[scqb]) + 3*latency_metric["CX"]
-                    qb_slot[scqb] = qb_slot[source_qb]
-                    qb_slot[tcqb_new] = max(qb_slot[tcqb_new],qb_slot[tcqb]) + latency_metric["CX"]
-                    qb_slot[tcqb] = qb_slot[tcqb_new]
-                    qb_slot[tcqb_new] += latency_metric["MS"]
-                    qb_slot[source_qb] = max(qb_slot[source_qb], qb_slot[tcqb_new]+latency_metric["CB"]) + latency_metric["1Q"]
-                    qb_slot[tcqb] += latency_metric["1Q"] + latency_metric["MS"]
-                    qb_slot[source_qb] = max(qb_slot[source_qb], qb_slot[tcqb]+latency_metric["CB"]) + latency_metric["1Q"]
-                    epr_cnt += 2
-                # do serial
-                if len(gb[0][0]) > 2:
-                    source = gb[0][0][0]
-                    target_nodes = gb[0][0][1:]
-                    source_node = qubit_node_mapping[source]
-                    prev_target = qubit_node_mapping[source]
-                    scqb_idx_prev = 0
-                    if qb_slot[f"cq{source_node}-{0}"] > qb_slot[f"cq{source_node}-{1}"]:
-                        scqb_idx_prev = 1
-                    source_qb_prev = f"dq{source}"
-                    
-                    for tnidx, target_node in enumerate(target_nodes):
-                        source_node = prev_target
-                        prev_target = target_node
-
-                        scqb_idx = scqb_idx_prev
-                        tcqb_idx = 0
-                        if qb_slot[f"cq{target_node}-{0}"] > qb_slot[f"cq{target_node}-{1}"]:
-                            tcqb_idx = 1
-                        scqb_idx_prev = 1 - tcqb_idx
-                        
-                        source_qb = source_qb_prev
-                        scqb = f"cq{source_node}-{scqb_idx}"
-                        tcqb = f"cq{target_node}-{tcqb_idx}"
-                        source_qb_prev = tcqb
-
-                        # do tp-comm
-                        # EP
-                        qb_slot[scqb] = max(qb_slot[scqb],qb_slot[tcqb]) + latency_metric["EP"]
-                        qb_slot[tcqb] = qb_slot[scqb]
-                        # CX
-                        qb_slot[source_qb] = max(qb_slot[source_qb],qb_slot[scqb]) + latency_metric["CX"]
-                        qb_slot[scqb] = qb_slot[source_qb]
-                        # H
-                        qb_slot[source_qb] = qb_slot[source_qb] + latency_metric["1Q"]
-                        # M
-                        qb_slot[source_qb] = qb_slot[source_qb] + latency_metric["MS"]
-                        qb_slot[scqb] = qb_slot[scqb] + latency_metric["MS"]
-                        qb_slot[tcqb] = max(qb_slot[tcqb],qb_slot[scqb]+latency_metric["CB"]) + latency_metric["1Q"]
-                        qb_slot[tcqb] = max(qb_slot[tcqb],qb_slot[source_qb]+latency_metric["CB"]) + latency_metric["1Q"]
-                        qb_slot[source_qb] += latency_metric["1Q"] # reset
-                        epr_cnt += 1
-
-                        # main body
-                        source_qb = tcqb
-                        for glocal in gb[1+tnidx]:
-                            glqb = gate_qubits(glocal)
-                            if len(glqb) == 1:
-                                if glqb[0] == source:
-                                    qb_slot[source_qb] += latency_metric["1Q"]
-                                else:
-                                    qb_slot[f"dq{glqb[0]}"] += latency_metric["1Q"]
-                            elif len(glqb) == 2:
-                                ctrl, tgt = glqb
-                                ctrl_qb = f"dq{ctrl}"
-                                tgt_qb = f"dq{tgt}"
-                                if gate_type(glocal) in ["CX", "CZ"]:
-                                    twoq_latency = latency_metric["CX"]
-                                elif gate_type(glocal) in ["CRZ"]:
-                                    twoq_latency = latency_metric["CRZ"]
-                                else:
-                                    pass
-                                if ctrl == source:
-                                    qb_slot[source_qb] = max(qb_slot[source_qb], qb_slot[tgt_qb]) + twoq_latency
-                                    qb_slot[tgt_qb] = qb_slot[source_qb]
-                                elif tgt == source:
-                                    qb_slot[source_qb] = max(qb_slot[source_qb], qb_slot[ctrl_qb]) + twoq_latency
-                                    qb_slot[ctrl_qb] = qb_slot[source_qb]
-                                else:
-                                    qb_slot[ctrl_qb] = max(qb_slot[ctrl_qb], qb_slot[tgt_qb]) + twoq_latency
-                                    qb_slot[tgt_qb] = qb_slot[ctrl_qb]
-                    # finish up
-                    source_qb = f"dq{source}"
-                    source_node = qubit_node_mapping[source]
-                    scqb_idx = 0
-                    if qb_slot[f"cq{source_node}-{0}"] > qb_slot[f"cq{source_node}-{1}"]:
-                        scqb_idx = 1
-                    scqb = f"cq{source_node}-{scqb_idx}"
-                    tcqb_new = f"cq{target_node}-{1-tcqb_idx}"
-
-                    qb_slot[scqb] = max(qb_slot[scqb],qb_slot[tcqb_new]) + latency_metric["EP"]
-                    qb_slot[tcqb_new] = qb_slot[scqb]
-                    qb_slot[source_qb] = max(qb_slot[source_qb],qb_slot[scqb]) + 3*latency_metric["CX"]
-                    qb_slot[scqb] = qb_slot[source_qb]
-                    qb_slot[tcqb_new] = max(qb_slot[tcqb_new],qb_slot[tcqb]) + latency_metric["CX"]
-                    qb_slot[tcqb] = qb_slot[tcqb_new]
-                    qb_slot[tcqb_new] += latency_metric["MS"]
-                    qb_slot[source_qb] = max(qb_slot[source_qb], qb_slot[tcqb_new]+latency_metric["CB"]) + latency_metric["1Q"]
-                    qb_slot[tcqb] += latency_metric["1Q"] + latency_metric["MS"]
-                    qb_slot[source_qb] = max(qb_slot[source_qb], qb_slot[tcqb]+latency_metric["CB"]) + latency_metric["1Q"]
-                    epr_cnt += 1
-        else:
-            gqb = gate_qubits(gb)
-            if len(gqb) == 1:
-                qb_slot[f"dq{gqb[0]}"] += latency_metric["1Q"]
-            elif len(gqb) == 2: # must be local
-                qb0, qb1 = gqb
-                if gate_type(gb) in ["CX", "CZ"]:
-                    qb_slot[f"dq{qb0}"] = max(qb_slot[f"dq{qb0}"], qb_slot[f"dq{qb1}"]) + latency_metric["CX"]
-                    qb_slot[f"dq{qb1}"] = qb_slot[f"dq{qb0}"]
-                elif gate_type(gb) in ["CRZ"]:
-                    qb_slot[f"dq{qb0}"] = max(qb_slot[f"dq{qb0}"], qb_slot[f"dq{qb1}"]) + latency_metric["CRZ"]
-                    qb_slot[f"dq{qb1}"] = qb_slot[f"dq{qb0}"]
-    all_latency =  max(qb_slot.values())
+    epr_cnt, all_latency, order = schedule_blocks(assigned_gate_block_list, qubit_node_mapping, latency_metric, comm_qubit_cnt, timeline, list_schedule, \
+                                                  epr_prefetch, schedule_stats, epr_rate, topology)
+    if list_schedule:
+        assigned_gate_block_list = [assigned_gate_block_list[bidx] for bidx in order]
     return epr_cnt, all_latency, assigned_gate_block_list
 
 
-def full_autocomm(gate_list, qubit_node_mapping, refine_iter_cnt=3, verbose=False):
-    if type(qubit_node_mapping) is list:
-        qubit_node_mapping = {i: node for i, node in enumerate(qubit_node_mapping)}
-
-    num_q = len(qubit_node_mapping.keys())
-    node_qubit_mapping = reverse_map(qubit_node_mapping)
-    qb_per_node = max([len(values) for _, values in node_qubit_mapping.items()])
+def full_autocomm(gate_list, qubit_node_mapping, refine_iter_cnt=3, verbose=False, comm_qubit_cnt=2, timeline=None, list_schedule=False, \
+                  epr_prefetch=None, schedule_stats=None, epr_rate=None, topology=None):
+    # converted once, every pass below reads the same QubitNodeMap
+    qubit_node_mapping = QubitNodeMap.from_mapping(qubit_node_mapping)
 
     agg_list = comm_aggregate(gate_list, qubit_node_mapping, refine_iter_cnt=refine_iter_cnt)
     assigned_gate_block_list = comm_assign(agg_list, qubit_node_mapping)
-    epr_cnt, all_latency, final_list = comm_schedule(assigned_gate_block_list, qubit_node_mapping, refine_iter_cnt=num_q//qb_per_node)
+    # refine_iter_cnt=None refines both stages until nothing merges
+    schedule_iter_cnt = None if refine_iter_cnt is None else qubit_node_mapping.num_nodes # one per node
+    epr_cnt, all_latency, final_list = comm_schedule(assigned_gate_block_list, qubit_node_mapping, refine_iter_cnt=schedule_iter_cnt, comm_qubit_cnt=comm_qubit_cnt, timeline=timeline, list_schedule=list_schedule, \
+                                                     epr_prefetch=epr_prefetch, schedule_stats=schedule_stats, epr_rate=epr_rate, topology=topology)
 
     if verbose:
         print(epr_cnt, all_latency)
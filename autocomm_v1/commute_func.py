@@ -7,531 +7,163 @@ from autocomm_v1.gate_util import *
 # gate_qubits is a tuple of qubit indices
 # gate_params is a list of angles
 
+##### COMMUTATION TABLE
+# COMMUTE_TABLE[(left opcode, right opcode, overlap)] = (is_commute, lg_ops, rg_op)
+# overlap has bit (2*i + j) set when qubit i of the left gate is qubit j of the right gate
+# The helpers that spell out the rules are private, the modules importing * from here only get the table and its users.
+_DISJOINT = 0
+_L0_R0, _L0_R1, _L1_R0, _L1_R1 = 1, 2, 4, 8
+_SAME_PAIR = _L0_R0 | _L1_R1
+_SWAPPED_PAIR = _L0_R1 | _L1_R0
+
+GATE_ARITY = {"H": 1, "X": 1, "Z": 1, "RX": 1, "RZ": 1, "CX": 2, "CZ": 2, "CRX": 2, "CRZ": 2}
+_VALID_OVERLAPS = {
+    (1, 1): [_DISJOINT, _L0_R0],
+    (1, 2): [_DISJOINT, _L0_R0, _L0_R1],
+    (2, 1): [_DISJOINT, _L0_R0, _L1_R0],
+    (2, 2): [_DISJOINT, _L0_R0, _L0_R1, _L1_R0, _L1_R1, _SAME_PAIR, _SWAPPED_PAIR],
+}
+
+# lg_ops are the gates that replace lg in the check point, rg_op (None: keep rg) replaces rg.
+# A gate op is _KEEP (the left gate itself) or (source, name, qubits, negate):
+#   source "l"/"r" builds from the left/right gate's qubits and params, name None keeps the left gate's type,
+#   qubits None/0/1/"rev" takes all/[:1]/[1:]/[::-1], negate flips the sign of every param
+_KEEP = "keep"
+def _L(name=None, qubits=None, negate=False): return ("l", name, qubits, negate)
+def _R(name=None, qubits=None, negate=False): return ("r", name, qubits, negate)
+
+def _commute(*lg_ops, rg=None):
+    if len(lg_ops) == 0:
+        lg_ops = (_KEEP,)
+    return (True, lg_ops, rg)
+def _drop(): return (True, (), None) # commutes but the left gate is not carried over
+_NOT_COMMUTE = (False, (), None)
+
+COMMUTE_TABLE = {}
+
+# a missing (left, right, overlap) row means there is no rule: lg is not carried over and is_commute keeps its last value
+def add_commute_rules(ltypes, rtypes, rule, overrides={}):
+    for lt in ltypes:
+        for rt in rtypes:
+            for overlap in _VALID_OVERLAPS[(GATE_ARITY[lt], GATE_ARITY[rt])]:
+                _rule = overrides.get(overlap, rule)
+                if _rule is not None:
+                    COMMUTE_TABLE[(gate_opcode(lt), gate_opcode(rt), overlap)] = _rule
+
+# ONE QUBIT R GATE COMPARED W/ ALL
+add_commute_rules(["RZ"], ["RZ", "Z", "CZ", "CRZ"], _commute())
+add_commute_rules(["RZ"], ["RX"], _commute(), {_L0_R0: None})
+add_commute_rules(["RZ"], ["X"], _commute(), {_L0_R0: _commute(_L(negate=True))}) # same RZ gate but flip the angle
+add_commute_rules(["RZ"], ["H"], _commute(), {_L0_R0: _commute(_L("RX"))}) # change basis to RX
+add_commute_rules(["RZ"], ["CX", "CRX"], _commute(), {_L0_R1: _NOT_COMMUTE}) # only on the control line
+add_commute_rules(["RX"], ["RX", "X"], _commute())
+add_commute_rules(["RX"], ["RZ"], _commute(), {_L0_R0: _NOT_COMMUTE})
+add_commute_rules(["RX"], ["Z"], _commute(), {_L0_R0: _commute(_L(negate=True))})
+add_commute_rules(["RX"], ["H"], _commute(), {_L0_R0: _commute(_L("RZ"))})
+add_commute_rules(["RX"], ["CX", "CRX"], _commute(), {_L0_R0: _NOT_COMMUTE}) # only on the target line
+add_commute_rules(["RX"], ["CZ", "CRZ"], _NOT_COMMUTE, {_DISJOINT: _commute()})
+### H compared with ALL
+add_commute_rules(["H"], ["H"], _commute())
+add_commute_rules(["H"], ["RX"], _commute(), {_L0_R0: _commute(rg=_R("RZ"))})
+add_commute_rules(["H"], ["RZ"], _commute(), {_L0_R0: _commute(rg=_R("RX"))})
+add_commute_rules(["H"], ["Z"], _commute(), {_L0_R0: _commute(rg=_R("X"))})
+add_commute_rules(["H"], ["X"], _commute(), {_L0_R0: _commute(rg=_R("Z"))})
+# on the target line C(R)X <-> C(R)Z, on the control line it could commute but is not implemented
+add_commute_rules(["H"], ["CX"], _commute(), {_L0_R0: _NOT_COMMUTE, _L0_R1: _commute(rg=_R("CZ"))})
+add_commute_rules(["H"], ["CRX"], _commute(), {_L0_R0: _NOT_COMMUTE, _L0_R1: _commute(rg=_R("CRZ"))})
+add_commute_rules(["H"], ["CZ"], _commute(), {_L0_R0: _NOT_COMMUTE, _L0_R1: _commute(rg=_R("CX"))})
+add_commute_rules(["H"], ["CRZ"], _commute(), {_L0_R0: _NOT_COMMUTE, _L0_R1: _commute(rg=_R("CRX"))})
+# ONE QUBIT Pauli GATE COMPARED W/ ALL
+add_commute_rules(["X"], ["RX", "X"], _commute())
+add_commute_rules(["X"], ["RZ"], _commute(), {_L0_R0: _commute(rg=_R("RZ", negate=True))})
+add_commute_rules(["X"], ["Z"], _commute(), {_L0_R0: _commute(rg=_R("Z"))}) # a global phase
+add_commute_rules(["X"], ["H"], _commute(), {_L0_R0: _commute(_L("Z"))})
+# on the control line add an X or RX on the target (before the RG) to counter the LG
+add_commute_rules(["X"], ["CX"], _commute(), {_L0_R0: _commute(_KEEP, _R("X", 1, negate=True))})
+add_commute_rules(["X"], ["CRX"], _commute(), {_L0_R0: _commute(_KEEP, _R("RX", 1, negate=True))})
+add_commute_rules(["X"], ["CZ"], _commute(), {_L0_R0: _commute(_KEEP, _R("Z", 1, negate=True)), _L0_R1: _commute(_KEEP, _R("Z", 0, negate=True))})
+add_commute_rules(["X"], ["CRZ"], _commute(), {_L0_R0: _commute(_KEEP, _R("RZ", 1, negate=True)), _L0_R1: _NOT_COMMUTE})
+add_commute_rules(["Z"], ["RZ", "Z", "CZ", "CRZ"], _commute())
+add_commute_rules(["Z"], ["RX"], _commute(), {_L0_R0: _commute(rg=_R("RX", negate=True))})
+add_commute_rules(["Z"], ["X"], _commute(), {_L0_R0: _commute(rg=_R("X"))}) # a global phase
+add_commute_rules(["Z"], ["H"], _commute(), {_L0_R0: _commute(_L("X"))})
+add_commute_rules(["Z"], ["CX"], _commute(), {_L0_R1: _commute(_KEEP, _R("Z", 0, negate=True))})
+add_commute_rules(["Z"], ["CRX"], _commute())
+# 2 QUBIT Pauli GATE COMPARED W/ ALL
+add_commute_rules(["CX"], ["RX"], _commute(), {_L0_R0: _NOT_COMMUTE})
+add_commute_rules(["CX"], ["RZ"], _commute(), {_L1_R0: _NOT_COMMUTE})
+add_commute_rules(["CX"], ["Z"], _commute(), {_L1_R0: _commute(_L("Z", 0), _KEEP)}) # Z on the control before the controlled op
+add_commute_rules(["CX"], ["X"], _commute(), {_L0_R0: _commute(_L("X", 1), _KEEP)}) # X on the target before the controlled op
+add_commute_rules(["CX"], ["H"], _commute(), {_L0_R0: _NOT_COMMUTE, _L1_R0: _commute(_L("CZ"))}) # CX into CZ
+add_commute_rules(["CX"], ["CX", "CRX"], _commute(), {_L0_R1: _NOT_COMMUTE, _L1_R0: _NOT_COMMUTE, _SWAPPED_PAIR: _NOT_COMMUTE})
+for rt in ["CZ", "CRZ"]:
+    # RG flips its angle when it shares both qubits with the LG
+    add_commute_rules(["CX"], [rt], _NOT_COMMUTE, {_L0_R0: _commute(), _L0_R1: _commute(), \
+        _SAME_PAIR: _commute(rg=_R(rt, negate=True)), _SWAPPED_PAIR: _commute(rg=_R(rt, negate=True))})
+add_commute_rules(["CZ"], ["RZ", "Z", "CZ", "CRZ"], _commute())
+add_commute_rules(["CZ"], ["RX"], _NOT_COMMUTE, {_DISJOINT: _commute()})
+add_commute_rules(["CZ"], ["X"], _commute(), {_L0_R0: _commute(_L("X", 1), _KEEP), _L1_R0: _commute(_L("X", 0), _KEEP)})
+add_commute_rules(["CZ"], ["H"], _commute(), {_L0_R0: _commute(_L("CX", "rev")), _L1_R0: _commute(_L("CX"))})
+for rt in ["CX", "CRX"]:
+    add_commute_rules(["CZ"], [rt], _NOT_COMMUTE, {_L0_R0: _commute(), _L1_R0: _commute(), _SAME_PAIR: _commute(rg=_R(rt, negate=True))})
+# 2 QUBIT R GATE COMPARED W/ ALL
+add_commute_rules(["CRZ"], ["RZ", "Z", "CZ", "CRZ"], _commute())
+add_commute_rules(["CRZ"], ["RX"], _NOT_COMMUTE, {_DISJOINT: _commute()})
+# X on the LG control: prepend the same RZ on the target to counter the X
+add_commute_rules(["CRZ"], ["X"], _commute(), {_L0_R0: _commute(_L("RZ", 1, negate=True), _KEEP), _L1_R0: _NOT_COMMUTE})
+add_commute_rules(["CRZ"], ["H"], _commute(), {_L0_R0: _drop(), _L1_R0: _commute(_L("CRX"))}) # TODO check the control case
+add_commute_rules(["CRZ"], ["CX"], _NOT_COMMUTE, {_L0_R0: _commute(), _L1_R0: _commute(), _SAME_PAIR: _commute(_L(negate=True))})
+add_commute_rules(["CRZ"], ["CRX"], _NOT_COMMUTE, {_L0_R0: _commute(), _L1_R0: _commute()}) # NOTE stricter for CRX on the same pair
+
+_QUBIT_SLICE = {None: slice(None), 0: slice(None, 1), 1: slice(1, None), "rev": slice(None, None, -1)}
+
+def _build_from_op(op, lg, rg):
+    source, name, qubits, negate = op
+    g = lg if source == "l" else rg
+    if name is None:
+        name = gate_type(g)
+    params = [-param for param in gate_params(g)] if negate else gate_params(g)
+    return build_gate(name, gate_qubits(g)[_QUBIT_SLICE[qubits]], params)
+
+def gate_overlap(lgqb, rgqb):
+    overlap = 0
+    for i, lq in enumerate(lgqb):
+        for j, rq in enumerate(rgqb):
+            if lq == rq:
+                overlap |= 1 << (2*i + j)
+    return overlap
+
 # This function is a nested for loop. The outer loop iterates over gates in the left block, inner does the same for the right.
-# In each iteration, the current "right" gate in the left block, lg, and the current "left" gate in the right block, rg, 
-#   are checked with a series of if else statements. 
+# In each iteration, the current "right" gate in the left block, lg, and the current "left" gate in the right block, rg,
+#   are looked up in COMMUTE_TABLE by (lg type, rg type, qubit overlap).
+# NOTE the rg type used for the lookup is the type rg had in rblk, even after an earlier lg rewrote it.
 
 # The new rblock contains the gates in the rblock but may be transformed to allow for direct commutation.
 # If commuting cannot happen, the rblock is empty and the function returns immediately.
 
-# cur_check_point vs new_checkpoint is the same as rblk vs new_blk, 
+# cur_check_point vs new_checkpoint is the same as rblk vs new_blk,
 # except the check_points are disjoint subsets that are gradually "extended" into the new_lblock
 def commute_func_right(lblk, rblk): # right to left
     is_commute = False
     if lblk == [] or rblk == []:
         return True, -1, -1, lblk, rblk
-    
+
     new_lblk = [] # the lblk after moving after rblk
     for lgidx, lg in enumerate(reversed(lblk)):
         cur_check_point = [lg]
         new_rblk = []
         for rgidx, rg in enumerate(rblk):
-            rgtype = gate_type(rg)
+            rgop = GATE_OPCODES.get(gate_type(rg))
             new_check_point = []
             new_rg = rg
             for cur_lg in reversed(cur_check_point):
-                lgtype = gate_type(cur_lg)
-                lgqb = gate_qubits(cur_lg)
-                rgqb = gate_qubits(rg)
-                # ONE QUBIT R GATE COMPARED W/ ALL 
-                if lgtype in ["RZ"]:
-                    if rgtype in ["RZ", "Z"]:
-                        is_commute = True
-                        new_check_point.append(cur_lg)
-                        new_rg = (rg) # clone tuple
-                    elif rgtype in ["RX"]:
-                        if lgqb[0] != rgqb[0]:
-                            is_commute = True
-                            new_check_point.append(cur_lg)
-                            new_rg = (rg)
-                    elif rgtype in ["X"]:
-                        is_commute = True
-                        if lgqb[0] == rgqb[0]:
-                            # same RZ gate but flip the angle (-1)
-                            new_check_point.append(build_gate(gate_type(cur_lg), gate_qubits(cur_lg), [-gate_params(cur_lg)[0]]))
-                        else:
-                            new_check_point.append(cur_lg)
-                        new_rg = (rg)
-                    elif rgtype in ["H"]:
-                        is_commute = True
-                        if lgqb[0] == rgqb[0]:
-                            # same params but change basis to RX
-                            new_check_point.append(build_gate("RX", gate_qubits(cur_lg), gate_params(cur_lg)))
-                        else:
-                            new_check_point.append(cur_lg)
-                        new_rg = (rg)
-                    elif rgtype in ["CX", "CRX"]:
-                        is_commute = True
-                        if lgqb[0] not in rgqb:
-                            new_check_point.append(cur_lg)
-                            new_rg = (rg)
-                        else:
-                            if lgqb[0] == rgqb[0]: # on control line
-                                new_check_point.append(cur_lg)
-                                new_rg = (rg)
-                            else:
-                                is_commute = False
-                    elif rgtype in ["CZ","CRZ"]:
-                        is_commute = True
-                        new_check_point.append(cur_lg)
-                        new_rg = (rg)
-                elif lgtype in ["RX"]:
-                    if rgtype in ["RX", "X"]:
-                        is_commute = True
-                        new_check_point.append(cur_lg)
-                        new_rg = (rg)
-                    elif rgtype in ["RZ"]:
-                        is_commute = True
-                        if lgqb[0] == rgqb[0]:
-                            is_commute = False
-                        else:
-                            new_check_point.append(cur_lg)
-                            new_rg = (rg)
-                    elif rgtype in ["Z"]:
-                        is_commute = True
-                        if lgqb[0] == rgqb[0]:
-                            new_check_point.append(build_gate(gate_type(cur_lg), gate_qubits(cur_lg), [-gate_params(cur_lg)[0]]))
-                        else:
-                            new_check_point.append(cur_lg)
-                        new_rg = (rg)
-                    elif rgtype in ["H"]:
-                        is_commute = True
-                        if lgqb[0] == rgqb[0]:
-                            new_check_point.append(build_gate("RZ", gate_qubits(cur_lg), gate_params(cur_lg)))
-                        else:
-                            new_check_point.append(cur_lg)
-                        new_rg = (rg)
-                    elif rgtype in ["CX", "CRX"]:
-                        is_commute = True
-                        if lgqb[0] not in rgqb:
-                            new_check_point.append(cur_lg)
-                            new_rg = (rg)
-                        else:
-                            if lgqb[0] == rgqb[1]: # on target line
-                                new_check_point.append(cur_lg)
-                                new_rg = (rg)
-                            else:
-                                is_commute = False
-                    elif rgtype in ["CZ","CRZ"]:
-                        is_commute = True
-                        if lgqb[0] not in rgqb:
-                            new_check_point.append(cur_lg)
-                            new_rg = (rg)
-                        else:
-                            is_commute = False
-                ### H compared with ALL
-                elif lgtype in ["H"]:
-                    if rgtype in ["RX"]:
-                        is_commute = True
-                        new_check_point.append(cur_lg)
-                        if lgqb[0] == rgqb[0]:
-                            new_rg = (build_gate("RZ", gate_qubits(rg), gate_params(rg)))
-                        else:
-                            new_rg = (rg)
-                    elif rgtype in ["RZ"]:
-                        is_commute = True
-                        new_check_point.append(cur_lg)
-                        if lgqb[0] == rgqb[0]:
-                            new_rg = (build_gate("RX", gate_qubits(rg), gate_params(rg)))
-                        else:
-                            new_rg = (rg)
-                    elif rgtype in ["Z"]:
-                        is_commute = True
-                        new_check_point.append(cur_lg)
-                        if lgqb[0] == rgqb[0]:
-                            new_rg = (build_gate("X", gate_qubits(rg), gate_params(rg)))
-                        else:
-                            new_rg = (rg)
-                    elif rgtype in ["X"]:
-                        is_commute = True
-                        new_check_point.append(cur_lg)
-                        if lgqb[0] == rgqb[0]:
-                            new_rg = (build_gate("Z", gate_qubits(rg), gate_params(rg)))
-                        else:
-                            new_rg = (rg)
-                    elif rgtype in ["H"]:
-                        is_commute = True
-                        new_check_point.append(cur_lg)
-                        new_rg = (rg)
-                    elif rgtype in ["CX", "CRX"]:
-                        is_commute = True
-                        if lgqb[0] not in rgqb:
-                            new_check_point.append(cur_lg)
-                            new_rg = (rg)
-                        else:
-                            if lgqb[0] == rgqb[1]: # on target line
-                                new_check_point.append(cur_lg)
-                                new_rg = (build_gate(rgtype[:-1]+"Z", gate_qubits(rg), gate_params(rg)))
-                            else:
-                                is_commute = False # TODO could commute, current not implemented
-                    elif rgtype in ["CZ","CRZ"]:
-                        is_commute = True
-                        if lgqb[0] not in rgqb:
-                            new_check_point.append(cur_lg)
-                            new_rg = (rg)
-                        else:
-                            if lgqb[0] == rgqb[1]: # on target line
-                                new_check_point.append(cur_lg)
-                                new_rg = (build_gate(rgtype[:-1]+"X", gate_qubits(rg), gate_params(rg)))
-                            else:
-                                is_commute = False # TODO could commute, current not implemented
-                # ONE QUBIT Pauli GATE COMPARED W/ ALL 
-                elif lgtype == "X":
-                    if rgtype in ["RX"]:
-                        is_commute = True
-                        new_check_point.append(cur_lg)
-                        new_rg = (rg)
-                    elif rgtype in ["RZ"]:
-                        is_commute = True
-                        new_check_point.append(cur_lg)
-                        if lgqb[0] == rgqb[0]:
-                            new_rg = (build_gate("RZ", gate_qubits(rg), [-param for param in gate_params(rg)]))
-                        else:
-                            new_rg = (rg)
-                    elif rgtype in ["Z"]: # a global phase
-                        is_commute = True
-                        new_check_point.append(cur_lg)
-                        if lgqb[0] == rgqb[0]:
-                            new_rg = (build_gate("Z", gate_qubits(rg), gate_params(rg)))
-                            # TODO Doesn't this do the same thing as (rg)
-                        else:
-                            new_rg = (rg)
-                    elif rgtype in ["X"]:
-                        is_commute = True
-                        new_check_point.append(cur_lg)
-                        new_rg = (rg)
-                    elif rgtype in ["H"]:
-                        is_commute = True
-                        if lgqb[0] == rgqb[0]:
-                            new_check_point.append(build_gate("Z", gate_qubits(cur_lg), gate_params(cur_lg)))
-                        else:
-                            new_check_point.append(cur_lg)
-                        new_rg = (rg)
-                    elif rgtype in ["CX", "CRX"]:
-                        is_commute = True
-                        if lgqb[0] not in rgqb:
-                            new_check_point.append(cur_lg)
-                            new_rg = (rg)
-                        else:
-                            if lgqb[0] == rgqb[1]: # on target line
-                                new_check_point.append(cur_lg)
-                                new_rg = (rg)
-                            else: # on control line # NOTE Different than the RX case
-                                # add X or RX gate to the target qubit (before the RG) to counter the LG
-                                new_check_point.append(cur_lg)
-                                new_check_point.append(build_gate(rgtype[1:],gate_qubits(rg)[1:],[-param for param in gate_params(rg)]))
-                                new_rg = (rg)
-                    elif rgtype in ["CZ","CRZ"]:
-                        is_commute = True
-                        if lgqb[0] not in rgqb:
-                            new_check_point.append(cur_lg)
-                            new_rg = (rg)
-                        else: # NOTE Different than the RX case (just set is_commute to False)
-                            if lgqb[0] == rgqb[1]: # on target line
-                                new_check_point.append(cur_lg)
-                                if rgtype != "CRZ":
-                                    # Transform X into a Z gate
-                                    new_check_point.append(build_gate(rgtype[1:],gate_qubits(rg)[:1],[-param for param in gate_params(rg)]))
-                                else:
-                                    is_commute = False
-                                new_rg = (rg)
-                            else: # on control line
-                                new_check_point.append(cur_lg)
-                                new_check_point.append(build_gate(rgtype[1:],gate_qubits(rg)[1:],[-param for param in gate_params(rg)]))
-                                new_rg = (rg)                          
-                elif lgtype == "Z":
-                    if rgtype in ["RZ"]:
-                        is_commute = True
-                        new_check_point.append(cur_lg)
-                        new_rg = (rg)
-                    elif rgtype in ["RX"]:
-                        is_commute = True
-                        new_check_point.append(cur_lg)
-                        if lgqb[0] == rgqb[0]:
-                            new_rg = (build_gate("RX", gate_qubits(rg), [-param for param in gate_params(rg)]))
-                        else:
-                            new_rg = (rg)
-                    elif rgtype in ["X"]: # a global phase
-                        is_commute = True
-                        new_check_point.append(cur_lg)
-                        if lgqb[0] == rgqb[0]:
-                            new_rg = (build_gate("X", gate_qubits(rg), gate_params(rg)))
-                        else:
-                            new_rg = (rg)
-                    elif rgtype in ["Z"]:
-                        is_commute = True
-                        new_check_point.append(cur_lg)
-                        new_rg = (rg)
-                    elif rgtype in ["H"]:
-                        is_commute = True
-                        if lgqb[0] == rgqb[0]:
-                            new_check_point.append(build_gate("X", gate_qubits(cur_lg), gate_params(cur_lg)))
-                        else:
-                            new_check_point.append(cur_lg)
-                        new_rg = (rg)
-                    elif rgtype in ["CZ", "CRZ"]:
-                        is_commute = True
-                        new_check_point.append(cur_lg)
-                        new_rg = (rg)
-                    elif rgtype in ["CX","CRX"]:
-                        is_commute = True
-                        if lgqb[0] not in rgqb:
-                            new_check_point.append(cur_lg)
-                            new_rg = (rg)
-                        else:
-                            if lgqb[0] == rgqb[1]: # on target line
-                                new_check_point.append(cur_lg)
-                                if rgtype == "CX":
-                                    new_check_point.append(build_gate("Z",gate_qubits(rg)[:1],[-param for param in gate_params(rg)]))
-                                new_rg = (rg)
-                            else: # on control line
-                                new_check_point.append(cur_lg)
-                                new_rg = (rg)
-                # 2 QUBIT Pauli GATE COMPARED W/ ALL 
-                elif lgtype in ["CX"]:
-                    if rgtype in ["RX"]:
-                        is_commute = True
-                        if rgqb[0] not in lgqb:
-                            new_check_point.append(cur_lg)
-                            new_rg = (rg)
-                        else:
-                            if rgqb[0] == lgqb[1]: # RX Targets the Target
-                                new_check_point.append(cur_lg)
-                                new_rg = (rg)
-                            else:
-                                is_commute = False
-                    elif rgtype in ["RZ"]:
-                        is_commute = True
-                        if rgqb[0] not in lgqb:
-                            new_check_point.append(cur_lg)
-                            new_rg = (rg)
-                        else:
-                            if rgqb[0] == lgqb[0]: # RZ Targets the Control
-                                new_check_point.append(cur_lg)
-                                new_rg = (rg)
-                            else:
-                                is_commute = False
-                    elif rgtype in ["Z"]:
-                        is_commute = True
-                        if rgqb[0] not in lgqb:
-                            new_check_point.append(cur_lg)
-                            new_rg = (rg)
-                        else:
-                            if rgqb[0] == lgqb[0]:
-                                new_check_point.append(cur_lg)
-                                new_rg = (rg)
-                            else:
-                                # Z on the Control before the controlled Op
-                                new_check_point.append(build_gate('Z', lgqb[:1], gate_params(cur_lg)))
-                                new_check_point.append(cur_lg)
-                                new_rg = (rg)
-                    elif rgtype in ["X"]:
-                        is_commute = True
-                        if rgqb[0] not in lgqb:
-                            new_check_point.append(cur_lg)
-                            new_rg = (rg)
-                        else:
-                            if rgqb[0] == lgqb[1]:
-                                new_check_point.append(cur_lg)
-                                new_rg = (rg)
-                            else:
-                                # X on the Target before the controlled Op
-                                new_check_point.append(build_gate('X', lgqb[1:], gate_params(cur_lg)))
-                                new_check_point.append(cur_lg)
-                                new_rg = (rg)
-                    elif rgtype in ["H"]:
-                        is_commute = True
-                        if rgqb[0] not in lgqb:
-                            new_check_point.append(cur_lg)
-                            new_rg = (rg)
-                        else:
-                            if lgqb[1] == rgqb[0]:
-                                # Transforms CX into CZ
-                                new_check_point.append(build_gate("CZ", gate_qubits(cur_lg), gate_params(cur_lg)))
-                                new_rg = (rg)
-                            else:
-                                is_commute = False # not implemented
-                    elif rgtype in ["CX", "CRX"]:
-                        is_commute = True
-                        if lgqb[0] == rgqb[0]:
-                            new_check_point.append(cur_lg)
-                            new_rg = (rg)
-                        elif lgqb[0] == rgqb[1]:
-                            is_commute = False
-                        elif lgqb[1] == rgqb[0]:
-                            is_commute = False
-                        else: # same target or completely different
-                            new_check_point.append(cur_lg)
-                            new_rg = (rg)
-                    elif rgtype in ["CZ","CRZ"]:
-                        is_commute = True
-                        if lgqb[0] == rgqb[0]:
-                            if lgqb[1] != rgqb[1]: # SAME Control DIFF Target
-                                new_check_point.append(cur_lg)
-                                new_rg = (rg)
-                            else:
-                                new_check_point.append(cur_lg) # SAME Control SAME Target: flip RG angles
-                                new_rg = (build_gate(rgtype, rgqb, [-param for param in gate_params(rg)]))
-                        elif lgqb[0] == rgqb[1]: # RG Targets LG's Control
-                            if lgqb[1] != rgqb[0]: # RG Control Diff than LG Target
-                                new_check_point.append(cur_lg) # FINE because the CZ/CRZ won't X the LG state
-                                new_rg = (rg)
-                            else:
-                                new_check_point.append(cur_lg)
-                                new_rg = (build_gate(rgtype, rgqb, [-param for param in gate_params(rg)]))
-                        elif lgqb[1] == rgqb[0]: # LG Targets RG control (X will affect it)
-                            is_commute = False
-                        else:
-                            is_commute = False
-                elif lgtype in ["CZ"]:
-                    if rgtype in ["RZ"]:
-                        is_commute = True
-                        new_check_point.append(cur_lg)
-                        new_rg = (rg)
-                    elif rgtype in ["RX"]:
-                        is_commute = True
-                        if rgqb[0] not in lgqb:
-                            new_check_point.append(cur_lg)
-                            new_rg = (rg)
-                        else:
-                            is_commute = False
-                    elif rgtype in ["X"]:
-                        is_commute = True
-                        if rgqb[0] not in lgqb:
-                            new_check_point.append(cur_lg)
-                            new_rg = (rg)
-                        else:
-                            if rgqb[0] == lgqb[0]:
-                                new_check_point.append(build_gate('X', lgqb[1:], gate_params(cur_lg)))
-                                new_check_point.append(cur_lg)
-                                new_rg = (rg)
-                            else:
-                                new_check_point.append(build_gate('X', lgqb[:1], gate_params(cur_lg)))
-                                new_check_point.append(cur_lg)
-                                new_rg = (rg)
-                    elif rgtype in ["Z"]:
-                        is_commute = True
-                        new_check_point.append(cur_lg)
-                        new_rg = (rg)
-                    elif rgtype in ["H"]:
-                        is_commute = True
-                        if rgqb[0] not in lgqb:
-                            new_check_point.append(cur_lg)
-                            new_rg = (rg)
-                        else:
-                            if lgqb[1] == rgqb[0]:
-                                new_check_point.append(build_gate("CX", gate_qubits(cur_lg), gate_params(cur_lg)))
-                            else:
-                                new_check_point.append(build_gate("CX", gate_qubits(cur_lg)[::-1], gate_params(cur_lg)))
-                            print(f'DEBUG: {new_check_point[-1]}')
-                            new_rg = (rg)
-                    elif rgtype in ["CZ", "CRZ"]:
-                        is_commute = True
-                        new_check_point.append(cur_lg)
-                        new_rg = (rg)
-                    elif rgtype in ["CX","CRX"]:
-                        is_commute = True
-                        if lgqb[0] == rgqb[0]:
-                            if lgqb[1] != rgqb[1]:
-                                new_check_point.append(cur_lg)
-                                new_rg = (rg)
-                            else:
-                                new_check_point.append(cur_lg)
-                                new_rg = (build_gate(rgtype, rgqb, [-param for param in gate_params(rg)]))
-                        elif lgqb[0] == rgqb[1]:
-                            is_commute = False
-                        elif lgqb[1] == rgqb[0]:
-                            if lgqb[0] != rgqb[1]:
-                                new_check_point.append(cur_lg)
-                                new_rg = (rg)
-                            else:
-                                new_check_point.append(cur_lg)
-                                new_rg = (build_gate(rgtype, rgqb, [-param for param in gate_params(rg)]))
-                        else:
-                            is_commute = False
-                # 2 QUBIT R GATE COMPARED W/ ALL 
-                elif lgtype in ["CRZ"]:
-                    if rgtype in ["RZ"]:
-                        is_commute = True
-                        new_check_point.append(cur_lg)
-                        new_rg = (rg)
-                    elif rgtype in ["RX"]:
-                        is_commute = True
-                        if rgqb[0] not in lgqb:
-                            new_check_point.append(cur_lg)
-                            new_rg = (rg)
-                        else:
-                            is_commute = False
-                    elif rgtype in ["X"]:
-                        is_commute = True
-                        if rgqb[0] not in lgqb:
-                            new_check_point.append(cur_lg)
-                            new_rg = (rg)
-                        else:
-                            if rgqb[0] == lgqb[0]: # X targets LG Control: Prepend same RZ on target to counter X
-                                new_check_point.append(build_gate('RZ', lgqb[1:], [-param for param in gate_params(cur_lg)]))
-                                new_check_point.append(cur_lg)
-                                new_rg = (rg)
-                            else:
-                                is_commute = False
-                    elif rgtype in ["Z"]:
-                        is_commute = True
-                        new_check_point.append(cur_lg)
-                        new_rg = (rg)
-                    elif rgtype in ["H"]:
-                        is_commute = True
-                        if rgqb[0] not in lgqb:
-                            new_check_point.append(cur_lg)
-                            new_rg = (rg)
-                        else:
-                            if lgqb[1] == rgqb[0]: # Transform ONLY if H targets LG target
-                                new_check_point.append(build_gate("CRX", gate_qubits(cur_lg), gate_params(cur_lg)))
-                                new_rg = (rg)
-                            else: # o/w all good TODO check this
-                                is_commute = True  
-                    elif rgtype in ["CZ", "CRZ"]:
-                        is_commute = True
-                        new_check_point.append(cur_lg)
-                        new_rg = (rg)
-                    elif rgtype in ["CX"]:
-                        is_commute = True
-                        if lgqb[0] == rgqb[0]:
-                            if lgqb[1] != rgqb[1]: # SAME Control DIFF Target
-                                new_check_point.append(cur_lg)
-                                new_rg = (rg)
-                            else: # SAME Control SAME Target: flip the params for CRZ (LG)
-                                new_check_point.append(build_gate(lgtype, lgqb, [-param for param in gate_params(cur_lg)]))
-                                new_rg = (rg)
-                        elif lgqb[0] == rgqb[1]: # CX (RG) Targets the LG Control
-                            is_commute = False
-                        elif lgqb[1] == rgqb[0]: # LG Targets the CX (RG) Control
-                            if lgqb[0] != rgqb[1]: 
-                                new_check_point.append(cur_lg)
-                                new_rg = (rg)
-                            else: # CX (RG) Targets the LG Control
-                                is_commute = False
-                        else:
-                            is_commute = False
-                    elif rgtype in ["CRX"]:
-                        is_commute = True
-                        if lgqb[0] == rgqb[0]:
-                            if lgqb[1] != rgqb[1]:
-                                new_check_point.append(cur_lg)
-                                new_rg = (rg)
-                            else: # NOTE STRICTER for CRX if SAME Control and SAME Target
-                                is_commute = False
-                        elif lgqb[0] == rgqb[1]:
-                            is_commute = False
-                        elif lgqb[1] == rgqb[0]:
-                            if lgqb[0] != rgqb[1]:
-                                new_check_point.append(cur_lg)
-                                new_rg = (rg)
-                            else:
-                                is_commute = False
-                        else:
-                            is_commute = False
-                    else: # TODO not implemented
-                        pass
+                rule = COMMUTE_TABLE.get((GATE_OPCODES.get(gate_type(cur_lg)), rgop, gate_overlap(cur_lg[1], rg[1])))
+                if rule is not None:
+                    is_commute, lg_ops, rg_op = rule
+                    for op in lg_ops:
+                        new_check_point.append(cur_lg if op is _KEEP else _build_from_op(op, cur_lg, rg))
+                    if rg_op is not None:
+                        new_rg = _build_from_op(rg_op, cur_lg, rg)
                 if is_commute == False:
                     return False, lgidx, rgidx, [], []
                 else:
@@ -542,4 +174,4 @@ def commute_func_right(lblk, rblk): # right to left
         rblk = new_rblk
         new_lblk.extend(remove_repeated_gates(new_check_point))
     new_lblk = new_lblk[::-1] ## REVERSES ARRAY (not in-place)
-    return True, -1, -1, new_lblk, new_rblk
\ No newline at end of file
+    return True, -1, -1, new_lblk, new_rblk
@@ -0,0 +1,103 @@
+'''Time sliced qubit mapping: the gate list is cut into segments, each with its own qubit -> node mapping, and qubits
+whose node changes between two segments are teleported there (one EPR pair each). The whole plan, migrations
+included, is one assigned block list timed by comm_schedule, and a segment only switches to a new mapping when that
+lowers the epr_cnt of the plan without raising its latency.
+'''
+from autocomm_v1.autocomm import full_autocomm, comm_schedule, DEFAULT_LATENCY_METRIC
+from qubit_partition import OEE
+from utils.qubit_node_map import QubitNodeMap
+
+# The plan runs on location qubits: each qubit gets a new one on every migration, placed on the node it moves to, so
+# the plan has a single location -> node mapping. locations[q] is the current location of qubit q.
+def relabel_gates(gates, locations):
+    return [[g[0], [locations[q] for q in g[1]]] + g[2:] for g in gates]
+
+# Migration block of comm_schedule (kind 2): teleport location source to target_node, then SWAP (3 CX) it into the
+# data qubit of location dest there.
+def migration_block(source, dest, target_node):
+    return [[[source, target_node], 2], [["CX", [source, dest], [], 1], ["CX", [dest, source], [], 1], ["CX", [source, dest], [], 1]]]
+
+# Migration blocks moving the qubits of migrations [(qubit, from node, to node)] to new locations.
+# location_nodes and locations are extended / updated in place.
+def migration_blocks(migrations, locations, location_nodes):
+    blocks = []
+    for q, _, to_node in migrations:
+        location_nodes.append(to_node)
+        blocks.append(migration_block(locations[q], len(location_nodes) - 1, to_node))
+        locations[q] = len(location_nodes) - 1
+    return blocks
+
+# Latency of the migrations [(qubit, from node, to node)] alone, timed by comm_schedule: a teleport takes a comm qubit
+# on both nodes, so a node runs at most comm_qubit_cnt of them at once.
+def migration_latency(migrations, node_count, latency_metric=None, comm_qubit_cnt=2):
+    if not migrations:
+        return 0
+    location_nodes = list(range(node_count)) # one unused location per node, the plan needs no data qubits here
+    locations = {}
+    for q, from_node, _ in migrations:
+        locations[q] = len(location_nodes)
+        location_nodes.append(from_node)
+    blocks = migration_blocks(migrations, locations, location_nodes)
+    _, latency, _ = comm_schedule(blocks, location_nodes, latency_metric, refine_iter_cnt=0, comm_qubit_cnt=comm_qubit_cnt)
+    return latency
+
+# segment_size: gates per decision window. Each window is repartitioned by OEE starting from the current mapping, with
+# the node sizes of qubit_node_mapping. Both choices are scored by comm_schedule on the plan so far (each earlier
+# window compiled alone by full_autocomm) followed by the window, after its migrations for a new mapping; the new
+# mapping is taken if it has fewer EPR pairs and no higher latency.
+# Consecutive windows that keep a mapping are then compiled together, so the plan only loses merges at the points
+# where qubits migrate, and the plan is scored once more as a whole.
+# RETURNS: segments [{"start", "end", "mapping", "migrations" (done before the segment), "epr_cnt" (migrations
+# included)}], epr_cnt, all_latency of the plan
+def dynamic_autocomm(gate_list, qubit_node_mapping, segment_size=200, refine_iter_cnt=3, comm_qubit_cnt=2, verbose=False):
+    qubit_node_mapping = QubitNodeMap.from_mapping(qubit_node_mapping)
+    num_q = qubit_node_mapping.num_qubits
+    node_count = qubit_node_mapping.num_nodes
+    node_capacity = qubit_node_mapping.node_counts.tolist()
+    cur = qubit_node_mapping.to_list()
+
+    def compile_gates(gates, locations, location_nodes):
+        block_list, epr_cnt, _ = full_autocomm(relabel_gates(gates, locations), location_nodes, refine_iter_cnt=refine_iter_cnt, \
+                                               comm_qubit_cnt=comm_qubit_cnt)
+        return block_list, epr_cnt
+
+    def score(block_list, location_nodes): # RETURNS: epr_cnt, all_latency
+        epr_cnt, all_latency, _ = comm_schedule(block_list, location_nodes, refine_iter_cnt=0, comm_qubit_cnt=comm_qubit_cnt)
+        return epr_cnt, all_latency
+
+    locations = list(range(num_q))
+    location_nodes = list(cur)
+    plan = [] # the windows so far, each compiled alone
+    segments = [{"start": 0, "end": 0, "mapping": cur, "migrations": [], "locations": list(locations), "blocks": []}]
+    for start in range(0, len(gate_list), segment_size):
+        end = min(start + segment_size, len(gate_list))
+        window = gate_list[start:end]
+        stay_blocks, _ = compile_gates(window, locations, location_nodes)
+        if start > 0: # the first window runs on qubit_node_mapping
+            qubit_to_node, _ = OEE(window, node_count, node_capacity=node_capacity, num_qubits=num_q, initial=cur)
+            new = [qubit_to_node[q] for q in range(num_q)]
+            moves = [(q, cur[q], new[q]) for q in range(num_q) if new[q] != cur[q]]
+            if moves:
+                new_locations, new_location_nodes = list(locations), list(location_nodes)
+                move_blocks = migration_blocks(moves, new_locations, new_location_nodes)
+                window_blocks, _ = compile_gates(window, new_locations, new_location_nodes)
+                stay_cost = score(plan + stay_blocks, location_nodes)
+                move_cost = score(plan + move_blocks + window_blocks, new_location_nodes)
+                if move_cost[0] < stay_cost[0] and move_cost[1] <= stay_cost[1]:
+                    if verbose:
+                        print(f"gates {start}-{end}: {len(moves)} migrations, plan epr_cnt, latency {stay_cost} -> {move_cost}")
+                    cur = new
+                    locations, location_nodes = new_locations, new_location_nodes
+                    stay_blocks = move_blocks + window_blocks
+                    segments.append({"start": start, "end": start, "mapping": cur, "migrations": moves, \
+                                     "locations": list(locations), "blocks": move_blocks})
+        plan += stay_blocks
+        segments[-1]["end"] = end
+
+    plan = []
+    for segment in segments:
+        block_list, epr_cnt = compile_gates(gate_list[segment["start"]:segment["end"]], segment.pop("locations"), location_nodes)
+        plan += segment.pop("blocks") + block_list
+        segment["epr_cnt"] = epr_cnt + len(segment["migrations"])
+    epr_total, latency_total = score(plan, location_nodes)
+    return segments, epr_total, latency_total
@@ -1,21 +1,40 @@
 import random
+import numpy as np
 from numpy import pi
-from autocomm_v1.gate_util import build_H_gate, build_CX_gate, build_RZ_gate, build_toffoli_gate
+from autocomm_v1.gate_util import build_H_gate, build_CX_gate, build_RZ_gate, build_toffoli_gate, GateArray
 from autocomm_v1.autocomm import comm_aggregate, comm_assign, comm_schedule, full_autocomm
 
-def run_experiment(circuit_func, num_q=100, qb_per_node=10, refine_iter_cnt=3, verbose=False, do_full=False):
+# qubits filled into nodes in order; qb_per_node is one capacity for all nodes or a list of node capacities
+def fill_nodes(num_qubits, qb_per_node):
+    if type(qb_per_node) is int:
+        return [i//qb_per_node for i in range(num_qubits)]
+    qubit_node_mapping = [node for node, cap in enumerate(qb_per_node) for _ in range(cap)]
+    if len(qubit_node_mapping) < num_qubits:
+        raise ValueError(f"{num_qubits} qubits do not fit node capacities {qb_per_node}")
+    return qubit_node_mapping[:num_qubits]
+
+def run_experiment(circuit_func, num_q=100, qb_per_node=10, refine_iter_cnt=3, verbose=False, do_full=False, use_gate_array=False, comm_qubit_cnt=2, list_schedule=False, \
+                   epr_prefetch=None, epr_rate=None, topology=None):
     gate_list, qubit_node_mapping = circuit_func(num_q, qb_per_node)
+    if use_gate_array:
+        gate_list = GateArray.from_gate_list(gate_list)
     
     if do_full:
         _, epr_cnt, all_latency = full_autocomm(gate_list=gate_list, \
                                                          qubit_node_mapping=qubit_node_mapping, \
                                                          refine_iter_cnt=refine_iter_cnt, \
-                                                         verbose=verbose)
+                                                         verbose=verbose, \
+                                                         comm_qubit_cnt=comm_qubit_cnt, \
+                                                         list_schedule=list_schedule, \
+                                                         epr_prefetch=epr_prefetch, \
+                                                         epr_rate=epr_rate, \
+                                                         topology=topology)
 
     g_list = comm_aggregate(gate_list, qubit_node_mapping, refine_iter_cnt=refine_iter_cnt)
     assigned_gate_block_list = comm_assign(g_list, qubit_node_mapping)
     
-    epr_cnt, all_latency, assigned_gate_block_list1 = comm_schedule(assigned_gate_block_list, qubit_node_mapping, refine_iter_cnt=num_q//qb_per_node)
+    schedule_iter_cnt = None if refine_iter_cnt is None else len(set(qubit_node_mapping)) # one per node
+    epr_cnt, all_latency, assigned_gate_block_list1 = comm_schedule(assigned_gate_block_list, qubit_node_mapping, refine_iter_cnt=schedule_iter_cnt, comm_qubit_cnt=comm_qubit_cnt, list_schedule=list_schedule, epr_prefetch=epr_prefetch, epr_rate=epr_rate, topology=topology)
     
     if verbose:
         print(epr_cnt, all_latency)
@@ -26,7 +45,7 @@ class CircuitGen:
         gate_list = []
         for i in range(num_qubits-1):
             gate_list.append(build_CX_gate(0, i+1))
-        qubit_node_mapping = [i//qb_per_node for i in range(num_qubits)] # optimal mapping obtained
+        qubit_node_mapping = fill_nodes(num_qubits, qb_per_node) # optimal mapping obtained
         return gate_list, qubit_node_mapping
 
     def QFT(num_qubits, qb_per_node):
@@ -38,9 +57,28 @@ class CircuitGen:
                 gate_list.append(build_RZ_gate(i,angle=-pi/4/2**(j-i)))
                 gate_list.append(build_CX_gate(j,i))
                 gate_list.append(build_RZ_gate(i,angle=pi/4/2**(j-i)))
-        qubit_node_mapping = [i//qb_per_node for i in range(num_qubits)] # optimal mapping obtained
+        qubit_node_mapping = fill_nodes(num_qubits, qb_per_node) # optimal mapping obtained
         return gate_list, qubit_node_mapping
 
+    def QFT_array(num_qubits, qb_per_node):
+        # same circuit as QFT, built directly as a GateArray
+        names, q0, q1, param, has_param = [], [], [], [], []
+        for i in range(num_qubits-1):
+            js = np.arange(i+1, num_qubits)
+            angles = np.ldexp(pi/4, -(js-i)) # pi/4/2**(j-i)
+            names += ["H"] + ["CX", "RZ", "CX", "RZ"]*len(js)
+            q0.append([i])
+            q0.append(np.stack([js, np.full_like(js, i), js, np.full_like(js, i)], axis=1).ravel())
+            q1.append([-1])
+            q1.append(np.stack([np.full_like(js, i), np.full_like(js, -1), np.full_like(js, i), np.full_like(js, -1)], axis=1).ravel())
+            param.append([0.0])
+            param.append(np.stack([np.zeros(len(js)), -angles, np.zeros(len(js)), angles], axis=1).ravel())
+            has_param.append([False])
+            has_param.append(np.tile([False, True, False, True], len(js)))
+        gate_array = GateArray.from_columns(names, np.concatenate(q0), np.concatenate(q1), \
+                                            np.concatenate(param), np.concatenate(has_param))
+        qubit_node_mapping = fill_nodes(num_qubits, qb_per_node)
+        return gate_array, qubit_node_mapping
 
     def QAOA(num_qubits, qb_per_node, num_terms=200):
         gate_list = []
@@ -49,7 +87,7 @@ class CircuitGen:
             gate_list.append(build_CX_gate(qa,qb))
             gate_list.append(build_RZ_gate(qb,angle=0.1))
             gate_list.append(build_CX_gate(qa,qb))
-        qubit_node_mapping = [i//qb_per_node for i in range(num_qubits)]
+        qubit_node_mapping = fill_nodes(num_qubits, qb_per_node)
         return gate_list, qubit_node_mapping
 
     
@@ -70,5 +108,5 @@ class CircuitGen:
             gate_list.append(build_CX_gate(qc,qa))
             gate_list.append(build_CX_gate(qa,qb))
             start_qb -= 2
-        qubit_node_mapping = [i//qb_per_node for i in range(num_qubits)] # the optimal one
+        qubit_node_mapping = fill_nodes(num_qubits, qb_per_node) # the optimal one
         return gate_list, qubit_node_mapping
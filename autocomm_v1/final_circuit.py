@@ -1,6 +1,7 @@
+import numpy as np
 from autocomm_v1.gate_util import build_CX_gate, build_H_gate
 from autocomm_v1.gate_util import build_M_gate, build_classical_CX_gate, build_classical_CZ_gate
-from utils.util import reverse_map
+from utils.qubit_node_map import QubitNodeMap
 
 def gate_map_qubits(gate, mapping):
     new_qubits = [mapping(q) for q in gate[1]]
@@ -8,14 +9,26 @@ def gate_map_qubits(gate, mapping):
     new_gate[1] = new_qubits
     return new_gate
 
-def auto_to_circ(auto_gates, qubit_to_node):
-    node_to_qubits = reverse_map(qubit_to_node)
-    q_per_node = max([len(v) for k, v in node_to_qubits.items()])
+# Physical qubit numbering: each node gets a section of node_capacity[n]+1 qubits, the 0th one is its comm qubit.
+# node_capacity defaults to the number of qubits mapped to each node.
+# RETURNS: physical index of each logical qubit, physical index of each node's comm qubit
+def physical_qubit_layout(qubit_to_node, node_capacity=None):
+    qubit_to_node = QubitNodeMap.from_mapping(qubit_to_node)
+    node_size = qubit_to_node.node_counts
+    if node_capacity is None:
+        node_capacity = node_size
+    node_capacity = np.asarray(node_capacity, dtype=np.int64)
+    if len(node_capacity) < len(node_size) or np.any(node_size > node_capacity[:len(node_size)]):
+        raise ValueError(f"node sizes {node_size.tolist()} do not fit node capacities {node_capacity.tolist()}")
+    node_offset = np.zeros(len(node_capacity), dtype=np.int64)
+    np.cumsum(node_capacity[:-1] + 1, out=node_offset[1:])
+    physical = node_offset[qubit_to_node.node_of] + qubit_to_node.position + 1
+    return physical.tolist(), node_offset.tolist()
 
-    # the 0th qubit in each section of qubits will be the comm qubit
-    qubit_position = {q: node_to_qubits[n].index(q) for q, n in qubit_to_node.items()}
-    new_qubit_map = lambda q: qubit_to_node[q]*q_per_node + qubit_position[q] + 1
-    # i.e. [0,n] will refer to the 1st n+1 qubits (assigned to node 0). 
+def auto_to_circ(auto_gates, qubit_to_node, node_capacity=None):
+    qubit_to_node = QubitNodeMap.from_mapping(qubit_to_node)
+    physical, node_offset = physical_qubit_layout(qubit_to_node, node_capacity)
+    new_qubit_map = lambda q: physical[q]
 
     circ = []
 
@@ -30,7 +43,7 @@ def auto_to_circ(auto_gates, qubit_to_node):
             gates = row[1]
 
             if not do_tp:
-                comm_init, comm_final = cat_comm(new_qubit_map(qubit), qubit_to_node[qubit]*q_per_node, nodes[0]*q_per_node)
+                comm_init, comm_final = cat_comm(new_qubit_map(qubit), node_offset[qubit_to_node[qubit]], node_offset[nodes[0]])
                 circ.extend(comm_init)
             
             curr_node = -1
@@ -42,11 +55,11 @@ def auto_to_circ(auto_gates, qubit_to_node):
                     targ_qubit = qubits[0] if qubits[1] == qubit else qubits[1]
 
                 if do_tp and curr_node != qubit_to_node[targ_qubit]:
-                    circ.extend(tp_comm(new_qubit_map(qubit), qubit_to_node[qubit]*q_per_node, qubit_to_node[targ_qubit]*q_per_node))
+                    circ.extend(tp_comm(new_qubit_map(qubit), node_offset[qubit_to_node[qubit]], node_offset[qubit_to_node[targ_qubit]]))
 
-                    start_comm = qubit_to_node[qubit]*q_per_node if curr_node == -1 else start_comm
+                    start_comm = node_offset[qubit_to_node[qubit]] if curr_node == -1 else start_comm
                     curr_node = qubit_to_node[targ_qubit]
-                    end_comm = qubit_to_node[targ_qubit]*q_per_node
+                    end_comm = node_offset[qubit_to_node[targ_qubit]]
                 
                 circ.append(gate_map_qubits(gate, new_qubit_map))
             
@@ -0,0 +1,173 @@
+'''Columnar gate store: the array-backed counterpart of the [name, qubits, params, global_phase] gate lists.
+Each gate is one row: an integer opcode, two int32 qubit columns (q1 is -1 for single qubit gates),
+one parameter column and one global phase column.
+'''
+import numpy as np
+
+# integer opcodes shared by the gate store and the commutation table
+GATE_NAMES = ["H", "X", "Z", "RX", "RZ", "CX", "CZ", "CRX", "CRZ", "M", "class-CX", "class-CZ"]
+GATE_OPCODES = {name: op for op, name in enumerate(GATE_NAMES)}
+
+def gate_opcode(name):
+    op = GATE_OPCODES.get(name)
+    if op is None:
+        raise ValueError(f"GateArray has no opcode for gate {name!r}, known gates: {GATE_NAMES}")
+    return op
+
+def _value_column(values):
+    # float64 unless some value is complex (the T/S builders use imaginary angles)
+    if any(type(v) is complex or isinstance(v, np.complexfloating) for v in values):
+        return np.array(values, dtype=np.complex128)
+    return np.array(values, dtype=np.float64)
+
+class GateArray:
+    def __init__(self, opcode, q0, q1, param, has_param, global_phase):
+        self.opcode = np.asarray(opcode, dtype=np.int16)
+        self.q0 = np.asarray(q0, dtype=np.int32)
+        self.q1 = np.asarray(q1, dtype=np.int32)
+        self.param = np.asarray(param)
+        self.has_param = np.asarray(has_param, dtype=bool)
+        self.global_phase = np.asarray(global_phase)
+
+    @classmethod
+    def from_gate_list(cls, gate_list):
+        if isinstance(gate_list, GateArray):
+            return gate_list
+        n_gate = len(gate_list)
+        opcode = np.fromiter((gate_opcode(g[0]) for g in gate_list), dtype=np.int16, count=n_gate)
+        q0 = np.empty(n_gate, dtype=np.int32)
+        q1 = np.full(n_gate, -1, dtype=np.int32)
+        has_param = np.zeros(n_gate, dtype=bool)
+        params = []
+        phases = []
+        for gidx, g in enumerate(gate_list):
+            qubits = g[1]
+            if len(qubits) > 2:
+                raise ValueError(f"GateArray only stores 1 and 2 qubit gates, got {g}")
+            q0[gidx] = qubits[0]
+            if len(qubits) == 2:
+                q1[gidx] = qubits[1]
+            gparams = g[2] if len(g) > 2 else []
+            if len(gparams) > 1:
+                raise ValueError(f"GateArray stores at most one parameter per gate, got {g}")
+            if len(gparams) == 1:
+                has_param[gidx] = True
+                params.append(gparams[0])
+            else:
+                params.append(0.0)
+            phases.append(g[3] if len(g) > 3 else 1)
+        return cls(opcode, q0, q1, _value_column(params), has_param, _value_column(phases))
+
+    @classmethod
+    def from_columns(cls, names, q0, q1=None, param=None, has_param=None, global_phase=None):
+        # bulk constructor for generators that already work on columns
+        n_gate = len(q0)
+        opcode = np.fromiter((gate_opcode(name) for name in names), dtype=np.int16, count=n_gate)
+        if q1 is None:
+            q1 = np.full(n_gate, -1, dtype=np.int32)
+        if param is None:
+            param = np.zeros(n_gate)
+            has_param = np.zeros(n_gate, dtype=bool)
+        elif has_param is None:
+            has_param = np.ones(n_gate, dtype=bool)
+        if global_phase is None:
+            global_phase = np.ones(n_gate)
+        return cls(opcode, q0, q1, param, has_param, global_phase)
+
+    def __len__(self):
+        return len(self.opcode)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice) or isinstance(idx, np.ndarray):
+            return GateArray(self.opcode[idx], self.q0[idx], self.q1[idx], self.param[idx], \
+                             self.has_param[idx], self.global_phase[idx])
+        q1 = int(self.q1[idx])
+        qubits = [int(self.q0[idx])] if q1 < 0 else [int(self.q0[idx]), q1]
+        params = [self.param[idx].item()] if self.has_param[idx] else []
+        return [GATE_NAMES[self.opcode[idx]], qubits, params, self.global_phase[idx].item()]
+
+    def __iter__(self):
+        return iter(self.to_gate_list())
+
+    def __eq__(self, other):
+        if not isinstance(other, GateArray):
+            return NotImplemented
+        return len(self) == len(other) and all(np.array_equal(getattr(self, col), getattr(other, col)) \
+            for col in ["opcode", "q0", "q1", "param", "has_param", "global_phase"])
+
+    @property
+    def num_qubits(self):
+        if len(self) == 0:
+            return 0
+        return int(max(self.q0.max(), self.q1.max())) + 1
+
+    def qubit_columns(self):
+        # plain int lists, cheaper than numpy scalars for per-gate python loops
+        return self.q0.tolist(), self.q1.tolist()
+
+    def to_gate_list(self):
+        names = [GATE_NAMES[op] for op in self.opcode.tolist()]
+        return [[name, [a] if b < 0 else [a, b], [p] if has_p else [], phase] \
+                for name, a, b, p, has_p, phase in zip(names, self.q0.tolist(), self.q1.tolist(), \
+                    self.param.tolist(), self.has_param.tolist(), self.global_phase.tolist())]
+
+    @staticmethod
+    def concat(arrays):
+        return GateArray(*[np.concatenate([getattr(a, col) for a in arrays]) \
+            for col in ["opcode", "q0", "q1", "param", "has_param", "global_phase"]])
+
+def gate_qubit_columns(gate_list):
+    # (q0, q1) int lists for either gate representation, q1 is -1 for single qubit gates
+    if isinstance(gate_list, GateArray):
+        return gate_list.qubit_columns()
+    q0 = [g[1][0] for g in gate_list]
+    q1 = [g[1][1] if len(g[1]) > 1 else -1 for g in gate_list]
+    return q0, q1
+
+def crz_merge_array(gates):
+    # array version of gate_util.crz_merge: CX(a,b) RZ(b,t) CX(a,b) -> CRZ(a,b,-2t) RZ(b,t),
+    # then drop adjacent RZ pairs that cancel (and, like the list version, the final gate)
+    n_gate = len(gates)
+    op, q0, q1 = gates.opcode, gates.q0, gates.q1
+    CX, RZ = GATE_OPCODES["CX"], GATE_OPCODES["RZ"]
+    if n_gate >= 3:
+        cand = (op[:-2] == CX) & (op[1:-1] == RZ) & (q1[1:-1] < 0) & (q0[1:-1] == q1[:-2]) \
+            & (op[2:] == CX) & (q0[2:] == q0[:-2]) & (q1[2:] == q1[:-2])
+        cand_idx = np.flatnonzero(cand).tolist()
+    else:
+        cand_idx = []
+    merged = []
+    last = -3
+    for gidx in cand_idx:
+        if gidx >= last + 3: # gidx+1 and gidx+2 of a taken match are deleted
+            merged.append(gidx)
+            last = gidx
+    keep = np.ones(n_gate, dtype=bool)
+    if merged:
+        merged = np.array(merged)
+        keep[merged + 2] = False
+        # the CX becomes a CRZ and the RZ keeps its angle but loses its global phase
+        opcode, param = gates.opcode.copy(), gates.param.copy()
+        has_param, global_phase = gates.has_param.copy(), gates.global_phase.copy()
+        opcode[merged] = GATE_OPCODES["CRZ"]
+        param[merged] = -2*gates.param[merged + 1]
+        has_param[merged] = True
+        global_phase[merged] = 1
+        global_phase[merged + 1] = 1
+        gates = GateArray(opcode, gates.q0, gates.q1, param, has_param, global_phase)
+    gates = gates[keep]
+
+    n_gate = len(gates)
+    if n_gate < 2:
+        return gates[:0]
+    op, q0, param = gates.opcode, gates.q0, gates.param
+    cand = (op[:-1] == RZ) & (op[1:] == RZ) & (gates.q1[:-1] < 0) & (gates.q1[1:] < 0) \
+        & (q0[:-1] == q0[1:]) & np.isclose(param[:-1], -param[1:])
+    keep = np.ones(n_gate, dtype=bool)
+    keep[-1] = False
+    last = -2
+    for gidx in np.flatnonzero(cand).tolist():
+        if gidx >= last + 2:
+            keep[gidx] = keep[gidx + 1] = False
+            last = gidx
+    return gates[keep]
@@ -1,6 +1,7 @@
 '''g_list: a list of gates
 '''
 import numpy as np
+from autocomm_v1.gate_array import GATE_NAMES, GATE_OPCODES, gate_opcode, GateArray, gate_qubit_columns, crz_merge_array
 
 def gate_list_to_layer(g_list):
     num_q_slot = max([max(g[1]) for g in g_list]) + 1
@@ -90,6 +91,8 @@ def build_toffoli_gate(qa, qb, qc):
     return gate_list
 
 def crz_merge(g_list):
+    if isinstance(g_list, GateArray):
+        return crz_merge_array(g_list)
     layer_list = [[g] for g in g_list] # gate_list_to_layer(g_list)
     layer_qb_dict_list = []
     layer_qb_dict_list_control = []
@@ -0,0 +1,159 @@
+'''Local search over qubit -> node mappings, driven by the EPR count of full_autocomm rather than the edge cut.
+Candidate swaps are scored with a surrogate of the aggregated communication cost that is updated incrementally:
+only the gate sequences of the swapped qubits and of their partners are looked at again.
+The surrogate is confirmed against a full recompile every confirm_every accepted swaps.
+'''
+from autocomm_v1.gate_array import gate_qubit_columns
+from autocomm_v1.autocomm import full_autocomm
+
+# Surrogate cost: along the two qubit gates of each qubit, a run is a maximal stretch of gates whose partners all sit
+# on the same remote node (one cat-comm block could carry it). A remote gate costs 1/L, L being the longer of the
+# runs it is part of on its two qubits, so a run of L gates served from one side costs about one EPR pair.
+class RunCost:
+    def __init__(self, gate_list, qubit_node_mapping):
+        q0, q1 = gate_qubit_columns(gate_list)
+        self.node_of = list(qubit_node_mapping)
+        num_q = len(self.node_of)
+        self.ends = [] # (a, b) of each two qubit gate
+        self.seq = [[] for _ in range(num_q)] # per qubit: (partner, gate) in circuit order
+        self.pos = [] # (position in seq[a], position in seq[b]) of each two qubit gate
+        for a, b in zip(q0, q1):
+            if b < 0 or a == b:
+                continue
+            g = len(self.ends)
+            self.ends.append((a, b))
+            self.pos.append((len(self.seq[a]), len(self.seq[b])))
+            self.seq[a].append((b, g))
+            self.seq[b].append((a, g))
+        self.partners = [set(p for p, _ in s) for s in self.seq]
+        self.run_len = [self._runs(q, self.node_of) for q in range(num_q)]
+        self.cost = sum(self._gate_cost(g, self.node_of, self.run_len) for g in range(len(self.ends)))
+
+    def _runs(self, q, node_of):
+        # length of the remote run each gate of q is in, 0 for local gates
+        labels = [node_of[p] for p, _ in self.seq[q]]
+        own = node_of[q]
+        lens = [0] * len(labels)
+        i = 0
+        while i < len(labels):
+            if labels[i] == own:
+                i += 1
+                continue
+            j = i
+            while j < len(labels) and labels[j] == labels[i]:
+                j += 1
+            for k in range(i, j):
+                lens[k] = j - i
+            i = j
+        return lens
+
+    def _gate_cost(self, g, node_of, run_len):
+        a, b = self.ends[g]
+        if node_of[a] == node_of[b]:
+            return 0
+        pa, pb = self.pos[g]
+        return 1 / max(run_len[a][pa], run_len[b][pb])
+
+    def swap_delta(self, x, y):
+        # cost change of swapping the nodes of x and y, with the new runs of the qubits it touches
+        node_of = self.node_of
+        new_node_of = _SwappedNodes(node_of, x, y)
+        touched = self.partners[x] | self.partners[y] | {x, y}
+        new_run_len = {q: self._runs(q, new_node_of) for q in touched}
+        run_len = _RunOverlay(self.run_len, new_run_len)
+        gates = set(g for q in touched for _, g in self.seq[q])
+        delta = sum(self._gate_cost(g, new_node_of, run_len) - self._gate_cost(g, node_of, self.run_len) for g in gates)
+        return delta, new_run_len
+
+    def apply_swap(self, x, y, new_run_len, delta):
+        self.node_of[x], self.node_of[y] = self.node_of[y], self.node_of[x]
+        for q, lens in new_run_len.items():
+            self.run_len[q] = lens
+        self.cost += delta
+
+class _SwappedNodes:
+    def __init__(self, node_of, x, y):
+        self.node_of, self.x, self.y = node_of, x, y
+
+    def __getitem__(self, q):
+        if q == self.x:
+            return self.node_of[self.y]
+        if q == self.y:
+            return self.node_of[self.x]
+        return self.node_of[q]
+
+class _RunOverlay:
+    def __init__(self, run_len, new_run_len):
+        self.run_len, self.new_run_len = run_len, new_run_len
+
+    def __getitem__(self, q):
+        lens = self.new_run_len.get(q)
+        return self.run_len[q] if lens is None else lens
+
+# Hill climbing on the surrogate: qubits are visited by their remote cost, each one tries the node it talks to most
+# and swaps with the `candidates` qubits there that are least tied to it; the first swap lowering the surrogate is kept.
+# Every confirm_every accepted swaps the mapping is recompiled; if the real epr_cnt went up, those swaps are undone
+# and the search stops. Node sizes never change.
+# RETURNS: best qubit_node_mapping (list), its epr_cnt
+def refine_mapping(gate_list, qubit_node_mapping, refine_iter_cnt=3, max_swaps=200, confirm_every=20, candidates=4, verbose=False):
+    qubit_node_mapping = list(qubit_node_mapping)
+    _, best_epr_cnt, _ = full_autocomm(gate_list, qubit_node_mapping, refine_iter_cnt=refine_iter_cnt)
+    best_mapping = list(qubit_node_mapping)
+    cost = RunCost(gate_list, qubit_node_mapping)
+    num_q = len(qubit_node_mapping)
+    node_count = max(qubit_node_mapping) + 1
+
+    swaps = 0
+    pending = 0
+    improved = True
+    while improved and swaps < max_swaps:
+        improved = False
+        node_qubits = [[] for _ in range(node_count)]
+        for q in range(num_q):
+            node_qubits[cost.node_of[q]].append(q)
+        remote = [[0] * node_count for _ in range(num_q)] # remote[q][n]: gates of q with partners on node n
+        for q in range(num_q):
+            for p, _ in cost.seq[q]:
+                remote[q][cost.node_of[p]] += 1
+        order = sorted(range(num_q), key=lambda q: remote[q][cost.node_of[q]] - len(cost.seq[q]))
+        for x in order:
+            if swaps >= max_swaps:
+                break
+            nx = cost.node_of[x]
+            target = max(range(node_count), key=lambda n: -1 if n == nx else remote[x][n])
+            if target == nx or remote[x][target] <= remote[x][nx]:
+                continue
+            ys = sorted(node_qubits[target], key=lambda y: remote[y][target] - remote[y][nx])[:candidates]
+            for y in ys:
+                delta, new_run_len = cost.swap_delta(x, y)
+                if delta < -1e-9:
+                    cost.apply_swap(x, y, new_run_len, delta)
+                    node_qubits[nx][node_qubits[nx].index(x)] = y
+                    node_qubits[target][node_qubits[target].index(y)] = x
+                    for p, _ in cost.seq[x]:
+                        remote[p][nx] -= 1
+                        remote[p][target] += 1
+                    for p, _ in cost.seq[y]:
+                        remote[p][target] -= 1
+                        remote[p][nx] += 1
+                    swaps += 1
+                    pending += 1
+                    improved = True
+                    break
+            if pending >= confirm_every:
+                pending = 0
+                _, epr_cnt, _ = full_autocomm(gate_list, cost.node_of, refine_iter_cnt=refine_iter_cnt)
+                if verbose:
+                    print(f"swaps {swaps}: surrogate {cost.cost:.1f}, epr_cnt {epr_cnt} (best {best_epr_cnt})")
+                if epr_cnt > best_epr_cnt:
+                    return best_mapping, best_epr_cnt
+                if epr_cnt < best_epr_cnt:
+                    best_epr_cnt = epr_cnt
+                    best_mapping = list(cost.node_of)
+
+    if pending:
+        _, epr_cnt, _ = full_autocomm(gate_list, cost.node_of, refine_iter_cnt=refine_iter_cnt)
+        if epr_cnt < best_epr_cnt:
+            best_epr_cnt = epr_cnt
+            best_mapping = list(cost.node_of)
+    return best_mapping, best_epr_cnt
@@ -1,9 +1,47 @@
+import numpy as np
+from bisect import bisect_right
 from autocomm_v1.gate_util import *
 from autocomm_v1.commute_func import *
 
 def is_comm_block(block):
     return type(block[0]) == list
 
+# Run-length index for consecutive_merge. A remote gate g0 = (q0, q1) can be the source of two keys:
+# (q0, node(q1)) and (q1, node(q0)). A later gate continues the run of a key if it holds the key's qubit and its
+# other qubit sits on the key's node; the run stops at the first gate that does not (single qubit gates included).
+# run_len[2*i + qidx] is the number of gates after i continuing the run of key qidx of gate i.
+# Each gate has at most one successor per key, so the runs are linked lists ranked by pointer jumping.
+def consecutive_run_lengths(q0, q1, node_of):
+    n_gate = len(q0)
+    q0 = np.asarray(q0, dtype=np.int64)
+    q1 = np.asarray(q1, dtype=np.int64)
+    node_of = np.asarray(node_of, dtype=np.int64)
+    num_nodes = int(node_of.max()) + 1 if len(node_of) else 1
+    is_2q = q1 >= 0
+    _q1 = np.where(is_2q, q1, q0)
+    keys = np.full((n_gate, 2), -1, dtype=np.int64)
+    keys[is_2q, 0] = (q0*num_nodes + node_of[_q1])[is_2q]
+    keys[is_2q, 1] = (_q1*num_nodes + node_of[q0])[is_2q]
+
+    nxt = np.full(2*n_gate, -1, dtype=np.int64)
+    if n_gate > 1:
+        cur, after = keys[:-1], keys[1:]
+        for qidx in [0, 1]:
+            via0 = (cur[:, qidx] >= 0) & (cur[:, qidx] == after[:, 0])
+            via1 = (cur[:, qidx] >= 0) & (cur[:, qidx] == after[:, 1])
+            succ = np.where(via0, 2*np.arange(1, n_gate), np.where(via1, 2*np.arange(1, n_gate) + 1, -1))
+            nxt[qidx:2*(n_gate-1):2] = succ
+    rank = (nxt >= 0).astype(np.int64)
+    ptr = nxt.copy()
+    while True:
+        active = np.flatnonzero(ptr >= 0)
+        if len(active) == 0:
+            break
+        hop = ptr[active]
+        rank[active] += rank[hop]
+        ptr[active] = ptr[hop]
+    return rank
+
 # Gates in the gate_list are either simply appended (single qubit or intra-node) or "selected"
 # They are selected as a (source, node) based on which of the ctrl,target provide more "benefit"
 ### In ties, the ctrl is chosen
@@ -11,86 +49,91 @@ def is_comm_block(block):
 ### if benefit is 0 for both, then the gate is added on its own (block of size 1) 
 ######  HOWEVER, the (source, node) is never included: this is handled in beginning of linear_comm_iter
 # The gate and its consecutive gates with same (source, node) are added as a block and never revisited.
+# The benefits come from consecutive_run_lengths, so no gate is scanned more than once.
 # RETURNS: new_gate_block_list -- [gate U comm_block]. comm_block: [[source_qubit, target_node], [gate_i]]
+# gate_list may be a list of gates or a GateArray
 def consecutive_merge(gate_list, qubit_node_mapping):
     n_gate = len(gate_list)
-    gate_del_flag = [0 for i in range(n_gate)] # IGNORE Gate in bottom loop if 1
-    new_gate_block_list = []
-    for gidx0, g0 in enumerate(gate_list): # initial aggregation
-        if gate_del_flag[gidx0] == 0:
-            qb0 = gate_qubits(g0)
-            if len(qb0) == 2:
-                if qubit_node_mapping[qb0[0]] != qubit_node_mapping[qb0[1]]:
-                    comm_block = [[],[g0]]
-                    benefit = []
-                    selected_gates_list = []
-                    for qidx0 in [0,1]:
-                        source_qb = qb0[qidx0]
-                        target_node = qubit_node_mapping[qb0[1-qidx0]]
-                        cnt = 0
-                        selected_gates = []
-                        for gidx1 in range(gidx0+1, n_gate):
-                            _break_flag = True # NOTE This value is only used if len(qb1) > 2 (i.e. never)
-                            if gate_del_flag[gidx1] == 0:
-                                g1 = gate_list[gidx1]
-                                qb1 = gate_qubits(g1)
-                                if len(qb1) == 1:
-                                    _break_flag = True
-                                    # if qb1[0] == source_qb:
-                                    #     _break_flag = False
-                                    # if qubit_node_mapping[qb1[0]] == target_node:
-                                    #     _break_flag = False
-                                elif len(qb1) == 2:
-                                    for qidx1 in [0,1]:
-                                        if qb1[qidx1] == source_qb:
-                                            if qubit_node_mapping[qb1[1-qidx1]] == target_node:
-                                                _break_flag = False
-                                                cnt += 1
-                                    # if qubit_node_mapping[qb1[0]] == qubit_node_mapping[qb1[1]]:
-                                    #     _break_flag = False
-                            else:
-                                _break_flag = False
-
-                            if _break_flag:
-                                break
-                            else:
-                                if gate_del_flag[gidx1] == 0:
-                                    selected_gates.append(gidx1)
-
-                        benefit.append(cnt)
-                        selected_gates_list.append(selected_gates)
+    if n_gate == 0:
+        return []
+    q0_col, q1_col = gate_qubit_columns(gate_list) # q1 is -1 for single qubit gates
+    if isinstance(gate_list, GateArray):
+        gate_list = gate_list.to_gate_list()
+    num_q = max(max(q0_col), max(q1_col)) + 1
+    node_of = [qubit_node_mapping[q] for q in range(num_q)]
+    run_len = consecutive_run_lengths(q0_col, q1_col, node_of).tolist()
 
-                    if max(benefit) == 0:
-                        pass
-                    else:
-                        if benefit[0] >= benefit[1]:
-                            selected_gates = selected_gates_list[0]
-                            comm_block[0] = [qb0[0], qubit_node_mapping[qb0[1]]]
-                        else:
-                            selected_gates = selected_gates_list[1]
-                            comm_block[0] = [qb0[1], qubit_node_mapping[qb0[0]]]
-                            
-                        for gidx1 in selected_gates:
-                            gate_del_flag[gidx1] = 1
-                            comm_block[1].append(gate_list[gidx1])
-                    new_gate_block_list.append(comm_block)
-                else: # IF GATE IS INSIDE ONE NODE, SIMPLY APPEND
-                    new_gate_block_list.append(g0)
-            else: # SIMPLY APPEND if SINGLE QUBIT GATE
-                new_gate_block_list.append(g0)
+    new_gate_block_list = []
+    gidx0 = 0
+    while gidx0 < n_gate: # initial aggregation
+        g0 = gate_list[gidx0]
+        if q1_col[gidx0] >= 0 and node_of[q0_col[gidx0]] != node_of[q1_col[gidx0]]:
+            comm_block = [[],[g0]]
+            benefit = [run_len[2*gidx0], run_len[2*gidx0+1]]
+            if max(benefit) > 0:
+                if benefit[0] >= benefit[1]:
+                    comm_block[0] = [q0_col[gidx0], node_of[q1_col[gidx0]]]
+                else:
+                    comm_block[0] = [q1_col[gidx0], node_of[q0_col[gidx0]]]
+                cnt = max(benefit)
+                comm_block[1].extend(gate_list[gidx0+1:gidx0+1+cnt])
+                gidx0 += cnt
+            new_gate_block_list.append(comm_block)
+        else: # SIMPLY APPEND if SINGLE QUBIT GATE or IF GATE IS INSIDE ONE NODE
+            new_gate_block_list.append(g0)
+        gidx0 += 1
 
     return new_gate_block_list
 
+# Merge candidates of linear_merge_iter: (source_qb, target_node) -> (sorted block positions, merge types)
+# merge type 3: the block has that (source, node); 1/2: a block without one (a singleton from consecutive_merge)
+# whose first 2 qubit gate has the source as control/target and the other qubit on the node.
+# A merge only deletes blocks between the current block and its candidate and the scan then resumes after
+# the candidate, so every indexed position after the current block is still alive and needs no update.
+def comm_block_index(gate_block_list, qubit_node_mapping):
+    merge_index = {}
+    def _add(key, gidx, merge_type):
+        if key not in merge_index:
+            merge_index[key] = ([], [])
+        merge_index[key][0].append(gidx)
+        merge_index[key][1].append(merge_type)
+    for gidx, gb in enumerate(gate_block_list):
+        if is_comm_block(gb):
+            if gb[0] == []:
+                for _g_f in gb[1]:
+                    _qb_f = gate_qubits(_g_f)
+                    if len(_qb_f) == 2:
+                        _add((_qb_f[0], qubit_node_mapping[_qb_f[1]]), gidx, 1)
+                        _add((_qb_f[1], qubit_node_mapping[_qb_f[0]]), gidx, 2)
+                        break
+            else:
+                _add(tuple(gb[0]), gidx, 3)
+    return merge_index
+
 # WOW 200 lines of code in this one function --- BAD
+# refine_iter_cnt=None repeats it until an iteration changes nothing; any count stops early at that fixpoint,
+# since an iteration that merges nothing and assigns no new key returns its input unchanged. A keyless block without
+# a two qubit gate takes its key from the g0 left over by earlier blocks or iterations; once an iteration left the
+# list unchanged that g0 only depends on the list, so with such blocks it takes two unchanged iterations in a row.
+# stop_at_fixpoint=False runs all refine_iter_cnt iterations.
+# Only the stop at the fixpoint is implemented: every iteration still visits every block. Revisiting only blocks next
+# to a changed one gave different block lists, since the stale g0 above makes a block's outcome depend on more than
+# its neighbours.
 # refine repeats it 3 times because the merging only happens in a DP way (between immediately consecutive common blocks)
 # check_commute_func is usually commute_func_right 
 # RETURNS: final anew_gate_block_list -- [comm_block]. comm_block: [[source_qubit, target_node], [gate_i]]
 ### [gate_i] is a list of merged gate blocks
-def linear_merge_iter(new_gate_block_list, qubit_node_mapping, refine_iter_cnt, check_commute_func):
-    for i in range(refine_iter_cnt):
+def linear_merge_iter(new_gate_block_list, qubit_node_mapping, refine_iter_cnt, check_commute_func, stop_at_fixpoint=True):
+    i = 0
+    unchanged = False
+    while refine_iter_cnt is None or i < refine_iter_cnt:
+        i += 1
+        stale_g0 = False
         anew_gate_block_list = []
+        changed = False # some block came out of a merge or got a new key
         n_gate = len(new_gate_block_list)
         gate_del_flag = [0 for i in range(n_gate)]
+        merge_index = comm_block_index(new_gate_block_list, qubit_node_mapping)
         for gidx0, gb0 in enumerate(new_gate_block_list):
             if gate_del_flag[gidx0] == 0:
                 if is_comm_block(gb0): # communication block
@@ -99,6 +142,7 @@ def linear_merge_iter(new_gate_block_list, qubit_node_mapping, refine_iter_cnt,
                         source_qb0, target_node0 = gb0[0]
                         qb_to_node_pair = [[source_qb0, target_node0]]
                     else:
+                        stale_g0 = stale_g0 or all(len(gate_qubits(_g_f)) != 2 for _g_f in gb0[1])
                         for _g_f in gb0[1]:
                             _qb_f = gate_qubits(_g_f)
                             if len(_qb_f) == 2:
@@ -112,31 +156,10 @@ def linear_merge_iter(new_gate_block_list, qubit_node_mapping, refine_iter_cnt,
                     benefit = []
                     _merge_blocks_all = []
                     for source_qb0, target_node0 in qb_to_node_pair:
-                        cnt = 0
-                        _merge_blocks = []
-                        for gidx1 in range(gidx0+1, n_gate):
-                            gb1 = new_gate_block_list[gidx1]
-                            if gate_del_flag[gidx1] == 0:
-                                if is_comm_block(gb1): 
-                                    if gb1[0] == []: # gb1 has no source, target info (must be a SINGLETON AS PER consecutive_aggregate)
-                                        for _g_f in gb1[1]: # if loops more than once, then it is not a singleton
-                                            _qb_f = gate_qubits(_g_f)
-                                            if len(_qb_f) == 2:
-                                                if _qb_f[0] == source_qb0 and qubit_node_mapping[_qb_f[1]] == target_node0:
-                                                    cnt += 1
-                                                    _merge_blocks.append([gidx1, 1])
-                                                elif _qb_f[1] == source_qb0 and qubit_node_mapping[_qb_f[0]] == target_node0:
-                                                    cnt += 1
-                                                    _merge_blocks.append([gidx1, 2])
-                                                break
-                                    else:
-                                        source_qb1, target_node1 = gb1[0]
-                                        if source_qb1 == source_qb0 and target_node1 == target_node0:
-                                            cnt += 1
-                                            _merge_blocks.append([gidx1, 3])
-                        benefit.append(cnt)
-                        _merge_blocks_all.append(_merge_blocks)
-                    
+                        positions, merge_types = merge_index.get((source_qb0, target_node0), ([], []))
+                        first = bisect_right(positions, gidx0)
+                        benefit.append(len(positions) - first)
+                        _merge_blocks_all.append([[positions[first], merge_types[first]]] if first < len(positions) else [])
                     # print("Benefit:", benefit, _merge_blocks_all)
                     if len(benefit) == 1:
                         source_qb0, target_node0 = qb_to_node_pair[0]
@@ -152,7 +175,7 @@ def linear_merge_iter(new_gate_block_list, qubit_node_mapping, refine_iter_cnt,
                     # start merge
                     if len(_merge_blocks) == 0:
                         anew_gate_block_list.append(gb0)
-                    cur_gb0 = [[source_qb0, target_node0], gb0[1]]
+                    cur_gb0 = gb0 if gb0[0] == [source_qb0, target_node0] else [[source_qb0, target_node0], gb0[1]]
                     # print("cur_gb0:", cur_gb0, _merge_blocks)
                     for gidx1, _merge_type in _merge_blocks[:1]: # NOTE only merge first one at linear step
                         if gate_del_flag[gidx1] == 0:
@@ -229,6 +252,7 @@ def linear_merge_iter(new_gate_block_list, qubit_node_mapping, refine_iter_cnt,
                                             break
                                 if _okay_merge == False:
                                     anew_gate_block_list.append(cur_gb0)
+                                    changed = changed or cur_gb0 is not gb0
                                     break
                                 else:
                                     # print("Merge from left to right")
@@ -236,6 +260,7 @@ def linear_merge_iter(new_gate_block_list, qubit_node_mapping, refine_iter_cnt,
                                     for rg in new_rblk_list:
                                         anew_gate_block_list.append(rg)
                                     anew_gate_block_list.append(cur_gb0)
+                                    changed = True
                                     for rgidx in range(gidx0, gidx1+1):
                                         gate_del_flag[rgidx] = 1 # delete them
                             else:
@@ -244,6 +269,7 @@ def linear_merge_iter(new_gate_block_list, qubit_node_mapping, refine_iter_cnt,
                                 anew_gate_block_list.append(cur_gb0)
                                 for lg in reversed(new_lblk_list):
                                     anew_gate_block_list.append(lg)
+                                changed = True
                                 for lgidx in range(gidx0, gidx1+1):
                                     gate_del_flag[lgidx] = 1 # delete them
                 else: # SIMPLY APPEND gb0 if SINGLETON
@@ -251,6 +277,12 @@ def linear_merge_iter(new_gate_block_list, qubit_node_mapping, refine_iter_cnt,
             else:
                 pass # if gate/block deleted, nothing to do
         new_gate_block_list = anew_gate_block_list
+        if stop_at_fixpoint and not changed:
+            if unchanged or not stale_g0:
+                break # fixpoint
+            unchanged = True
+        else:
+            unchanged = False
     return new_gate_block_list
 
 def _is_tp_comm_block(blk):
@@ -260,9 +292,13 @@ def _is_tp_comm_block(blk):
         return False
     return blk[0][1] == 1
 
-def tp_comm_merge_iter(gate_block_list, qubit_node_mapping, refine_iter_cnt, check_commute_func):
-    for i in range(refine_iter_cnt):
+# refine_iter_cnt and stop_at_fixpoint as for linear_merge_iter
+def tp_comm_merge_iter(gate_block_list, qubit_node_mapping, refine_iter_cnt, check_commute_func, stop_at_fixpoint=True):
+    i = 0
+    while refine_iter_cnt is None or i < refine_iter_cnt:
+        i += 1
         return_gate_block_list = []
+        changed = False
         n_gate = len(gate_block_list)
         gate_del_flag = [0 for i in range(n_gate)]
         for gidx0, gb0 in enumerate(gate_block_list):
@@ -355,6 +391,7 @@ def tp_comm_merge_iter(gate_block_list, qubit_node_mapping, refine_iter_cnt, che
                                 return_gate_block_list.append(cur_gb0)
                                 for lg in reversed(new_lblk_list):
                                     return_gate_block_list.append(lg)
+                                changed = True
                                 for lgidx in range(gidx0, gidx1+1):
                                     gate_del_flag[lgidx] = 1 # delete them
                 else: # NOTE cat_comm blocks are not merged
@@ -362,6 +399,8 @@ def tp_comm_merge_iter(gate_block_list, qubit_node_mapping, refine_iter_cnt, che
             else:
                 pass # if gate/block deleted, nothing to do
         gate_block_list = return_gate_block_list
+        if stop_at_fixpoint and not changed:
+            break # fixpoint
     return gate_block_list
 
 if __name__ == "__main__":
@@ -0,0 +1,488 @@
+import heapq
+from autocomm_v1.gate_util import *
+from autocomm_v1.merge_func import is_comm_block
+from autocomm_v1.timeline import Timeline
+from utils.qubit_node_map import QubitNodeMap
+
+# Timing state of the schedule is one flat list of qubit slots (the time each qubit becomes free):
+# data qubit q is slot q, the comm qubits of each node follow, node by node.
+# comm_qubit_cnt is the number of comm qubits per node, an int for all nodes or a list indexed by node.
+# Only the timing pass lives here, so it can be rerun on a merged block list for every latency_metric in a sweep.
+# Passing a Timeline records every step with its qubit slot, start, end and block index.
+
+# two qubit gate latencies; other two qubit gates in a comm block reuse the last one seen
+def _twoq_latency_table(latency_metric):
+    return {"CX": latency_metric["CX"], "CZ": latency_metric["CX"], "CRZ": latency_metric["CRZ"]}
+
+# gates of a comm block body, where the source qubit lives in source_slot (a comm qubit) meanwhile
+def _comm_body_timing(slot, gates, source, source_slot, lat_1q, twoq_table, twoq_latency, timeline, bidx):
+    for glocal in gates:
+        glqb = glocal[1]
+        if len(glqb) == 1:
+            qb = source_slot if glqb[0] == source else glqb[0]
+            start = slot[qb]
+            slot[qb] += lat_1q
+            if timeline is not None:
+                timeline.add("1Q", qb, start, slot[qb], bidx)
+        elif len(glqb) == 2:
+            ctrl, tgt = glqb
+            twoq_latency = twoq_table.get(glocal[0], twoq_latency)
+            if ctrl == source:
+                ctrl = source_slot
+            elif tgt == source:
+                tgt = source_slot
+            start = max(slot[ctrl], slot[tgt])
+            slot[ctrl] = slot[tgt] = start + twoq_latency
+            if timeline is not None:
+                timeline.add("2Q", ctrl, start, slot[ctrl], bidx)
+                timeline.add("2Q", tgt, start, slot[tgt], bidx)
+    return twoq_latency
+
+# RETURNS: the range of comm qubit slots of each node, total slot count
+def comm_qubit_slots(num_q, node_count, comm_qubit_cnt=2):
+    if type(comm_qubit_cnt) is int:
+        comm_qubit_cnt = [comm_qubit_cnt for _ in range(node_count)]
+    cq_ranges = []
+    n_slot = num_q
+    for node in range(node_count):
+        if comm_qubit_cnt[node] < 1:
+            raise ValueError(f"node {node} needs at least one comm qubit, got {comm_qubit_cnt[node]}")
+        cq_ranges.append(range(n_slot, n_slot+comm_qubit_cnt[node]))
+        n_slot += comm_qubit_cnt[node]
+    return cq_ranges, n_slot
+
+# data qubits a block touches and the nodes whose comm qubits it uses
+def block_resources(gb, node_of):
+    if is_comm_block(gb):
+        qubits = {gb[0][0][0]}
+        for blk in gb[1:]:
+            for g in blk:
+                qubits.update(g[1])
+        return sorted(qubits), [node_of[gb[0][0][0]]] + list(gb[0][0][1:])
+    return list(gb[1]), []
+
+# rough duration of a block for critical path priorities: its protocol steps and gates run one after another
+def block_duration(gb, latency_metric):
+    lat_1q, lat_cx, lat_ms, lat_ep, lat_cb = latency_metric["1Q"], latency_metric["CX"], latency_metric["MS"], \
+                                             latency_metric["EP"], latency_metric["CB"]
+    twoq_table = _twoq_latency_table(latency_metric)
+    if not is_comm_block(gb):
+        return lat_1q if len(gb[1]) == 1 else twoq_table.get(gb[0], 0)
+    duration = 0
+    for blk in gb[1:]:
+        for g in blk:
+            duration += lat_1q if len(g[1]) == 1 else twoq_table.get(g[0], lat_cx)
+    if gb[0][1] == 0: # cat-comm
+        return duration + lat_ep + lat_cx + 2*lat_ms + 2*lat_cb + 3*lat_1q
+    hops = len(gb[0][0]) - 1
+    if gb[0][1] == 2: # migration: one way teleport
+        return duration + hops*(lat_ep + lat_cx + lat_ms + lat_cb + 3*lat_1q)
+    # tp-comm: teleport along the hops and back
+    return duration + (hops+1)*(lat_ep + lat_ms + lat_cb) + hops*(lat_cx + 3*lat_1q) + 4*lat_cx + lat_ms + lat_cb + 2*lat_1q
+
+# block DAG over data qubits: each block depends on the previous block on each of its qubits
+# RETURNS: successor lists, in-degrees, critical path priority (longest duration path to the end, block included)
+def block_dag(block_qubits, durations):
+    n_block = len(block_qubits)
+    succ = [[] for _ in range(n_block)]
+    indeg = [0 for _ in range(n_block)]
+    last_block = {}
+    for bidx, qubits in enumerate(block_qubits):
+        preds = {last_block[q] for q in qubits if q in last_block}
+        for pidx in preds:
+            succ[pidx].append(bidx)
+        indeg[bidx] = len(preds)
+        for q in qubits:
+            last_block[q] = bidx
+    priority = [0 for _ in range(n_block)]
+    for bidx in reversed(range(n_block)):
+        priority[bidx] = durations[bidx] + max([priority[sidx] for sidx in succ[bidx]], default=0)
+    return succ, indeg, priority
+
+# EPR prefetch: a buffered pair is generated from gen_start (its comm qubits and link being free) into the comm qubits
+# it holds until it is used;
+# a pair that waits longer than lifetime is dropped and regenerated in the same comm qubits.
+# RETURNS: when the entry has a pair ready for a request at time need
+def prefetched_epr_ready(gen_start, need, lat_ep, lifetime):
+    ready = gen_start + lat_ep
+    if need <= ready:
+        return ready
+    if lifetime == float("inf"):
+        return need
+    ready += (need - ready) // (lifetime + lat_ep) * (lifetime + lat_ep) # latest refresh before need
+    return need if need <= ready + lifetime else ready + lifetime + lat_ep
+
+# EPR generation time each link spends per pair: 1/rate, 0 for links without a rate limit
+# epr_rate: pairs per time unit, one number for all links or a dict {(node, node): rate}
+def link_spacing(epr_rate, link):
+    if epr_rate is None:
+        return 0
+    if isinstance(epr_rate, dict):
+        rate = epr_rate.get(link, epr_rate.get(link[::-1]))
+        if rate is None:
+            return 0
+    else:
+        rate = epr_rate
+    if rate <= 0:
+        raise ValueError(f"EPR rate of link {link} must be positive, got {rate}")
+    return 1/rate
+
+# RETURNS: epr_cnt, all_latency of an assigned (and tp-merged) block list
+def schedule_latency(assigned_gate_block_list, qubit_node_mapping, latency_metric, comm_qubit_cnt=2, timeline=None, list_schedule=False, \
+                     epr_prefetch=None, schedule_stats=None, epr_rate=None, topology=None):
+    epr_cnt, all_latency, _ = schedule_blocks(assigned_gate_block_list, qubit_node_mapping, latency_metric, \
+                                              comm_qubit_cnt, timeline, list_schedule, epr_prefetch, schedule_stats, epr_rate, topology)
+    return epr_cnt, all_latency
+
+# Blocks are timed in program order, or with list_schedule=True in list scheduling order: of the blocks whose
+# predecessors in the block DAG are issued, those that can start (all their data qubits and a comm qubit on each of
+# their nodes free) before the first of them could finish compete, and the one with the highest critical path priority
+# is issued, then the one that starts first. Being a heuristic it can lose to program order, which is then kept.
+# Timeline block ids are positions in issue order.
+# Besides cat-comm (0) and tp-comm (1) blocks, comm blocks of kind 2 are migrations (see autocomm_v1.dynamic_mapping):
+# the source is teleported to the target node and not back, its body SWAPs it into a data qubit there.
+# epr_prefetch: {"buffer_depth": pairs buffered per link (1), "lifetime": how long a buffered pair lasts (inf)}.
+# After each block the links it used are topped up: a buffered pair takes the first free comm qubit on each end, as
+# long as its nodes have comm qubits not holding buffered pairs, and is generated there as soon as both are free.
+# A later EPR request on the link takes it if that is no later than generating a pair on demand; pairs never used are
+# not generated. A block that needs a comm qubit of a node whose comm qubits all hold pairs of other links cancels one
+# of them, as do blocks on the link that can use a pair generated on demand sooner.
+# epr_rate: EPR pairs per time unit a link can start, one number or a dict {(node, node): rate} (see link_spacing).
+# Each rate limited link starts its generations one after another, 1/rate apart, in the order they are requested
+# (a buffered pair when it is used); a generation still takes EP. Without it links have no limit.
+# schedule_stats: optional dict, gets with epr_prefetch "ep_wait_saved", the EP time taken off the comm qubits by
+# prefetching, and "latency_saved", all_latency of the same issue order without prefetching minus all_latency
+# (negative when the comm qubits held by buffered pairs cost more than they saved), and with
+# epr_rate "ep_stall", the time EP requests queued on their links, and "links": {link: {"pairs", "stall", "utilization"}}
+# topology: optional utils.topology.Topology, an EPR pair between two nodes then takes topology.ep_latency(a, b, EP).
+# RETURNS: epr_cnt, all_latency, issue order (indices into assigned_gate_block_list)
+def schedule_blocks(assigned_gate_block_list, qubit_node_mapping, latency_metric, comm_qubit_cnt=2, timeline=None, list_schedule=False, \
+                    epr_prefetch=None, schedule_stats=None, epr_rate=None, topology=None):
+    program_order = range(len(assigned_gate_block_list))
+    # the list scheduled pass records the timeline and stats, they are recorded again only if program order wins
+    epr_cnt, all_latency, order = issue_blocks(assigned_gate_block_list, qubit_node_mapping, latency_metric, comm_qubit_cnt, \
+                                               timeline, None if list_schedule else program_order, epr_prefetch, schedule_stats, epr_rate, topology)
+    if list_schedule:
+        _, program_latency, _ = issue_blocks(assigned_gate_block_list, qubit_node_mapping, latency_metric, comm_qubit_cnt, \
+                                             None, program_order, epr_prefetch, None, epr_rate, topology)
+        if program_latency <= all_latency:
+            epr_cnt, all_latency, order = issue_blocks(assigned_gate_block_list, qubit_node_mapping, latency_metric, comm_qubit_cnt, \
+                                                       timeline, program_order, epr_prefetch, schedule_stats, epr_rate, topology)
+    if epr_prefetch is not None and schedule_stats is not None:
+        _, base_latency, _ = issue_blocks(assigned_gate_block_list, qubit_node_mapping, latency_metric, comm_qubit_cnt, \
+                                          None, order, None, None, epr_rate, topology)
+        schedule_stats["latency_saved"] = base_latency - all_latency
+    return epr_cnt, all_latency, order
+
+# Times the blocks in issue_order (indices into assigned_gate_block_list), or by list scheduling if it is None.
+# Other arguments and RETURNS as for schedule_blocks.
+def issue_blocks(assigned_gate_block_list, qubit_node_mapping, latency_metric, comm_qubit_cnt, timeline, issue_order, \
+                 epr_prefetch, schedule_stats, epr_rate, topology):
+    qubit_node_mapping = QubitNodeMap.from_mapping(qubit_node_mapping)
+    num_q = qubit_node_mapping.num_qubits
+    node_of = qubit_node_mapping.node_list
+    node_count = qubit_node_mapping.num_nodes
+    cq_ranges, n_slot = comm_qubit_slots(num_q, node_count, comm_qubit_cnt)
+    slot = [0 for _ in range(n_slot)]
+    if timeline is not None:
+        timeline.reset(node_of, cq_ranges)
+    # per node min-heap of (free time, comm qubit). Slot times only grow, so an entry is a lower bound of its
+    # qubit's free time; stale entries are refreshed when they reach the top, and an up to date top is the earliest.
+    cq_heap = [[(0, cq) for cq in cq_range] for cq_range in cq_ranges]
+
+    def free_cq(node, exclude=-1): # the comm qubit of node that is free first (lowest index on ties), other than exclude
+        heap = cq_heap[node]
+        held = None
+        while True:
+            t, cq = heap[0]
+            if slot[cq] != t:
+                heapq.heapreplace(heap, (slot[cq], cq))
+            elif cq == exclude and held is None and len(heap) > 1:
+                held = heapq.heappop(heap)
+            else:
+                break
+        if held is not None:
+            heapq.heappush(heap, held)
+        return cq
+
+    lat_1q, lat_cx, lat_ms, lat_ep, lat_cb = latency_metric["1Q"], latency_metric["CX"], latency_metric["MS"], \
+                                             latency_metric["EP"], latency_metric["CB"]
+    twoq_table = _twoq_latency_table(latency_metric)
+    twoq_latency = None
+    bidx = 0
+    slot_node = node_of + [node for node, cq_range in enumerate(cq_ranges) for _ in cq_range]
+    if epr_prefetch is not None:
+        buffer_depth = epr_prefetch.get("buffer_depth", 1)
+        lifetime = epr_prefetch.get("lifetime", float("inf"))
+        if buffer_depth < 1:
+            raise ValueError(f"EPR prefetch needs a buffer depth of at least 1, got {buffer_depth}")
+    epr_buffer = {} # link -> buffered pairs, [comm qubits free, comm qubit on link[0], comm qubit on link[1], slots before]
+    buffered_at = {} # comm qubit -> the buffered pair it holds
+    buffered_links = [] # links used by the current block, topped up after it
+    ep_wait_saved = 0
+    link_free = {} # link -> when it can start its next generation
+    link_pairs = {}
+    link_stall = {}
+    if topology is not None and topology.num_nodes < node_count:
+        raise ValueError(f"topology has {topology.num_nodes} nodes, the mapping uses {node_count}")
+
+    def link_ep(link): # EP latency of a link
+        return lat_ep if topology is None else topology.ep_latency(link[0], link[1], lat_ep)
+
+    def book_link(link, request): # RETURNS: when a generation requested at request starts on link
+        spacing = link_spacing(epr_rate, link)
+        gen_start = max(request, link_free.get(link, 0))
+        if spacing > 0:
+            link_free[link] = gen_start + spacing
+        link_pairs[link] = link_pairs.get(link, 0) + 1
+        return gen_start
+
+    # protocol steps of the comm blocks, recorded for block bidx
+    def gate2(kind, qb0, qb1, latency): # EP or two qubit gate
+        start = max(slot[qb0], slot[qb1])
+        slot[qb0] = slot[qb1] = start + latency
+        if timeline is not None:
+            timeline.add(kind, qb0, start, slot[qb0], bidx)
+            timeline.add(kind, qb1, start, slot[qb1], bidx)
+
+    def cq_free_time(cq): # a comm qubit holding a buffered pair is free once the pair is discarded
+        pair = buffered_at.get(cq)
+        if pair is None:
+            return slot[cq]
+        return pair[3][0] if cq == pair[1] else pair[3][1]
+
+    def release_pair(link, pair, free_at): # the comm qubits of a buffered pair are free again from free_at
+        epr_buffer[link].remove(pair)
+        for cq, before in zip(pair[1:3], pair[3]):
+            del buffered_at[cq]
+            slot[cq] = before if free_at is None else free_at
+            node = slot_node[cq]
+            cq_heap[node] = [(slot[_cq], _cq) for _cq in cq_ranges[node]] # slot went down, rebuild
+            heapq.heapify(cq_heap[node])
+
+    def discard(cq): # cancel the buffered pair held by cq, if any: the block takes the comm qubit first
+        pair = buffered_at.get(cq)
+        if pair is not None:
+            link = tuple(sorted([slot_node[pair[1]], slot_node[pair[2]]]))
+            release_pair(link, pair, None)
+
+    def sooner_cq(qb, link): # a comm qubit of qb's node holding a pair of another link, if cancelling it frees it sooner
+        for cq in cq_ranges[slot_node[qb]]:
+            pair = buffered_at.get(cq)
+            if pair is not None and pair not in epr_buffer[link] and cq_free_time(cq) < cq_free_time(qb):
+                qb = cq
+        return qb
+
+    def top_up(link): # buffer pairs on link, on comm qubits not yet holding one
+        buffer = epr_buffer.setdefault(link, [])
+        if link[0] == link[1]: # a pair within one node
+            return
+        while len(buffer) < buffer_depth:
+            cq0, cq1 = free_cq(link[0]), free_cq(link[1])
+            if cq0 in buffered_at or cq1 in buffered_at:
+                return
+            pair = [max(slot[cq0], slot[cq1]), cq0, cq1, (slot[cq0], slot[cq1])]
+            buffer.append(pair)
+            buffered_at[cq0] = buffered_at[cq1] = pair
+            slot[cq0] = slot[cq1] = float("inf") # held until used
+
+    # RETURNS: the comm qubits holding the pair, qb0, qb1 or those of a buffered pair between their nodes.
+    # need: when the block uses the pair, the data qubit it first interacts with is free
+    def epr(qb0, qb1, need=0): # EPR pair between two comm qubits
+        nonlocal ep_wait_saved
+        link = tuple(sorted([slot_node[qb0], slot_node[qb1]]))
+        link_lat_ep = link_ep(link)
+        if epr_prefetch is None and epr_rate is None:
+            gate2("EP", qb0, qb1, link_lat_ep)
+            return qb0, qb1
+        if epr_prefetch is not None:
+            buffered_links.append(link)
+            epr_buffer.setdefault(link, [])
+            qb0, qb1 = sooner_cq(qb0, link), sooner_cq(qb1, link)
+            # when a pair generated on demand (cancelling buffered pairs held by qb0, qb1) could be used
+            on_demand = max(cq_free_time(qb0), cq_free_time(qb1), link_free.get(link, 0)) + link_lat_ep
+            on_demand = max(on_demand, need)
+            link_start = lambda pair: max(pair[0], link_free.get(link, 0)) # a buffered pair books its link once used
+            buffered = [(prefetched_epr_ready(link_start(pair), need, link_lat_ep, lifetime), k) for k, pair in enumerate(epr_buffer[link])]
+            if buffered and min(buffered)[0] <= on_demand:
+                ready, k = min(buffered)
+                pair = epr_buffer[link][k]
+                book_link(link, pair[0])
+                ep_wait_saved += on_demand - ready
+                release_pair(link, pair, ready)
+                if timeline is not None:
+                    for cq in pair[1:3]:
+                        timeline.add("EP", cq, pair[0], ready, bidx)
+                return (pair[1], pair[2]) if slot_node[qb0] == link[0] else (pair[2], pair[1])
+            discard(qb0)
+            discard(qb1)
+        start = max(slot[qb0], slot[qb1])
+        gen_start = book_link(link, start)
+        link_stall[link] = link_stall.get(link, 0) + gen_start - start
+        slot[qb0] = slot[qb1] = gen_start + link_lat_ep
+        if timeline is not None:
+            timeline.add("EP", qb0, start, slot[qb0], bidx)
+            timeline.add("EP", qb1, start, slot[qb1], bidx)
+        return qb0, qb1
+
+    def gate1(kind, qb, latency): # single qubit gate or measurement
+        start = slot[qb]
+        slot[qb] = start + latency
+        if timeline is not None:
+            timeline.add(kind, qb, start, slot[qb], bidx)
+
+    def correct(qb, measured_qb): # correction on qb once the result measured on measured_qb arrives
+        start = max(slot[qb], slot[measured_qb]+lat_cb)
+        slot[qb] = start + lat_1q
+        if timeline is not None:
+            timeline.add("CB", qb, start, slot[qb], bidx)
+
+    # RETURNS: EPR pairs used by the block
+    def time_block(gb):
+        nonlocal twoq_latency
+        if is_comm_block(gb):
+            if gb[0][1] == 0: # cat-comm
+                source, target_node = gb[0][0]
+                scqb, tcqb = epr(free_cq(node_of[source]), free_cq(target_node), slot[source])
+                # TODO why is the target data qubit not checked here?
+                gate2("2Q", source, scqb, lat_cx)
+                # Measure and correction
+                gate1("MS", scqb, lat_ms)
+                correct(tcqb, scqb)
+                # main body, the source qubit is transferred to the target node comm qubit
+                twoq_latency = _comm_body_timing(slot, gb[1], source, tcqb, lat_1q, twoq_table, twoq_latency, timeline, bidx)
+                # finish up
+                gate1("MS", tcqb, lat_1q + lat_ms) # H and measure
+                correct(source, tcqb)
+                return 1
+            else: # Tp-comm, or a migration (kind 2) that stays on the target node
+                # one target node: parallel, more: serial hops, each starting from another comm qubit of the previous target
+                # (the same one if the node has a single comm qubit)
+                source = gb[0][0][0]
+                target_nodes = gb[0][0][1:]
+                source_cqb = None
+                scqb = free_cq(node_of[source])
+                source_qb = source
+                for tnidx, target_node in enumerate(target_nodes):
+                    scqb, tcqb = epr(scqb, free_cq(target_node), slot[source_qb])
+                    if source_cqb is None:
+                        source_cqb = scqb
+                    gate2("2Q", source_qb, scqb, lat_cx)
+                    gate1("1Q", source_qb, lat_1q) # H
+                    gate1("MS", source_qb, lat_ms)
+                    gate1("MS", scqb, lat_ms)
+                    correct(tcqb, scqb)
+                    correct(tcqb, source_qb)
+                    gate1("1Q", source_qb, lat_1q) # reset
+                    # main body
+                    twoq_latency = _comm_body_timing(slot, gb[1+tnidx], source, tcqb, lat_1q, twoq_table, twoq_latency, timeline, bidx)
+                    source_qb = tcqb
+                    scqb = free_cq(target_node, exclude=tcqb)
+                if gb[0][1] == 2: # migration, the body moved the qubit into a data qubit of the target node
+                    return len(target_nodes)
+                # finish up, teleport back to the source data qubit
+                scqb = source_cqb if len(target_nodes) == 1 else free_cq(node_of[source])
+                scqb, tcqb_new = epr(scqb, free_cq(target_node, exclude=tcqb), slot[source])
+                gate2("2Q", source, scqb, 3*lat_cx)
+                gate2("2Q", tcqb_new, tcqb, lat_cx)
+                gate1("MS", tcqb_new, lat_ms)
+                correct(source, tcqb_new)
+                gate1("MS", tcqb, lat_1q + lat_ms) # H and measure
+                correct(source, tcqb)
+                return len(target_nodes) + 1
+        else:
+            gqb = gb[1]
+            if len(gqb) == 1:
+                gate1("1Q", gqb[0], lat_1q)
+            elif len(gqb) == 2 and gb[0] in twoq_table: # must be local
+                gate2("2Q", gqb[0], gqb[1], twoq_table[gb[0]])
+            return 0
+
+    def issue(b): # RETURNS: EPR pairs used by block b
+        epr_cnt = time_block(assigned_gate_block_list[b])
+        for link in buffered_links:
+            top_up(link)
+        buffered_links.clear()
+        return epr_cnt
+
+    epr_cnt = 0
+    if issue_order is not None:
+        order = list(issue_order)
+        for bidx, b in enumerate(order):
+            epr_cnt += issue(b)
+    else:
+        resources = [block_resources(gb, node_of) for gb in assigned_gate_block_list]
+        durations = [block_duration(gb, latency_metric) for gb in assigned_gate_block_list]
+        succ, indeg, priority = block_dag([qubits for qubits, _ in resources], durations)
+
+        def earliest_start(b):
+            qubits, nodes = resources[b]
+            if buffered_at:
+                return max([slot[q] for q in qubits] + [min(map(cq_free_time, cq_ranges[node])) for node in nodes])
+            return max([slot[q] for q in qubits] + [slot[free_cq(node)] for node in nodes])
+
+        # Ready blocks are kept in lazy heaps keyed on their earliest start, which only grows: by finish (start plus
+        # duration) for the frontier, and by start, from which the blocks starting no later than the frontier move to
+        # a heap by priority. An entry is refreshed when it reaches a top, and a candidate that starts too late by then
+        # moves back by start; an up to date top is then the same pick as scanning the whole ready set.
+        by_finish, by_start, candidates = [], [], []
+        issued = [False] * len(assigned_gate_block_list)
+
+        def push_ready(b):
+            start = earliest_start(b)
+            heapq.heappush(by_finish, (start + durations[b], b))
+            heapq.heappush(by_start, (start, b))
+
+        for b in range(len(assigned_gate_block_list)):
+            if indeg[b] == 0:
+                push_ready(b)
+        order = []
+        while by_finish:
+            finish, b = by_finish[0]
+            if issued[b]:
+                heapq.heappop(by_finish)
+                continue
+            fresh = earliest_start(b) + durations[b]
+            if fresh != finish:
+                heapq.heapreplace(by_finish, (fresh, b))
+                continue
+            frontier = finish # earliest finish of a ready block
+            while by_start and by_start[0][0] <= frontier:
+                start, b = by_start[0]
+                fresh = earliest_start(b)
+                if fresh != start:
+                    heapq.heapreplace(by_start, (fresh, b))
+                else:
+                    heapq.heappop(by_start)
+                    heapq.heappush(candidates, (-priority[b], start, b))
+            while True:
+                neg_priority, start, b = candidates[0]
+                fresh = earliest_start(b)
+                if fresh > frontier:
+                    heapq.heappop(candidates)
+                    heapq.heappush(by_start, (fresh, b))
+                elif fresh != start:
+                    heapq.heapreplace(candidates, (neg_priority, fresh, b))
+                else:
+                    break
+            heapq.heappop(candidates)
+            issued[b] = True
+            bidx = len(order)
+            order.append(b)
+            epr_cnt += issue(b)
+            for sidx in succ[b]:
+                indeg[sidx] -= 1
+                if indeg[sidx] == 0:
+                    push_ready(sidx)
+    for link, buffer in epr_buffer.items(): # never used, so never generated
+        for pair in list(buffer):
+            release_pair(link, pair, None)
+    all_latency = max(slot)
+    if schedule_stats is not None and epr_prefetch is not None:
+        schedule_stats["ep_wait_saved"] = ep_wait_saved
+    if schedule_stats is not None and epr_rate is not None:
+        schedule_stats["ep_stall"] = sum(link_stall.values())
+        schedule_stats["links"] = {link: {"pairs": pairs, "stall": link_stall.get(link, 0), \
+                                          "utilization": pairs*link_spacing(epr_rate, link)/all_latency if all_latency else 0} \
+                                   for link, pairs in sorted(link_pairs.items())}
+    return epr_cnt, all_latency, order
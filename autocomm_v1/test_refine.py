@@ -0,0 +1,62 @@
+'''Differential check of the refine iterations: linear_merge_iter and tp_comm_merge_iter stop as soon as an iteration
+changes nothing, which must give the same blocks, or raise the same exception, as running every iteration
+(stop_at_fixpoint=False).
+Run with python -m autocomm_v1.test_refine (or pytest).
+'''
+import contextlib
+import copy
+import io
+import random
+from autocomm_v1.autocomm import *
+
+SINGLE_QUBIT_GATES = [("H", []), ("X", []), ("Z", []), ("RX", [0.3]), ("RZ", [0.2])]
+
+def random_circuit(rng):
+    num_q = rng.randint(3, 20)
+    num_nodes = rng.randint(2, 6)
+    qubit_node_mapping = [rng.randrange(num_nodes) for _ in range(num_q)]
+    gate_list = []
+    for _ in range(rng.randint(0, 200)):
+        if rng.random() < 0.45:
+            name, params = rng.choice(SINGLE_QUBIT_GATES)
+            gate_list.append([name, [rng.randrange(num_q)], params, 1])
+        else:
+            a, b = rng.sample(range(num_q), 2)
+            gate_list.append([rng.choice(["CX", "CZ", "CRZ"]), [a, b], [0.5] if rng.random() < 0.3 else [], 1])
+    return gate_list, qubit_node_mapping
+
+# the blocks, or the type and message of the exception raised on the way
+def outcome(run, *args):
+    try:
+        return run(*args)
+    except Exception as e:
+        return type(e), str(e)
+
+# run(gate_list, qubit_node_mapping, refine_iter_cnt, stop_at_fixpoint): the pass under test, on its own stage's input
+def check_merge_iter(run, seeds=range(300)):
+    for seed in seeds:
+        gate_list, qubit_node_mapping = random_circuit(random.Random(seed))
+        with contextlib.redirect_stdout(io.StringIO()):
+            for refine_iter_cnt, reference_cnt in [(1, 1), (3, 3), (None, 50)]:
+                expected = outcome(run, copy.deepcopy(gate_list), qubit_node_mapping, reference_cnt, False)
+                actual = outcome(run, copy.deepcopy(gate_list), qubit_node_mapping, refine_iter_cnt, True)
+                assert actual == expected, f'seed {seed}, refine_iter_cnt {refine_iter_cnt}: {actual} != {expected}'
+
+def linear_stage(gate_list, qubit_node_mapping, refine_iter_cnt, stop_at_fixpoint):
+    gate_block_list = consecutive_merge(pattern_merged_circ(gate_list), qubit_node_mapping)
+    return linear_merge_iter(gate_block_list, qubit_node_mapping, refine_iter_cnt, commute_func_right, stop_at_fixpoint)
+
+def tp_stage(gate_list, qubit_node_mapping, refine_iter_cnt, stop_at_fixpoint):
+    gate_block_list = comm_assign(linear_stage(gate_list, qubit_node_mapping, 3, stop_at_fixpoint), qubit_node_mapping)
+    return tp_comm_merge_iter(gate_block_list, qubit_node_mapping, refine_iter_cnt, commute_func_right, stop_at_fixpoint)
+
+def test_linear_merge_iter():
+    check_merge_iter(linear_stage)
+
+def test_tp_comm_merge_iter():
+    check_merge_iter(tp_stage)
+
+if __name__ == '__main__':
+    test_linear_merge_iter()
+    test_tp_comm_merge_iter()
+    print('Success.')
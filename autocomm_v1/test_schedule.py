@@ -0,0 +1,64 @@
+'''Checks of the EPR prefetch model of schedule_blocks: buffered pairs hold comm qubits, so with one comm qubit per
+node prefetching has nothing spare to generate into and never lowers the latency, and with more no comm qubit ever
+runs two steps at once.
+Run with python -m autocomm_v1.test_schedule (or pytest).
+'''
+import contextlib
+import io
+import random
+from autocomm_v1.autocomm import *
+from autocomm_v1.timeline import Timeline
+from autocomm_v1.test_refine import random_circuit
+
+PREFETCH_CONFIGS = [{"buffer_depth": 1}, {"buffer_depth": 3}, {"buffer_depth": 2, "lifetime": 20}]
+
+def assigned_circuit(seed):
+    gate_list, qubit_node_mapping = random_circuit(random.Random(seed))
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            return comm_assign(comm_aggregate(gate_list, qubit_node_mapping), qubit_node_mapping), qubit_node_mapping
+        except UnboundLocalError: # comm_assign on a key block without a remote gate
+            return None, qubit_node_mapping
+
+def comm_qubit_overlaps(timeline):
+    steps = {} # a pair within one node has its EP recorded twice on the same comm qubit
+    for kind, qubit, start, end, block in timeline:
+        steps.setdefault(qubit, set()).add((start, end, kind, block))
+    overlaps = []
+    for qubit, qubit_steps in steps.items():
+        qubit_steps = sorted(step[:2] for step in qubit_steps)
+        overlaps += [(qubit, step) for step, next_step in zip(qubit_steps, qubit_steps[1:]) if next_step[0] < step[1] - 1e-9]
+    return overlaps
+
+def test_prefetch_with_one_comm_qubit():
+    with contextlib.redirect_stdout(io.StringIO()):
+        gate_block_list = comm_assign(comm_aggregate([["CX", [0, 2], [], 1], ["CX", [1, 3], [], 1]], [0, 0, 1, 1]), [0, 0, 1, 1])
+    for seed in [None] + list(range(150)):
+        qubit_node_mapping = [0, 0, 1, 1]
+        if seed is not None:
+            gate_block_list, qubit_node_mapping = assigned_circuit(seed)
+            if gate_block_list is None:
+                continue
+        for list_schedule in [False, True]:
+            _, latency, _ = comm_schedule(gate_block_list, qubit_node_mapping, comm_qubit_cnt=1, list_schedule=list_schedule)
+            for epr_prefetch in PREFETCH_CONFIGS:
+                _, prefetch_latency, _ = comm_schedule(gate_block_list, qubit_node_mapping, comm_qubit_cnt=1, list_schedule=list_schedule, \
+                                                       epr_prefetch=epr_prefetch)
+                assert prefetch_latency >= latency - 1e-9, f'seed {seed}, {epr_prefetch}: {prefetch_latency} < {latency}'
+
+def test_prefetch_comm_qubits_never_overlap():
+    for seed in range(150):
+        gate_block_list, qubit_node_mapping = assigned_circuit(seed)
+        if gate_block_list is None:
+            continue
+        for comm_qubit_cnt in [2, 3]:
+            for epr_prefetch in PREFETCH_CONFIGS:
+                timeline = Timeline()
+                comm_schedule(gate_block_list, qubit_node_mapping, comm_qubit_cnt=comm_qubit_cnt, timeline=timeline, epr_prefetch=epr_prefetch)
+                overlaps = comm_qubit_overlaps(timeline)
+                assert not overlaps, f'seed {seed}, {comm_qubit_cnt} comm qubits, {epr_prefetch}: overlapping steps {overlaps[:3]}'
+
+if __name__ == '__main__':
+    test_prefetch_with_one_comm_qubit()
+    test_prefetch_comm_qubits_never_overlap()
+    print('Success.')
@@ -0,0 +1,75 @@
+'''Execution timeline of comm_schedule: one record per EPR generation, local gate, measurement and classical correction.
+Records are kept in columnar array buffers (kind, qubit slot, start, end, block id) and exported to CSV or
+Chrome trace JSON (chrome://tracing, Perfetto).
+'''
+import csv
+import json
+from array import array
+
+TIMELINE_KINDS = ["EP", "1Q", "2Q", "MS", "CB"] # CB: correction gate once the classical bit arrived
+TIMELINE_KIND_CODES = {kind: code for code, kind in enumerate(TIMELINE_KINDS)}
+
+class Timeline:
+    def __init__(self):
+        self.kind = array("b")
+        self.qubit = array("l")
+        self.start = array("d")
+        self.end = array("d")
+        self.block = array("l")
+        self.num_q = 0
+        self.node_of = []
+        self.cq_ranges = []
+
+    def reset(self, node_of, cq_ranges):
+        # called by the scheduler with the slot layout: data qubits first, then the comm qubits of each node
+        self.__init__()
+        self.num_q = len(node_of)
+        self.node_of = list(node_of)
+        self.cq_ranges = list(cq_ranges)
+
+    def add(self, kind, qubit, start, end, block):
+        self.kind.append(TIMELINE_KIND_CODES[kind])
+        self.qubit.append(qubit)
+        self.start.append(start)
+        self.end.append(end)
+        self.block.append(block)
+
+    def __len__(self):
+        return len(self.kind)
+
+    def __iter__(self):
+        for kind, qubit, start, end, block in zip(self.kind, self.qubit, self.start, self.end, self.block):
+            yield TIMELINE_KINDS[kind], self.qubit_label(qubit), start, end, block
+
+    def qubit_node(self, qubit):
+        if qubit < self.num_q:
+            return self.node_of[qubit]
+        for node, cq_range in enumerate(self.cq_ranges):
+            if qubit in cq_range:
+                return node
+        raise IndexError(f"qubit slot {qubit} out of range")
+
+    def qubit_label(self, qubit):
+        # same names as the old qb_slot keys: dq{qubit} and cq{node}-{j}
+        if qubit < self.num_q:
+            return f"dq{qubit}"
+        node = self.qubit_node(qubit)
+        return f"cq{node}-{qubit - self.cq_ranges[node].start}"
+
+    def to_csv(self, path):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["kind", "qubit", "start", "end", "block"])
+            writer.writerows(self)
+
+    def to_chrome_trace(self, path, time_scale=1):
+        # one process per node, one thread per qubit; time_scale converts schedule time units to microseconds
+        events = []
+        for qubit in sorted(set(self.qubit)):
+            events.append({"name": "thread_name", "ph": "M", "pid": self.qubit_node(qubit), "tid": qubit, \
+                           "args": {"name": self.qubit_label(qubit)}})
+        for kind, qubit, start, end, block in zip(self.kind, self.qubit, self.start, self.end, self.block):
+            events.append({"name": TIMELINE_KINDS[kind], "ph": "X", "pid": self.qubit_node(qubit), "tid": qubit, \
+                           "ts": start*time_scale, "dur": (end-start)*time_scale, "args": {"block": block}})
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events}, f)
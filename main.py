@@ -5,7 +5,7 @@ import cirq.contrib.qasm_import
 from cirq.circuits import InsertStrategy
 
 from data_structures import Block, Pair, PairAggregationSet
-from qubit_partition import pymetis_partition
+from qubit_partition import pymetis_partition, OEE, hierarchical_partition
 from utils.util import dict_append, dict_num_add
 
 DEFAULT_QUBITS_PER_NODE = 2
@@ -298,12 +298,21 @@ def schedule(in_circ, tp_pair_blocks, cat_pair_blocks):
     # TODO return list[list[Block] U Comm]
     return out_circ, (concurrent_tps, concurrent_cats)
 
-def map_to_nodes(num_nodes, circ):
+# partition_func: pymetis_partition or OEE (exact node capacities)
+# topology: optional utils.topology.Topology, nodes are then filled rack by rack (hierarchical_partition) and
+# partition_func is not used; num_nodes must be the topology's node count, or 0 to take it from the topology.
+def map_to_nodes(num_nodes, circ, partition_func=pymetis_partition, topology=None):
+    if topology is not None:
+        if num_nodes not in (0, topology.num_nodes):
+            raise ValueError(f"topology has {topology.num_nodes} nodes, asked for {num_nodes}")
+        qubit_to_node, _ = hierarchical_partition(circ, topology)
+        return qubit_to_node
+
     num_qubits = len(circ.all_qubits())
     if num_nodes == 0:
         num_nodes = min(DEFAULT_QUBITS_PER_NODE * num_qubits, num_qubits)
 
-    qubit_to_node, _ = pymetis_partition(circ, num_nodes)
+    qubit_to_node, _ = partition_func(circ, num_nodes)
     return qubit_to_node
 
 
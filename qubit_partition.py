@@ -1,59 +1,373 @@
+import contextlib
+import heapq
+import io
+from multiprocessing import Pool, cpu_count
 import numpy as np
 import pymetis
-import cirq
+try:
+    import cirq
+except ImportError: # only needed for cirq circuits, gate lists partition without it
+    cirq = None
 
-from utils.util import dict_append, dict_num_add
+from autocomm_v1.gate_array import GateArray, gate_qubit_columns
 
 
+# Weighted interaction graph in CSR form from the two qubit gate columns q0, q1 (q1 < 0 for single qubit gates).
+# Each qubit pair becomes one edge in both directions, weighted by the number of gates on it.
+# RETURNS: xadj, adjncy, eweights (neighbours of qubit i are adjncy[xadj[i]:xadj[i+1]], sorted)
+def interaction_csr(q0, q1, num_qubits):
+    q0 = np.asarray(q0, dtype=np.int64)
+    q1 = np.asarray(q1, dtype=np.int64)
+    two_q = (q1 >= 0) & (q0 != q1)
+    lo = np.minimum(q0[two_q], q1[two_q])
+    hi = np.maximum(q0[two_q], q1[two_q])
+    pair_keys, pair_cnt = np.unique(lo * num_qubits + hi, return_counts=True)
+    lo, hi = np.divmod(pair_keys, num_qubits)
+    src = np.concatenate([lo, hi])
+    dst = np.concatenate([hi, lo])
+    order = np.lexsort((dst, src))
+    xadj = np.zeros(num_qubits+1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=num_qubits), out=xadj[1:])
+    adjncy = dst[order]
+    eweights = np.concatenate([pair_cnt, pair_cnt])[order]
+    return xadj, adjncy, eweights
 
-def pymetis_partition(circ: cirq.Circuit, num_nodes: int):
-    qubits_to_idxs = dict({q: idx for idx, q in enumerate(circ.all_qubits)})
-    num_qubits = len(qubits_to_idxs.keys())
+# circ: a cirq circuit, an autocomm_v1 gate list or a GateArray.
+# Cirq qubits are numbered in sorted order, gate list qubits are their own indices (num_qubits defaults to max+1).
+# RETURNS: qubits (vertex i is qubits[i]), xadj, adjncy, eweights
+def interaction_graph(circ, num_qubits=None):
+    if cirq is not None and isinstance(circ, cirq.AbstractCircuit):
+        qubits = sorted(circ.all_qubits())
+        qubits_to_idxs = {q: idx for idx, q in enumerate(qubits)}
+        q0 = []
+        q1 = []
+        for op in circ.all_operations():
+            l = len(op.qubits)
+            if l > 2:
+                raise ValueError(f'Unexpected {l}-qubit gate')
+            if l == 2:
+                q0.append(qubits_to_idxs[op.qubits[0]])
+                q1.append(qubits_to_idxs[op.qubits[1]])
+        num_qubits = len(qubits)
+    else:
+        if isinstance(circ, GateArray):
+            q0, q1 = circ.q0, circ.q1
+        else:
+            q0, q1 = gate_qubit_columns(circ)
+        q0 = np.asarray(q0, dtype=np.int64)
+        q1 = np.asarray(q1, dtype=np.int64)
+        if num_qubits is None:
+            num_qubits = int(max(q0.max(), q1.max())) + 1 if len(q0) else 0
+        qubits = list(range(num_qubits))
+    xadj, adjncy, eweights = interaction_csr(q0, q1, num_qubits)
+    return qubits, xadj, adjncy, eweights
 
-    weight_dict = dict() # KEY: {q1, q2}, VALUE: num interactions
-    adj_dict = dict() # KEY: q, VALUE: [q_1 ... q_n] interacted qubits
 
-    weights = [] # 2m length array, same as adjs
-    adjs = [] # flattened array of adj vertices
-    adj_loc = [] # v_i's adj nodes are between adj_loc[i] and adj_loc[i+1] in adj
+def _partition_dicts(qubits, membership):
+    membership = np.asarray(membership)
+    by_node = np.argsort(membership, kind="stable")
+    node_bounds = np.searchsorted(membership[by_node], np.arange(membership.max() + 2))
+    node_to_qubits = dict()
+    for node in range(len(node_bounds) - 1):
+        node_to_qubits[node] = [qubits[idx] for idx in by_node[node_bounds[node]:node_bounds[node+1]].tolist()]
 
-    for layer in circ:
-        for op in layer:
-            l = len(op.qubits)
-            assert l <= 2, f'Unexpected {l}-qubit gate'
-            if l == 1:
-                continue
+    qubit_to_node = dict(zip(qubits, membership.tolist()))
+    return qubit_to_node, node_to_qubits
 
-            q1_idx, q2_idx = (qubits_to_idxs[q] for q in op.qubits)
-            dict_append(adj_dict, key=q1_idx, append_value=q2_idx)
-            dict_append(adj_dict, key=q2_idx, append_value=q1_idx)
+def pymetis_partition(circ, num_nodes: int, num_qubits=None):
+    qubits, xadj, adjncy, eweights = interaction_graph(circ, num_qubits)
 
-            dict_num_add(weight_dict, key={q1_idx, q2_idx}, add_value=1)
-    
-    for q_idx in range(num_qubits):
-        adj_loc.append(len(adjs))
-        curr_adjs = adj_dict[q_idx]
-        adjs.extend(curr_adjs)
+    ncuts, membership = pymetis.part_graph(num_nodes, xadj=xadj, adjncy=adjncy, eweights=eweights)
+    print(f'Number of cuts from pymetis: {ncuts}.\nMembership: {membership}')
 
-        weights.extend( [weight_dict[{q_idx, adj}] for adj in curr_adjs] )
+    return _partition_dicts(qubits, membership)
 
+# number of two qubit gates between different nodes (the weighted edge cut)
+def remote_gate_count(xadj, adjncy, eweights, membership):
+    membership = np.asarray(membership)
+    src = np.repeat(np.arange(len(xadj) - 1), np.diff(xadj))
+    return int(eweights[membership[src] != membership[adjncy]].sum()) // 2
 
+# Per worker process state of pymetis_search, set once by the pool initializer so tasks only carry their config.
+_search_state = None
+
+def _init_search_worker(num_nodes, xadj, adjncy, eweights, gate_list, refine_iter_cnt):
+    global _search_state
+    for arr in (xadj, adjncy, eweights):
+        arr.flags.writeable = False
+    full_autocomm = None
+    if gate_list is not None:
+        # Imported once per worker and only for score_epr, not at the top: autocomm_v1.autocomm pulls in the whole
+        # compiler, and this module is imported by annotating_circuit, autocomm_v1.dynamic_mapping and main, so the
+        # partitioners stay below the compiler and cannot close an import cycle with it.
+        from autocomm_v1.autocomm import full_autocomm
+    _search_state = (num_nodes, xadj, adjncy, eweights, gate_list, refine_iter_cnt, full_autocomm)
+
+def _search_candidate(config):
+    num_nodes, xadj, adjncy, eweights, gate_list, refine_iter_cnt, full_autocomm = _search_state
+    seed, ufactor, recursive = config
+    options = pymetis.Options(seed=seed, ufactor=ufactor)
+    _, membership = pymetis.part_graph(num_nodes, xadj=xadj, adjncy=adjncy, eweights=eweights, \
+                                       recursive=recursive, options=options)
+    membership = list(membership)
+    score = (remote_gate_count(xadj, adjncy, eweights, membership),)
+    if gate_list is not None: # ranked by epr_cnt, remote gates break ties
+        with contextlib.redirect_stdout(io.StringIO()): # comm_assign prints the gates of its cat-comm checks
+            _, epr_cnt, _ = full_autocomm(gate_list, membership, refine_iter_cnt=refine_iter_cnt)
+        score = (epr_cnt,) + score
+    return score, config, membership
+
+# Runs pymetis for every (seed, ufactor, recursive) combination in a process pool and keeps the best partition.
+# Candidates are scored by remote two qubit gate count, or with score_epr by full_autocomm's epr_cnt
+# (gate lists only: the qubits must be the gate list indices). ufactor is METIS' allowed imbalance in 1/1000,
+# recursive picks recursive bisection over k-way. The graph is handed to each worker once, by the pool initializer.
+# processes=1 runs in this process.
+# RETURNS: qubit_to_node, node_to_qubits, like pymetis_partition
+def pymetis_search(circ, num_nodes: int, num_qubits=None, seeds=range(8), ufactors=(1, 10, 30, 100), recursive=(False, True), \
+                   score_epr=False, refine_iter_cnt=3, processes=None, verbose=False):
+    global _search_state
+    qubits, xadj, adjncy, eweights = interaction_graph(circ, num_qubits)
+    gate_list = None
+    if score_epr:
+        if cirq is not None and isinstance(circ, cirq.AbstractCircuit):
+            raise ValueError("score_epr needs an autocomm_v1 gate list")
+        gate_list = circ
+    configs = [(seed, ufactor, rec) for seed in seeds for ufactor in ufactors for rec in recursive]
+    initargs = (num_nodes, xadj, adjncy, eweights, gate_list, refine_iter_cnt)
+
+    if processes == 1:
+        _init_search_worker(*initargs)
+        try:
+            results = [_search_candidate(config) for config in configs]
+        finally:
+            _search_state = None # do not keep the graph and gate list alive in this process
+    else:
+        with Pool(processes, initializer=_init_search_worker, initargs=initargs) as pool:
+            results = pool.map(_search_candidate, configs, chunksize=max(1, len(configs) // (4 * (processes or cpu_count()))))
+
+    score, config, membership = min(results, key=lambda r: r[0])
+    if verbose:
+        print(f'Best of {len(configs)} pymetis runs: score {score}, (seed, ufactor, recursive) = {config}')
+    return _partition_dicts(qubits, membership)
 
 
-    ncuts, membership = pymetis.part_graph(num_nodes, xadj=adj_loc, adjncy=adjs, eweights=weights)
-    print(f'Number of cuts from pymetis: {ncuts}.\nMembership: {membership}')
 
-    node_to_qubits = dict()
-    max_label = max(membership)
-    for node in range(max_label + 1):
-        q_idxs = np.argwhere(np.array(membership) == node).ravel()
-        node_to_qubits[node] = [circ.all_qubits[idx] for idx in q_idxs]
-        
-    qubit_to_node = dict({circ.all_qubits[idx]: membership[idx] for idx in range(len(membership))})
-    return qubit_to_node, node_to_qubits
 
+# CSR graph induced by vertices (sorted ascending), renumbered 0..len(vertices)-1
+def _subgraph(xadj, adjncy, eweights, vertices):
+    local = np.full(len(xadj) - 1, -1, dtype=np.int64)
+    local[vertices] = np.arange(len(vertices))
+    src = np.repeat(np.arange(len(xadj) - 1), np.diff(xadj))
+    keep = (local[src] >= 0) & (local[adjncy] >= 0)
+    sub_xadj = np.zeros(len(vertices)+1, dtype=np.int64)
+    np.cumsum(np.bincount(local[src[keep]], minlength=len(vertices)), out=sub_xadj[1:])
+    return sub_xadj, local[adjncy[keep]], eweights[keep]
 
+# pymetis into len(shares) parts of the given relative sizes
+def _weighted_parts(xadj, adjncy, eweights, shares):
+    if len(shares) == 1 or len(xadj) == 1:
+        return np.zeros(len(xadj) - 1, dtype=np.int64)
+    tpwgts = [share / sum(shares) for share in shares]
+    _, membership = pymetis.part_graph(len(shares), xadj=xadj, adjncy=adjncy, eweights=eweights, tpwgts=tpwgts)
+    return np.asarray(membership)
 
+# Membership of every qubit with at most node_capacity[k] qubits on node k (a list; nodes may stay empty).
+# pymetis splits the qubits over the fewest nodes that can hold them, largest first, in proportion to their capacities;
+# as METIS balances only approximately, qubits of a node over capacity then move, one at a time, to the node with room
+# that costs the fewest extra remote gates.
+def capacity_membership(xadj, adjncy, eweights, node_capacity):
+    num_q = len(xadj) - 1
+    capacity = np.asarray(node_capacity, dtype=np.int64)
+    if capacity.sum() < num_q:
+        raise ValueError(f"{num_q} qubits do not fit in node capacities {list(node_capacity)}")
+    if num_q == 0:
+        return np.zeros(0, dtype=np.int64)
+    by_size = np.argsort(-capacity, kind="stable")
+    used = np.sort(by_size[:np.searchsorted(np.cumsum(capacity[by_size]), num_q) + 1])
+    membership = used[_weighted_parts(xadj, adjncy, eweights, capacity[used].tolist())]
+    counts = np.bincount(membership, minlength=len(capacity))
+    if (counts <= capacity).all():
+        return membership
+    src = np.repeat(np.arange(num_q), np.diff(xadj))
+    conn = np.zeros((num_q, len(capacity))) # conn[v][k]: gates between v and node k
+    np.add.at(conn, (src, membership[adjncy]), eweights)
+    for node in np.flatnonzero(counts > capacity).tolist():
+        while counts[node] > capacity[node]:
+            room = np.flatnonzero(counts < capacity)
+            members = np.flatnonzero(membership == node)
+            gain = conn[np.ix_(members, room)] - conn[members, node][:, None]
+            best_member, best_room = np.unravel_index(np.argmax(gain), gain.shape)
+            v, target = members[best_member], room[best_room]
+            membership[v] = target
+            counts[node] -= 1
+            counts[target] += 1
+            neighbours, weights = adjncy[xadj[v]:xadj[v+1]], eweights[xadj[v]:xadj[v+1]]
+            np.add.at(conn, (neighbours, node), -weights)
+            np.add.at(conn, (neighbours, target), weights)
+    return membership
 
-def OEE():
-    pass
\ No newline at end of file
+# two qubit gates weighted by the EPR cost of the node pair they cross (0 inside a node)
+def topology_cost(xadj, adjncy, eweights, membership, topology):
+    membership = np.asarray(membership)
+    src = np.repeat(np.arange(len(xadj) - 1), np.diff(xadj))
+    return float((eweights * topology.pair_cost[membership[src], membership[adjncy]]).sum()) / 2
+
+# Two level partition over a utils.topology.Topology: qubits are first split over the racks, so the expensive
+# cross-rack gates are cut first, then each rack's qubits are split over its nodes, both with capacity_membership.
+# As min-cuts ignore what a cut gate costs, the flat capacity_membership over all nodes is kept instead if its
+# topology_cost is lower.
+# node_capacity: int, or list indexed by node, of qubits a node holds (default even split); a rack holds the sum.
+# RETURNS: qubit_to_node, node_to_qubits, like pymetis_partition
+def hierarchical_partition(circ, topology, num_qubits=None, node_capacity=None):
+    qubits, xadj, adjncy, eweights = interaction_graph(circ, num_qubits)
+    node_capacity = _node_capacities(len(qubits), topology.num_nodes, node_capacity)
+    rack_capacity = [sum(node_capacity[node] for node in rack_nodes) for rack_nodes in topology.rack_nodes]
+    rack_membership = capacity_membership(xadj, adjncy, eweights, rack_capacity)
+    membership = np.empty(len(qubits), dtype=np.int64)
+    for rack, rack_nodes in enumerate(topology.rack_nodes):
+        vertices = np.flatnonzero(rack_membership == rack)
+        if len(vertices) == 0:
+            continue
+        sub_xadj, sub_adjncy, sub_eweights = _subgraph(xadj, adjncy, eweights, vertices)
+        parts = capacity_membership(sub_xadj, sub_adjncy, sub_eweights, node_capacity[rack_nodes.start:rack_nodes.stop])
+        membership[vertices] = rack_nodes.start + parts
+    flat_membership = capacity_membership(xadj, adjncy, eweights, node_capacity)
+    if topology_cost(xadj, adjncy, eweights, flat_membership, topology) < topology_cost(xadj, adjncy, eweights, membership, topology):
+        membership = flat_membership
+    return _partition_dicts(qubits, membership)
+
+def _node_capacities(num_qubits, num_nodes, node_capacity):
+    if node_capacity is None: # as even as possible
+        return [num_qubits // num_nodes + (1 if node < num_qubits % num_nodes else 0) for node in range(num_nodes)]
+    if type(node_capacity) is int:
+        node_capacity = [node_capacity] * num_nodes
+    node_capacity = list(node_capacity)
+    if len(node_capacity) != num_nodes or sum(node_capacity) < num_qubits:
+        raise ValueError(f"node capacities {node_capacity} cannot hold {num_qubits} qubits on {num_nodes} nodes")
+    return node_capacity
+
+# Overall Extreme Exchange: starting from a partition that fills every node up to its capacity, each round swaps
+# the pair of unlocked qubits (a in A, b in B) with the largest gain D[a][B] + D[b][A] - 2w(a,b), locks both and
+# repeats until no pair is left, then keeps the best prefix of the swaps. D[v][k] = W[v][k] - W[v][node of v],
+# W[v][k] being the weight from v to node k. Free slots of a node are dummy vertices without edges,
+# so swapping with one moves a qubit and node sizes never exceed node_capacity (int or list, default even split).
+# W is updated incrementally per swap; each (A, B) keeps a lazy max-heap of D[v][B] over the unlocked v in A.
+# patience: optionally end a round after that many swaps in a row without a better prefix (faster, usually a worse cut).
+# initial: optional starting node of each qubit (vertex order of interaction_graph), else nodes are filled in order.
+# RETURNS: qubit_to_node, node_to_qubits, like pymetis_partition
+def OEE(circ, num_nodes: int, node_capacity=None, num_qubits=None, initial=None, max_rounds=20, patience=None):
+    qubits, xadj, adjncy, eweights = interaction_graph(circ, num_qubits)
+    num_q = len(qubits)
+    node_capacity = _node_capacities(num_q, num_nodes, node_capacity)
+    num_v = sum(node_capacity) # qubits, then dummies
+
+    if initial is None:
+        part = [node for node, cap in enumerate(node_capacity) for _ in range(cap)]
+    else:
+        part = list(initial)
+        free = [cap - part.count(node) for node, cap in enumerate(node_capacity)]
+        if len(part) != num_q or min(free) < 0:
+            raise ValueError(f"initial partition does not fit node capacities {node_capacity}")
+        part.extend(node for node in range(num_nodes) for _ in range(free[node]))
+
+    W = np.zeros((num_v, num_nodes), dtype=np.int64)
+    src = np.repeat(np.arange(num_q), np.diff(xadj))
+    np.add.at(W, (src, np.asarray(part[:num_q])[adjncy]), eweights)
+    W = W.tolist()
+    adj = [list(zip(adjncy[xadj[v]:xadj[v+1]].tolist(), eweights[xadj[v]:xadj[v+1]].tolist())) for v in range(num_q)]
+    adj.extend([] for _ in range(num_v - num_q))
+    adj_w = [dict(nbrs) for nbrs in adj]
+
+    for _ in range(max_rounds):
+        locked = [False] * num_v
+        version = [[0] * num_nodes for _ in range(num_v)]
+        heaps = [[[] for _ in range(num_nodes)] for _ in range(num_nodes)]
+        for v in range(num_v):
+            own = W[v][part[v]]
+            for k in range(num_nodes):
+                if k != part[v]:
+                    heaps[part[v]][k].append((own - W[v][k], v, 0))
+        for row in heaps:
+            for h in row:
+                heapq.heapify(h)
+
+        def top(A, B, skip=-1):
+            # best unlocked v in A for node B (other than skip), dropping stale entries on the way
+            h = heaps[A][B]
+            while h and (locked[h[0][1]] or h[0][2] != version[h[0][1]][B]):
+                heapq.heappop(h)
+            if not h or h[0][1] != skip:
+                return h[0] if h else None
+            first = heapq.heappop(h)
+            second = top(A, B)
+            heapq.heappush(h, first)
+            return second
+
+        def move(v, A, B, track):
+            # v leaves A for B: update W of its neighbours and, within a round, their heap entries
+            part[v] = B
+            for u, w in adj[v]:
+                Wu = W[u]
+                Wu[A] -= w
+                Wu[B] += w
+                if not track or locked[u]:
+                    continue
+                pu = part[u]
+                changed = range(num_nodes) if pu == A or pu == B else (A, B)
+                own = Wu[pu]
+                for k in changed:
+                    if k != pu:
+                        version[u][k] += 1
+                        heapq.heappush(heaps[pu][k], (own - Wu[k], u, version[u][k]))
+
+        swaps = []
+        gain_sum = 0
+        best_sum = 0
+        best_len = 0
+        while patience is None or len(swaps) - best_len < patience:
+            best = None
+            for A in range(num_nodes):
+                for B in range(A+1, num_nodes):
+                    ea = top(A, B)
+                    eb = top(B, A)
+                    if ea is None or eb is None:
+                        continue
+                    if best is not None and -ea[0] - eb[0] <= best[0]:
+                        continue # the -2w(a,b) term only lowers the gain
+                    cands = [(ea, eb)]
+                    if ea[1] in adj_w[eb[1]]: # adjacent tops, the runners-up may do better
+                        ea2 = top(A, B, skip=ea[1])
+                        eb2 = top(B, A, skip=eb[1])
+                        if ea2 is not None:
+                            cands.append((ea2, eb))
+                        if eb2 is not None:
+                            cands.append((ea, eb2))
+                    for xa, xb in cands:
+                        a, b = xa[1], xb[1]
+                        gain = -xa[0] - xb[0] - 2 * adj_w[a].get(b, 0)
+                        if best is None or gain > best[0]:
+                            best = (gain, a, b, A, B)
+            if best is None:
+                break
+            gain, a, b, A, B = best
+            locked[a] = locked[b] = True
+            move(a, A, B, True)
+            move(b, B, A, True)
+            swaps.append((a, b, A, B))
+            gain_sum += gain
+            if gain_sum > best_sum:
+                best_sum = gain_sum
+                best_len = len(swaps)
+
+        for a, b, A, B in reversed(swaps[best_len:]):
+            move(b, A, B, False)
+            move(a, B, A, False)
+        if best_sum <= 0:
+            break
+
+    membership = part[:num_q]
+    node_to_qubits = {node: [] for node in range(num_nodes)}
+    for idx, node in enumerate(membership):
+        node_to_qubits[node].append(qubits[idx])
+    qubit_to_node = dict(zip(qubits, membership))
+    return qubit_to_node, node_to_qubits
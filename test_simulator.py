@@ -0,0 +1,57 @@
+'''Parity check of the two annotated simulator backends: simpy and heap must give the same makespan and the same
+event stream (ColumnarSink rows) on random workloads and on compiled benchmark circuits, for both qubit allocations.
+Run with python test_simulator.py (or pytest).
+'''
+import contextlib
+import copy
+import io
+import random
+from annotating_circuit import simulate, get_circuit_input, ALLOCATION_MODES
+from autocomm_v1.experiment import CircuitGen
+from utils.event_sink import ColumnarSink
+
+def random_workload(rng):
+    qpu_qubit_counts = {f"Q{i}": {'computing': rng.randint(2, 8), 'communication': rng.randint(1, 3)} \
+                        for i in range(rng.randint(1, 4))}
+    total = sum(counts['computing'] for counts in qpu_qubit_counts.values())
+    quantum_circuits = []
+    for _ in range(rng.randint(1, 4)):
+        num_q = rng.randint(2, total)
+        quantum_circuits.append([{'type': rng.choice(["H", "CX", "CZ"]), 'qubits': rng.sample(range(num_q), rng.choice([1, 2, 2]))} \
+                                 for _ in range(rng.randint(1, 30))])
+    return quantum_circuits, qpu_qubit_counts
+
+def benchmark_workload(name, num_q=40, num_nodes=4):
+    gate_list, qubit_node_mapping = getattr(CircuitGen, name)(num_q, num_q // num_nodes)
+    with contextlib.redirect_stdout(io.StringIO()):
+        circuit = get_circuit_input(gate_list, qubit_node_mapping)
+    qpu_qubit_counts = {node: {'computing': num_q // num_nodes + 2, 'communication': 2} for node in range(num_nodes)}
+    return [circuit, circuit[:len(circuit) // 2]], qpu_qubit_counts
+
+def check_parity(quantum_circuits, qpu_qubit_counts, label):
+    for allocation in ALLOCATION_MODES:
+        results = []
+        for backend in ["simpy", "heap"]:
+            sink = ColumnarSink()
+            # the scheduler takes circuits off the list it is given
+            makespan = simulate(copy.deepcopy(quantum_circuits), qpu_qubit_counts, backend=backend, sink=sink, allocation=allocation)
+            results.append((makespan, sink.rows()))
+        (simpy_makespan, simpy_rows), (heap_makespan, heap_rows) = results
+        assert simpy_makespan == heap_makespan, f'{label}, {allocation}: makespan {simpy_makespan} (simpy) != {heap_makespan} (heap)'
+        assert simpy_rows == heap_rows, f'{label}, {allocation}: event streams differ'
+
+def test_random_workloads():
+    for seed in range(150):
+        quantum_circuits, qpu_qubit_counts = random_workload(random.Random(seed))
+        check_parity(quantum_circuits, qpu_qubit_counts, f'seed {seed}')
+
+def test_benchmark_workloads():
+    random.seed(0)
+    for name in ["QFT", "RCA", "BV", "QAOA"]:
+        quantum_circuits, qpu_qubit_counts = benchmark_workload(name)
+        check_parity(quantum_circuits, qpu_qubit_counts, name)
+
+if __name__ == '__main__':
+    test_random_workloads()
+    test_benchmark_workloads()
+    print('Success.')
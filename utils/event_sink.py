@@ -0,0 +1,128 @@
+'''Event sinks for the annotated simulator. Every record is (time, event, qpu, circuit, qubits, gate); callers check
+sink.enabled before building one, so the default NullSink costs a single attribute lookup per event.
+RingBufferSink keeps the last `capacity` records, ColumnarSink keeps everything as one list per column.
+Recorded events can be written out as CSV, Parquet (needs pyarrow) or Chrome trace JSON (chrome://tracing, Perfetto):
+"<kind>_start" / "<kind>_end" pairs on the same qpu, circuit and qubits become spans, other events instants.
+'''
+import csv
+import json
+from collections import deque
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError: # only needed for to_parquet
+    pyarrow = None
+
+COLUMNS = ("time", "event", "qpu", "circuit", "qubits", "gate")
+
+class EventSink:
+    enabled = True
+
+    def record(self, time, event, qpu=None, circuit=None, qubits=(), gate=None):
+        raise NotImplementedError
+
+    def rows(self):
+        # records in arrival order, as tuples in COLUMNS order
+        raise NotImplementedError
+
+    def columns(self):
+        rows = self.rows()
+        return {name: [row[i] for row in rows] for i, name in enumerate(COLUMNS)}
+
+    def __len__(self):
+        return len(self.rows())
+
+    def to_csv(self, path):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS)
+            for time, event, qpu, circuit, qubits, gate in self.rows():
+                writer.writerow((time, event, qpu, circuit, " ".join(map(str, qubits)), gate))
+
+    def to_parquet(self, path):
+        if pyarrow is None:
+            raise ImportError("to_parquet needs pyarrow, use to_csv or install pyarrow")
+        columns = self.columns()
+        table = pyarrow.table({
+            "time": pyarrow.array(columns["time"], type=pyarrow.float64()),
+            "event": pyarrow.array(columns["event"], type=pyarrow.string()),
+            "qpu": pyarrow.array([None if qpu is None else str(qpu) for qpu in columns["qpu"]], type=pyarrow.string()),
+            "circuit": pyarrow.array(columns["circuit"], type=pyarrow.int64()),
+            "qubits": pyarrow.array([list(qubits) for qubits in columns["qubits"]], type=pyarrow.list_(pyarrow.int64())),
+            "gate": pyarrow.array(columns["gate"], type=pyarrow.string()),
+        })
+        pyarrow.parquet.write_table(table, path)
+
+    def chrome_trace(self):
+        # trace events: one process per QPU (pid 0 for scheduler events), one thread per circuit, time units as us
+        pids = {None: 0}
+        trace = [{"name": "process_name", "ph": "M", "pid": 0, "args": {"name": "scheduler"}}]
+        open_spans = {}
+        for time, event, qpu, circuit, qubits, gate in self.rows():
+            if qpu not in pids:
+                pids[qpu] = len(pids)
+                trace.append({"name": "process_name", "ph": "M", "pid": pids[qpu], "args": {"name": f"QPU {qpu}"}})
+            entry = {"name": gate or event, "cat": event, "ts": time, "pid": pids[qpu],
+                     "tid": -1 if circuit is None else circuit, "args": {"qubits": list(qubits)}}
+            kind, _, phase = event.rpartition("_")
+            key = (kind, qpu, circuit, tuple(qubits))
+            if phase == "start":
+                entry.update(name=gate or kind, ph="X", cat=kind)
+                open_spans.setdefault(key, deque()).append(entry)
+            elif phase == "end" and open_spans.get(key):
+                span = open_spans[key].popleft()
+                span["dur"] = time - span["ts"]
+                continue
+            else:
+                entry.update(ph="i", s="t")
+            trace.append(entry)
+        for spans in open_spans.values(): # started but never ended
+            for span in spans:
+                span["dur"] = 0
+        return trace
+
+    def to_chrome_trace(self, path):
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.chrome_trace()}, f)
+
+class NullSink(EventSink):
+    enabled = False
+
+    def record(self, time, event, qpu=None, circuit=None, qubits=(), gate=None):
+        pass
+
+    def rows(self):
+        return []
+
+class RingBufferSink(EventSink):
+    def __init__(self, capacity=100000):
+        self.buffer = deque(maxlen=capacity)
+
+    def record(self, time, event, qpu=None, circuit=None, qubits=(), gate=None):
+        self.buffer.append((time, event, qpu, circuit, tuple(qubits), gate))
+
+    def rows(self):
+        return list(self.buffer)
+
+class ColumnarSink(EventSink):
+    def __init__(self):
+        self.data = {name: [] for name in COLUMNS}
+        self._append = [self.data[name].append for name in COLUMNS]
+
+    def record(self, time, event, qpu=None, circuit=None, qubits=(), gate=None):
+        time_, event_, qpu_, circuit_, qubits_, gate_ = self._append
+        time_(time)
+        event_(event)
+        qpu_(qpu)
+        circuit_(circuit)
+        qubits_(tuple(qubits))
+        gate_(gate)
+
+    def rows(self):
+        return list(zip(*(self.data[name] for name in COLUMNS)))
+
+    def columns(self):
+        return {name: list(values) for name, values in self.data.items()}
+
+    def __len__(self):
+        return len(self.data["time"])
@@ -0,0 +1,107 @@
+'''Immutable qubit -> node mapping shared by the compile passes.
+Holds the qubit -> node array and the CSR node -> qubits lists (node_ptr, node_qubits), so node counts and the
+position of a qubit within its node are O(1) lookups. Indexing and len() behave like the list mappings used so far.
+'''
+import numpy as np
+
+def _read_only(arr):
+    arr.flags.writeable = False
+    return arr
+
+class QubitNodeMap:
+    def __init__(self, qubit_node):
+        node_of = np.array(qubit_node, dtype=np.int64)
+        if node_of.ndim != 1:
+            raise ValueError(f"expected one node per qubit, got shape {node_of.shape}")
+        if len(node_of) and node_of.min() < 0:
+            raise ValueError("node indices must be non-negative")
+        num_q = len(node_of)
+        num_nodes = int(node_of.max()) + 1 if num_q else 0
+        node_counts = np.bincount(node_of, minlength=num_nodes)
+        node_ptr = np.zeros(num_nodes+1, dtype=np.int64)
+        np.cumsum(node_counts, out=node_ptr[1:])
+        node_qubits = np.argsort(node_of, kind="stable") # qubits of each node in index order
+        position = np.empty(num_q, dtype=np.int64)
+        position[node_qubits] = np.arange(num_q) - node_ptr[node_of[node_qubits]]
+        self._node_of = _read_only(node_of)
+        self._node_list = node_of.tolist() # plain ints for per-qubit python loops
+        self._node_counts = _read_only(node_counts)
+        self._node_ptr = _read_only(node_ptr)
+        self._node_qubits = _read_only(node_qubits)
+        self._position = _read_only(position)
+
+    @classmethod
+    def from_mapping(cls, qubit_node_mapping):
+        # a QubitNodeMap, a list/array of nodes, or a dict {qubit: node} over qubits 0..n-1
+        if isinstance(qubit_node_mapping, QubitNodeMap):
+            return qubit_node_mapping
+        if isinstance(qubit_node_mapping, dict):
+            if sorted(qubit_node_mapping) != list(range(len(qubit_node_mapping))):
+                raise ValueError("dict mappings must cover qubits 0..n-1")
+            return cls([qubit_node_mapping[q] for q in range(len(qubit_node_mapping))])
+        return cls(qubit_node_mapping)
+
+    @property
+    def node_of(self):
+        return self._node_of
+
+    @property
+    def node_list(self):
+        return self._node_list
+
+    @property
+    def num_qubits(self):
+        return len(self._node_list)
+
+    @property
+    def num_nodes(self):
+        return len(self._node_counts)
+
+    @property
+    def node_counts(self):
+        return self._node_counts
+
+    @property
+    def node_ptr(self):
+        return self._node_ptr
+
+    @property
+    def node_qubits(self):
+        return self._node_qubits
+
+    @property
+    def position(self):
+        return self._position
+
+    def __len__(self):
+        return len(self._node_list)
+
+    def __getitem__(self, qubit):
+        return self._node_list[qubit]
+
+    def __iter__(self):
+        return iter(self._node_list)
+
+    def __eq__(self, other):
+        if not isinstance(other, QubitNodeMap):
+            return NotImplemented
+        return np.array_equal(self._node_of, other._node_of)
+
+    def __repr__(self):
+        return f"QubitNodeMap({self._node_list})"
+
+    def items(self):
+        # (qubit, node) pairs, as for dict mappings
+        return enumerate(self._node_list)
+
+    def qubits_of(self, node):
+        return self._node_qubits[self._node_ptr[node]:self._node_ptr[node+1]]
+
+    def position_of(self, qubit):
+        return int(self._position[qubit])
+
+    def to_list(self):
+        return list(self._node_list)
+
+    def to_dict(self):
+        return dict(enumerate(self._node_list))
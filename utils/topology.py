@@ -0,0 +1,37 @@
+'''Two level network of QPU nodes: nodes are grouped into racks and an EPR pair across racks costs more.
+Nodes are numbered rack by rack. level_cost[0] scales EPR generation between nodes of the same rack,
+level_cost[1] between nodes of different racks.
+'''
+import numpy as np
+
+class Topology:
+    def __init__(self, rack_sizes, level_cost=(1, 4)):
+        if len(rack_sizes) == 0 or min(rack_sizes) < 1:
+            raise ValueError(f"every rack needs at least one node, got rack sizes {rack_sizes}")
+        if len(level_cost) != 2:
+            raise ValueError(f"expected (same rack, cross rack) costs, got {level_cost}")
+        self.rack_sizes = list(rack_sizes)
+        self.level_cost = tuple(level_cost)
+        self.rack_of = [rack for rack, size in enumerate(self.rack_sizes) for _ in range(size)]
+        rack_start = np.concatenate([[0], np.cumsum(self.rack_sizes)]).tolist()
+        self.rack_nodes = [range(rack_start[rack], rack_start[rack+1]) for rack in range(len(self.rack_sizes))]
+        rack_of = np.array(self.rack_of)
+        self.pair_cost = np.where(rack_of[:, None] == rack_of[None, :], level_cost[0], level_cost[1]).astype(float)
+        np.fill_diagonal(self.pair_cost, 0)
+        self.pair_cost.flags.writeable = False
+
+    @property
+    def num_nodes(self):
+        return len(self.rack_of)
+
+    @property
+    def num_racks(self):
+        return len(self.rack_sizes)
+
+    def level(self, node0, node1):
+        # 0: same rack, 1: across racks
+        return int(self.rack_of[node0] != self.rack_of[node1])
+
+    def ep_latency(self, node0, node1, lat_ep):
+        # EPR generation time on the link, lat_ep being the base (same rack, cost 1) latency
+        return lat_ep * self.level_cost[self.level(node0, node1)]